@@ -27,6 +27,9 @@ def sigterm_handler_wrap(_signo):
 
 def start_channel(channel_name: str):
     channel = channel_factory.create_channel(channel_name)
+    if conf().get("metrics_port"):
+        from common import metrics_server
+        metrics_server.start(conf().get("metrics_port"), conf().get("metrics_host", "127.0.0.1"))
     if channel_name in ["wx", "wxy", "terminal", "wechatmp", "wechatmp_service", "wechatcom_app", "wework",
                         const.FEISHU, const.DINGTALK]:
         PluginManager().load_plugins()
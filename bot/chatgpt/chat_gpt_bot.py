@@ -11,7 +11,7 @@ from bot.chatgpt.chat_gpt_session import ChatGPTSession
 from bot.openai.open_ai_image import OpenAIImage
 from bot.session_manager import SessionManager
 from bridge.context import ContextType
-from bridge.reply import Reply, ReplyType
+from bridge.reply import Reply, ReplyStream, ReplyType
 from common.log import logger
 from common.token_bucket import TokenBucket
 from config import conf, load_config
@@ -71,9 +71,10 @@ class ChatGPTBot(Bot, OpenAIImage):
             if model:
                 new_args = self.args.copy()
                 new_args["model"] = model
-            # if context.get('stream'):
-            #     # reply in stream
-            #     return self.reply_text_stream(query, new_query, session_id)
+            if context.get("stream"):
+                # reply in stream
+                chunks = self.reply_text_stream(session, api_key, args=new_args)
+                return Reply(ReplyType.STREAM, ReplyStream(chunks, on_complete=lambda text: self._on_stream_complete(text, session_id)))
 
             reply_content = self.reply_text(session, api_key, args=new_args)
             logger.debug(
@@ -163,6 +164,38 @@ class ChatGPTBot(Bot, OpenAIImage):
                 return result
 
 
+    def reply_text_stream(self, session: ChatGPTSession, api_key=None, args=None):
+        """
+        call openai's ChatCompletion in stream mode, yield content chunks
+        :param session: a conversation session
+        :return: generator of str
+        """
+        received = False
+        try:
+            if conf().get("rate_limit_chatgpt") and not self.tb4chatgpt.get_token():
+                raise openai.error.RateLimitError("RateLimitError: rate limit exceeded")
+            if args is None:
+                args = self.args
+            response = openai.ChatCompletion.create(api_key=api_key, messages=session.messages, stream=True, **args)
+            for chunk in response:
+                if not chunk.get("choices"):
+                    continue
+                content = chunk["choices"][0].get("delta", {}).get("content")
+                if content:
+                    received = True
+                    yield content
+        except Exception as e:
+            logger.exception("[CHATGPT] stream Exception: {}".format(e))
+            if not received:  # 没有收到任何内容，交给channel回复错误信息
+                self.sessions.clear_session(session.session_id)
+                raise e
+
+    def _on_stream_complete(self, text, session_id):
+        logger.debug("[CHATGPT] stream reply complete, session_id={}, reply_cont={}".format(session_id, text))
+        if text:
+            self.sessions.session_reply(text, session_id)
+
+
 class AzureChatGPTBot(ChatGPTBot):
     def __init__(self):
         super().__init__()
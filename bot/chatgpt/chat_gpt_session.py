@@ -16,8 +16,26 @@ class ChatGPTSession(Session):
     def __init__(self, session_id, system_prompt=None, model="gpt-3.5-turbo"):
         super().__init__(session_id, system_prompt)
         self.model = model
+        self.message_tokens = {}  # id(消息) -> (消息, 计算时的content, token数)，每条消息的token数只计算一次
         self.reset()
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.message_tokens = {}  # 缓存按对象id索引，反序列化后失效
+
+    def _sync_tokens(self):
+        # messages可能被外部直接修改(增删、替换消息或改写内容)，按消息对象和内容校验缓存，只重新计算变化的消息
+        cache = {}
+        total = 0
+        for message in self.messages:
+            entry = self.message_tokens.get(id(message))
+            if entry is None or entry[0] is not message or entry[1] is not message.get("content"):
+                entry = (message, message.get("content"), num_tokens_from_message(message, self.model))
+            cache[id(message)] = entry
+            total += entry[2]
+        self.message_tokens = cache
+        return total
+
     def discard_exceeding(self, max_tokens, cur_tokens=None):
         precise = True
         try:
@@ -50,50 +68,79 @@ class ChatGPTSession(Session):
         return cur_tokens
 
     def calc_tokens(self):
-        return num_tokens_from_messages(self.messages, self.model)
+        return self._sync_tokens() + num_tokens_for_reply_priming(self.model)
 
 
-# refer to https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
-def num_tokens_from_messages(messages, model):
-    """Returns the number of tokens used by a list of messages."""
-
-    if model in ["wenxin", "xunfei", const.GEMINI]:
-        return num_tokens_by_character(messages)
+# 模型名 -> 计算token时采用的规则(gpt-3.5-turbo, gpt-4)，None表示按字符数计算
+_token_models = {}
+# 模型名 -> tiktoken Encoding
+_encodings = {}
 
-    import tiktoken
 
-    if model in ["gpt-3.5-turbo-0301", "gpt-35-turbo", "gpt-3.5-turbo-1106", "moonshot", const.LINKAI_35]:
-        return num_tokens_from_messages(messages, model="gpt-3.5-turbo")
+def _token_model(model):
+    if model in _token_models:
+        return _token_models[model]
+    if model in ["wenxin", "xunfei", const.GEMINI]:
+        token_model = None
     elif model in ["gpt-4-0314", "gpt-4-0613", "gpt-4-32k", "gpt-4-32k-0613", "gpt-3.5-turbo-0613",
                    "gpt-3.5-turbo-16k", "gpt-3.5-turbo-16k-0613", "gpt-35-turbo-16k", "gpt-4-turbo-preview",
                    "gpt-4-1106-preview", const.GPT4_TURBO_PREVIEW, const.GPT4_VISION_PREVIEW, const.GPT4_TURBO_01_25,
-                   const.GPT_4o, const.LINKAI_4o, const.LINKAI_4_TURBO]:
-        return num_tokens_from_messages(messages, model="gpt-4")
-    elif model.startswith("claude-3"):
-        return num_tokens_from_messages(messages, model="gpt-3.5-turbo")
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        logger.debug("Warning: model not found. Using cl100k_base encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
-    if model == "gpt-3.5-turbo":
+                   const.GPT_4o, const.LINKAI_4o, const.LINKAI_4_TURBO, "gpt-4"]:
+        token_model = "gpt-4"
+    else:
+        if model not in ["gpt-3.5-turbo", "gpt-3.5-turbo-0301", "gpt-35-turbo", "gpt-3.5-turbo-1106", "moonshot", const.LINKAI_35] and not model.startswith("claude-3"):
+            logger.warn(f"num_tokens_from_messages() is not implemented for model {model}. Returning num tokens assuming gpt-3.5-turbo.")
+        token_model = "gpt-3.5-turbo"
+    _token_models[model] = token_model
+    return token_model
+
+
+def _get_encoding(model):
+    """每个模型只解析一次Encoding"""
+    if model not in _encodings:
+        import tiktoken
+
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            logger.debug("Warning: model not found. Using cl100k_base encoding.")
+            _encodings[model] = tiktoken.get_encoding("cl100k_base")
+    return _encodings[model]
+
+
+def num_tokens_from_message(message, model):
+    """Returns the number of tokens used by a single message."""
+    token_model = _token_model(model)
+    if token_model is None:
+        return num_tokens_by_character([message])
+    encoding = _get_encoding(token_model)
+    if token_model == "gpt-3.5-turbo":
         tokens_per_message = 4  # every message follows <|start|>{role/name}\n{content}<|end|>\n
         tokens_per_name = -1  # if there's a name, the role is omitted
-    elif model == "gpt-4":
+    else:
         tokens_per_message = 3
         tokens_per_name = 1
-    else:
-        logger.warn(f"num_tokens_from_messages() is not implemented for model {model}. Returning num tokens assuming gpt-3.5-turbo.")
-        return num_tokens_from_messages(messages, model="gpt-3.5-turbo")
+    num_tokens = tokens_per_message
+    for key, value in message.items():
+        num_tokens += len(encoding.encode(value))
+        if key == "name":
+            num_tokens += tokens_per_name
+    return num_tokens
+
+
+def num_tokens_for_reply_priming(model):
+    if _token_model(model) is None:
+        return 0
+    return 3  # every reply is primed with <|start|>assistant<|message|>
+
+
+# refer to https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
+def num_tokens_from_messages(messages, model):
+    """Returns the number of tokens used by a list of messages."""
     num_tokens = 0
     for message in messages:
-        num_tokens += tokens_per_message
-        for key, value in message.items():
-            num_tokens += len(encoding.encode(value))
-            if key == "name":
-                num_tokens += tokens_per_name
-    num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
-    return num_tokens
+        num_tokens += num_tokens_from_message(message, model)
+    return num_tokens + num_tokens_for_reply_priming(model)
 
 
 def num_tokens_by_character(messages):
@@ -1,4 +1,4 @@
-from common.expired_dict import ExpiredDict
+from bot.session_store import create_session_store
 from common.log import logger
 from config import conf
 
@@ -36,13 +36,19 @@ class Session(object):
         raise NotImplementedError
 
 
+def session_store_namespace(sessioncls, session_args):
+    """
+    会话存储的命名空间，由会话类和构造参数(如model)组成
+    不同bot共用同一个会话类时(如ChatGPTBot和ClaudeAPIBot)按模型区分，切换模型后也不会取到旧模型的会话
+    """
+    if not session_args:
+        return sessioncls.__name__
+    return "{}:{}".format(sessioncls.__name__, ",".join("{}={}".format(k, session_args[k]) for k in sorted(session_args)))
+
+
 class SessionManager(object):
     def __init__(self, sessioncls, **session_args):
-        if conf().get("expires_in_seconds"):
-            sessions = ExpiredDict(conf().get("expires_in_seconds"))
-        else:
-            sessions = dict()
-        self.sessions = sessions
+        self.sessions = create_session_store(session_store_namespace(sessioncls, session_args))
         self.sessioncls = sessioncls
         self.session_args = session_args
 
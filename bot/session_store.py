@@ -0,0 +1,259 @@
+"""
+会话存储后端，SessionManager通过字典接口(in, [], del, clear)访问会话
+
+- memory: 进程内字典，重启后会话丢失(默认)
+- sqlite: 按session_id哈希分片存到多个sqlite文件，最近访问的会话缓存在内存中(LRU)，
+  被访问过的会话标记为脏数据，由后台线程批量写回；重启后首次访问时再从磁盘加载
+"""
+import atexit
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from common.expired_dict import ExpiredDict
+from common.log import logger
+from config import conf, get_appdata_dir
+
+
+# namespace -> SqliteSessionStore，重建bot(如#reset、切换模型)时复用同一个存储，
+# 避免写回线程、数据库连接泄漏，以及旧存储把过时的会话写回覆盖新存储的数据
+_sqlite_stores = {}
+_sqlite_stores_lock = threading.Lock()
+
+
+def create_session_store(namespace):
+    store_type = conf().get("session_store", "memory")
+    expires_in_seconds = conf().get("expires_in_seconds")
+    if store_type == "sqlite":
+        with _sqlite_stores_lock:
+            store = _sqlite_stores.get(namespace)
+            if store is None:
+                store = SqliteSessionStore(
+                    namespace,
+                    expires_in_seconds=expires_in_seconds,
+                    shards=conf().get("session_store_shards", 4),
+                    hot_size=conf().get("session_store_hot_size", 1000),
+                    flush_interval=conf().get("session_store_flush_interval", 2),
+                )
+                _sqlite_stores[namespace] = store
+            return store
+    if expires_in_seconds:
+        return ExpiredDict(expires_in_seconds)
+    return dict()
+
+
+class _Shard:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS sessions
+            (namespace TEXT, session_id TEXT, data BLOB, updated_at REAL,
+            PRIMARY KEY (namespace, session_id))"""
+        )
+        self.conn.commit()
+
+    def load(self, namespace, session_id):
+        with self.lock:
+            row = self.conn.execute("SELECT data, updated_at FROM sessions WHERE namespace=? AND session_id=?", (namespace, session_id)).fetchone()
+        return row
+
+    def write(self, namespace, rows, deleted):
+        with self.lock:
+            with self.conn:
+                if rows:
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO sessions (namespace, session_id, data, updated_at) VALUES (?, ?, ?, ?)",
+                        [(namespace, session_id, data, updated_at) for session_id, (data, updated_at) in rows.items()],
+                    )
+                if deleted:
+                    self.conn.executemany("DELETE FROM sessions WHERE namespace=? AND session_id=?", [(namespace, session_id) for session_id in deleted])
+
+    def delete_expired(self, namespace, before):
+        with self.lock:
+            with self.conn:
+                self.conn.execute("DELETE FROM sessions WHERE namespace=? AND updated_at<?", (namespace, before))
+
+    def clear(self, namespace):
+        with self.lock:
+            with self.conn:
+                self.conn.execute("DELETE FROM sessions WHERE namespace=?", (namespace,))
+
+
+class SqliteSessionStore(object):
+    def __init__(self, namespace, expires_in_seconds=None, shards=4, hot_size=1000, flush_interval=2):
+        self.namespace = namespace
+        self.expires_in_seconds = expires_in_seconds
+        self.hot_size = hot_size
+        self.flush_interval = flush_interval
+        self.lock = threading.RLock()
+        self.hot = OrderedDict()  # session_id -> [session, 最后访问时间]，按访问顺序排列
+        self.dirty = set()  # 内存中被访问过、需要写回的session_id
+        self.pending = {}  # 已移出内存但还没写回的会话，session_id -> (序列化数据, 最后访问时间)
+        self.deleted = set()  # 待删除的session_id
+        self.flushing = {}  # 正在写回的会话，写完之前从这里读取
+        self.flushing_deleted = set()
+        self.flush_lock = threading.Lock()
+        data_dir = os.path.join(get_appdata_dir(), "sessions")
+        os.makedirs(data_dir, exist_ok=True)
+        self.shards = [_Shard(os.path.join(data_dir, "sessions_{}.db".format(i))) for i in range(max(1, shards))]
+        threading.Thread(target=self._flush_loop, name="session-store-flush", daemon=True).start()
+        atexit.register(self.flush)
+        logger.info("[SessionStore] sqlite session store ready, namespace={}, shards={}".format(namespace, len(self.shards)))
+
+    def _shard(self, session_id) -> _Shard:
+        return self.shards[zlib.crc32(str(session_id).encode("utf-8")) % len(self.shards)]
+
+    def _expired(self, last_access):
+        return self.expires_in_seconds and time.time() - last_access > self.expires_in_seconds
+
+    def _load(self, session_id):
+        """从内存或磁盘加载会话，不存在或已过期返回None，调用方需持有self.lock"""
+        if session_id in self.hot:
+            session, last_access = self.hot[session_id]
+        elif session_id in self.deleted or session_id in self.flushing_deleted:
+            return None
+        else:
+            if session_id in self.pending:
+                data, last_access = self.pending.pop(session_id)
+                self.dirty.add(session_id)
+            elif session_id in self.flushing:
+                data, last_access = self.flushing[session_id]
+            else:
+                row = self._shard(session_id).load(self.namespace, session_id)
+                if row is None:
+                    return None
+                data, last_access = row
+            try:
+                session = pickle.loads(data)
+            except Exception as e:
+                logger.warning("[SessionStore] load session {} error: {}".format(session_id, e))
+                return None
+            self.hot[session_id] = [session, last_access]
+            self._evict()
+        if self._expired(last_access):
+            self._remove(session_id)
+            return None
+        return session
+
+    def _evict(self):
+        while len(self.hot) > self.hot_size:
+            session_id, (session, last_access) = self.hot.popitem(last=False)
+            if session_id in self.dirty:
+                self.dirty.discard(session_id)
+                try:
+                    self.pending[session_id] = (pickle.dumps(session), last_access)
+                except Exception as e:
+                    logger.warning("[SessionStore] dump session {} error: {}".format(session_id, e))
+
+    def _remove(self, session_id):
+        self.hot.pop(session_id, None)
+        self.pending.pop(session_id, None)
+        self.dirty.discard(session_id)
+        self.deleted.add(session_id)
+
+    def __contains__(self, session_id):
+        with self.lock:
+            return self._load(session_id) is not None
+
+    def __getitem__(self, session_id):
+        with self.lock:
+            session = self._load(session_id)
+            if session is None:
+                raise KeyError(session_id)
+            # 取出的会话随后会被修改，标记为脏数据等待写回
+            self.hot[session_id][1] = time.time()
+            self.hot.move_to_end(session_id)
+            self.dirty.add(session_id)
+            return session
+
+    def __setitem__(self, session_id, session):
+        with self.lock:
+            self.deleted.discard(session_id)
+            self.pending.pop(session_id, None)
+            self.hot[session_id] = [session, time.time()]
+            self.hot.move_to_end(session_id)
+            self.dirty.add(session_id)
+            self._evict()
+
+    def __delitem__(self, session_id):
+        with self.lock:
+            if self._load(session_id) is None:
+                raise KeyError(session_id)
+            self._remove(session_id)
+
+    def get(self, session_id, default=None):
+        try:
+            return self[session_id]
+        except KeyError:
+            return default
+
+    def clear(self):
+        # 持有flush_lock，等待正在进行的写回完成，避免写回把已清空的会话又写回磁盘
+        with self.flush_lock:
+            with self.lock:
+                self.hot.clear()
+                self.dirty.clear()
+                self.pending.clear()
+                self.deleted.clear()
+                self.flushing = {}
+                self.flushing_deleted = set()
+                for shard in self.shards:
+                    shard.clear(self.namespace)
+
+    def flush(self):
+        """把脏数据批量写回磁盘，每个分片一个事务"""
+        with self.flush_lock:
+            with self.lock:
+                rows = self.pending
+                self.pending = {}
+                failed = set()
+                for session_id in self.dirty:
+                    session, last_access = self.hot[session_id]
+                    try:
+                        rows[session_id] = (pickle.dumps(session), last_access)
+                    except Exception as e:
+                        # 保留脏标记，下次写回时重试
+                        failed.add(session_id)
+                        logger.warning("[SessionStore] dump session {} error: {}".format(session_id, e))
+                self.dirty = failed
+                deleted = self.deleted
+                self.deleted = set()
+                self.flushing = rows
+                self.flushing_deleted = deleted
+            if not rows and not deleted:
+                return
+            shard_rows = {}
+            shard_deleted = {}
+            for session_id, row in rows.items():
+                shard_rows.setdefault(self._shard(session_id), {})[session_id] = row
+            for session_id in deleted:
+                shard_deleted.setdefault(self._shard(session_id), []).append(session_id)
+            for shard in self.shards:
+                try:
+                    shard.write(self.namespace, shard_rows.get(shard), shard_deleted.get(shard))
+                except Exception as e:
+                    logger.error("[SessionStore] flush sessions error: {}".format(e))
+            with self.lock:
+                self.flushing = {}
+                self.flushing_deleted = set()
+            logger.debug("[SessionStore] flushed {} sessions, deleted {}".format(len(rows), len(deleted)))
+
+    def _flush_loop(self):
+        last_cleanup = time.time()
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+                if self.expires_in_seconds and time.time() - last_cleanup > 600:
+                    last_cleanup = time.time()
+                    for shard in self.shards:
+                        shard.delete_expired(self.namespace, last_cleanup - self.expires_in_seconds)
+            except Exception as e:
+                logger.error("[SessionStore] flush loop error: {}".format(e))
@@ -7,6 +7,7 @@ from common.singleton import singleton
 from config import conf
 from translate.factory import create_translator
 from voice.factory import create_voice
+from voice.voice_cache import VoiceCache
 
 
 @singleton
@@ -79,7 +80,7 @@ class Bridge(object):
         return self.get_bot("voice_to_text").voiceToText(voiceFile)
 
     def fetch_text_to_voice(self, text) -> Reply:
-        return self.get_bot("text_to_voice").textToVoice(text)
+        return VoiceCache().text_to_voice(self.btype["text_to_voice"], self.get_bot("text_to_voice"), text)
 
     def fetch_translate(self, text, from_lang="", to_lang="en") -> Reply:
         return self.get_bot("translate").translate(text, from_lang, to_lang)
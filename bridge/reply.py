@@ -17,6 +17,7 @@ class ReplyType(Enum):
     TEXT_ = 11  # 强制文本
     VIDEO = 12
     MINIAPP = 13  # 小程序
+    STREAM = 14  # 流式文本，content为ReplyStream
 
     def __str__(self):
         return self.name
@@ -29,3 +30,31 @@ class Reply:
 
     def __str__(self):
         return "Reply(type={}, content={})".format(self.type, self.content)
+
+
+class ReplyStream:
+    """
+    流式回复的内容，bot逐个产出文本片段，channel边接收边发送
+    :param chunks: 文本片段的迭代器
+    :param on_complete: 全部片段产出后调用，参数为完整文本，可用于保存会话
+    """
+
+    def __init__(self, chunks, on_complete=None):
+        self.chunks = chunks
+        self.on_complete = on_complete
+        self.parts = []
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            if chunk:
+                self.parts.append(chunk)
+                yield chunk
+        if self.on_complete:
+            self.on_complete(self.text)
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+    def __str__(self):
+        return "ReplyStream(received={})".format(self.text)
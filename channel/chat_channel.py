@@ -3,13 +3,17 @@ import re
 import threading
 import time
 from asyncio import CancelledError
-from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import Future
+from queue import Full, Queue
 
 from bridge.context import *
 from bridge.reply import *
 from channel.channel import Channel
 from common.dequeue import Dequeue
 from common import memory
+from common.contact_directory import KIND_FRIEND, KIND_GROUP, ContactDirectory
+from common.handler_pool import LANE_FAST, LANE_LLM, LANE_MEDIA, HandlerPool
+from common.tmp_dir import TmpDir
 from plugins import *
 
 try:
@@ -17,7 +21,7 @@ try:
 except Exception as e:
     pass
 
-handler_pool = ThreadPoolExecutor(max_workers=8)  # 处理消息的线程池
+handler_pool = HandlerPool()  # 处理消息的线程池，按任务类型分为fast/llm/media三条通道
 
 
 # 抽象类, 它包含了与消息通道无关的通用处理逻辑
@@ -27,6 +31,7 @@ class ChatChannel(Channel):
     futures = {}  # 记录每个session_id提交到线程池的future对象, 用于重置会话时把没执行的future取消掉，正在执行的不会被取消
     sessions = {}  # 用于控制并发，每个session_id同时只能有一个context在处理
     lock = threading.Lock()  # 用于控制对sessions的访问
+    ready_sessions = Queue()  # 就绪队列，有新消息或有任务处理完毕的session_id会被放入，consume线程阻塞等待，无需轮询
 
     def __init__(self):
         _thread = threading.Thread(target=self.consume)
@@ -51,6 +56,10 @@ class ChatChannel(Channel):
             user_data = conf().get_user_data(cmsg.from_user_id)
             context["openai_api_key"] = user_data.get("openai_api_key")
             context["gpt_model"] = user_data.get("gpt_model")
+            # 消息中带有群名称/好友昵称，顺便更新联系人目录
+            ContactDirectory().update(
+                self.channel_type, KIND_GROUP if context.get("isgroup", False) else KIND_FRIEND, cmsg.other_user_id, cmsg.other_user_nickname
+            )
             if context.get("isgroup", False):
                 group_name = cmsg.other_user_nickname
                 group_id = cmsg.other_user_id
@@ -164,10 +173,22 @@ class ChatChannel(Channel):
     def _handle(self, context: Context):
         if context is None or not context.content:
             return
+        # 处理过程中生成的语音、图片等临时文件写到该请求独立的子目录，发送完成后统一删除
+        with TmpDir().request_scope():
+            self._handle_context(context)
+
+    def _handle_context(self, context: Context):
         logger.debug("[chat_channel] ready to handle context: {}".format(context))
         # reply的构建步骤
         reply = self._generate_reply(context)
 
+        if reply and reply.type == ReplyType.STREAM:
+            if context.get("desire_rtype") == ReplyType.VOICE:  # 语音回复需要完整文本
+                reply = Reply(ReplyType.TEXT, "".join(reply.content))
+            else:
+                self._send_stream_reply(context, reply)
+                return
+
         logger.debug("[chat_channel] ready to decorate reply: {}".format(reply))
 
         # reply的包装步骤
@@ -189,6 +210,8 @@ class ChatChannel(Channel):
             logger.debug("[chat_channel] ready to handle context: type={}, content={}".format(context.type, context.content))
             if context.type == ContextType.TEXT or context.type == ContextType.IMAGE_CREATE:  # 文字和图片消息
                 context["channel"] = e_context["channel"]
+                if conf().get("stream_reply") and ReplyType.STREAM not in self.NOT_SUPPORT_REPLYTYPE and context.get("desire_rtype") != ReplyType.VOICE:
+                    context["stream"] = True  # 支持的bot会返回ReplyType.STREAM类型的回复
                 reply = super().build_reply_content(context.content, context)
             elif context.type == ContextType.VOICE:  # 语音消息
                 cmsg = context["msg"]
@@ -283,6 +306,50 @@ class ChatChannel(Channel):
                 logger.debug("[chat_channel] ready to send reply: {}, context: {}".format(reply, context))
                 self._send(reply, context)
 
+    # 流式回复，边接收边按段落或句子切分发送，每一段都按普通文本回复装饰和发送
+    def _send_stream_reply(self, context: Context, reply: Reply):
+        min_chars = conf().get("stream_reply_min_chars", 50)
+        # 回复插件需要的前后文长度(如敏感词的最大长度-1)，切分点之后要多收到这么多字符才发送，插件才能检查跨越切分点的内容
+        holdback = PluginManager().get_stream_holdback()
+        no_need_at = context.get("no_need_at", False)
+        buffer = ""
+        sent_tail = ""  # 已发送内容的末尾holdback个字符
+        try:
+            for chunk in reply.content:
+                buffer += chunk
+                cut = find_stream_cut(buffer[: len(buffer) - holdback] if holdback else buffer, min_chars)
+                if cut > 0:
+                    self._send_stream_segment(context, buffer[:cut], sent_tail, buffer[cut : cut + holdback])
+                    context["no_need_at"] = True  # 只在第一段@提问者
+                    sent_tail = (sent_tail + buffer[:cut])[-holdback:] if holdback else ""
+                    buffer = buffer[cut:]
+        except Exception as e:
+            logger.exception("[chat_channel] stream reply error: {}".format(e))
+            if not buffer.strip() and not reply.content.text:
+                buffer = conf().get("error_reply", "我暂时遇到了一些问题，请您稍后重试~")
+        finally:
+            if buffer.strip():
+                self._send_stream_segment(context, buffer, sent_tail)
+            context["no_need_at"] = no_need_at
+
+    def _send_stream_segment(self, context: Context, segment: str, lookbehind="", lookahead=""):
+        """
+        :param lookbehind: 这一段之前已发送的内容，lookahead: 这一段之后还未发送的内容，
+            放入context的stream_lookbehind/stream_lookahead，供回复插件检查跨越切分点的内容(见Banwords)
+        """
+        content = segment.strip()
+        if not content:
+            return
+        context["stream_lookbehind"] = lookbehind + segment[: len(segment) - len(segment.lstrip())]
+        context["stream_lookahead"] = segment[len(segment.rstrip()) :] + lookahead
+        try:
+            reply = self._decorate_reply(context, Reply(ReplyType.TEXT, content))
+        finally:
+            del context["stream_lookbehind"]
+            del context["stream_lookahead"]
+        if reply and reply.content:
+            self._send_reply(context, reply)
+
     def _send(self, reply: Reply, context: Context, retry_cnt=0):
         try:
             self.send(reply, context)
@@ -315,6 +382,7 @@ class ChatChannel(Channel):
                 logger.exception("Worker raise exception: {}".format(e))
             with self.lock:
                 self.sessions[session_id][1].release()
+            self.ready_sessions.put(session_id)  # 唤醒consume线程，继续处理该session排队的消息或回收session
 
         return func
 
@@ -330,30 +398,49 @@ class ChatChannel(Channel):
                 self.sessions[session_id][0].putleft(context)  # 优先处理管理命令
             else:
                 self.sessions[session_id][0].put(context)
+        self.ready_sessions.put(session_id)
 
-    # 消费者函数，单独线程，用于从消息队列中取出消息并处理
+    # 消费者函数，单独线程，阻塞等待就绪队列中的session_id，取出该session的消息并处理
     def consume(self):
         while True:
+            session_id = self.ready_sessions.get()
             with self.lock:
-                session_ids = list(self.sessions.keys())
-                for session_id in session_ids:
-                    context_queue, semaphore = self.sessions[session_id]
-                    if semaphore.acquire(blocking=False):  # 等线程处理完毕才能删除
-                        if not context_queue.empty():
-                            context = context_queue.get()
-                            logger.debug("[chat_channel] consume context: {}".format(context))
-                            future: Future = handler_pool.submit(self._handle, context)
-                            future.add_done_callback(self._thread_pool_callback(session_id, context=context))
-                            if session_id not in self.futures:
-                                self.futures[session_id] = []
-                            self.futures[session_id].append(future)
-                        elif semaphore._initial_value == semaphore._value + 1:  # 除了当前，没有任务再申请到信号量，说明所有任务都处理完毕
-                            self.futures[session_id] = [t for t in self.futures[session_id] if not t.done()]
-                            assert len(self.futures[session_id]) == 0, "thread pool error"
-                            del self.sessions[session_id]
-                        else:
-                            semaphore.release()
-            time.sleep(0.1)
+                if session_id not in self.sessions:  # session已被回收，忽略过期的唤醒
+                    continue
+                context_queue, semaphore = self.sessions[session_id]
+                while not context_queue.empty() and semaphore.acquire(blocking=False):
+                    context = context_queue.get()
+                    lane = self._select_lane(context)
+                    try:
+                        future: Future = handler_pool.submit(lane, self._handle, context, retry_callback=lambda sid=session_id: self.ready_sessions.put(sid))
+                    except Full:  # 通道排队已满，消息放回队首，等通道有空位时再唤醒
+                        logger.warning("[chat_channel] handler lane {} is full, session {} waiting".format(lane, session_id))
+                        context_queue.putleft(context)
+                        semaphore.release()
+                        break
+                    logger.debug("[chat_channel] consume context: {}, lane: {}".format(context, lane))
+                    future.add_done_callback(self._thread_pool_callback(session_id, context=context))
+                    if session_id not in self.futures:
+                        self.futures[session_id] = []
+                    self.futures[session_id].append(future)
+                if context_queue.empty() and semaphore._initial_value == semaphore._value:  # 没有排队的消息，也没有处理中的任务，回收session
+                    self.futures[session_id] = [t for t in self.futures.get(session_id, []) if not t.done()]
+                    assert len(self.futures[session_id]) == 0, "thread pool error"
+                    del self.sessions[session_id]
+
+    # 根据消息类型选择处理通道，避免插件指令等快速回复排在耗时的大模型调用之后
+    def _select_lane(self, context: Context):
+        if context.type in [ContextType.VOICE, ContextType.IMAGE, ContextType.IMAGE_CREATE, ContextType.FILE, ContextType.VIDEO]:
+            return LANE_MEDIA
+        if context.type == ContextType.TEXT:
+            content = context.content or ""
+            plugin_trigger_prefix = conf().get("plugin_trigger_prefix", "$")
+            if content.startswith("#") or (plugin_trigger_prefix and content.startswith(plugin_trigger_prefix)):
+                return LANE_FAST
+            return LANE_LLM
+        if context.type in [ContextType.ACCEPT_FRIEND, ContextType.PATPAT, ContextType.EXIT_GROUP, ContextType.SHARING]:
+            return LANE_FAST
+        return LANE_LLM
 
     # 取消session_id对应的所有任务，只能取消排队的消息和已提交线程池但未执行的任务
     def cancel_session(self, session_id):
@@ -377,6 +464,27 @@ class ChatChannel(Channel):
                 self.sessions[session_id][0] = Dequeue()
 
 
+STREAM_PARAGRAPH_END = "\n\n"
+STREAM_SENTENCE_ENDS = "。！？!?；;\n"
+
+
+def find_stream_cut(buffer, min_chars, max_chars=None):
+    """
+    流式回复的切分位置，优先在段落结尾切分，其次在句子结尾，返回0表示继续等待
+    """
+    if len(buffer) < min_chars:
+        return 0
+    cut = buffer.rfind(STREAM_PARAGRAPH_END)
+    if cut >= min_chars:
+        return cut + len(STREAM_PARAGRAPH_END)
+    for i in range(len(buffer) - 1, min_chars - 2, -1):
+        if buffer[i] in STREAM_SENTENCE_ENDS:
+            return i + 1
+    if len(buffer) >= (max_chars or min_chars * 10):  # 很长都没有句子结尾，强制切分
+        return len(buffer)
+    return 0
+
+
 def check_prefix(content, prefix_list):
     if not prefix_list:
         return None
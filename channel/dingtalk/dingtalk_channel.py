@@ -25,6 +25,7 @@ from common.log import logger
 from common.singleton import singleton
 from common.time_check import time_checker
 from config import conf
+from plugins import Event, PluginManager
 
 
 class CustomAICardReplier(CardReplier):
@@ -200,6 +201,51 @@ class DingTalkChanel(ChatChannel, dingtalk_stream.ChatbotHandler):
             self.reply_text(reply.content, incoming_message)
 
 
+    def _send_stream_reply(self, context: Context, reply: Reply):
+        if not conf().get("dingtalk_card_enabled"):
+            return super()._send_stream_reply(context, reply)
+        stream = reply.content
+        plugin_manager = PluginManager()
+        if plugin_manager.has_listeners(Event.ON_DECORATE_REPLY) or plugin_manager.has_listeners(Event.ON_SEND_REPLY):
+            # 有插件处理回复(如敏感词过滤)时不能把未经处理的内容推送到卡片，接收完整后按普通回复装饰和发送
+            try:
+                for _ in stream:
+                    pass
+            except Exception as e:
+                logger.exception("[Dingtalk] stream reply error: {}".format(e))
+            text = stream.text or conf().get("error_reply", "我暂时遇到了一些问题，请您稍后重试~")
+            reply = self._decorate_reply(context, Reply(ReplyType.TEXT, text))
+            self._send_reply(context, reply)
+            return
+        # 卡片模式下创建一张AI卡片，边接收边更新卡片内容
+        incoming_message = context.kwargs['msg'].incoming_message
+        card_instance = self.ai_markdown_card_start(incoming_message)
+        min_chars = conf().get("stream_reply_min_chars", 50)
+        sent_len = 0
+        try:
+            for _ in stream:
+                text = stream.text
+                if len(text) - sent_len >= min_chars:
+                    card_instance.ai_streaming(markdown=text, append=False)
+                    sent_len = len(text)
+        except Exception as e:
+            logger.exception("[Dingtalk] stream reply error: {}".format(e))
+            if not stream.text:
+                card_instance.ai_fail()
+                return
+        self._finish_stream_card(context, card_instance, stream.text or conf().get("error_reply", "我暂时遇到了一些问题，请您稍后重试~"))
+
+    def _finish_stream_card(self, context: Context, card_instance, text):
+        # 没有回复插件，完整内容只需要加上回复前后缀等装饰再写入卡片
+        reply = self._decorate_reply(context, Reply(ReplyType.TEXT, text))
+        if reply and reply.type == ReplyType.TEXT:
+            card_instance.ai_finish(markdown=reply.content)
+            return
+        # 需要语音回复等情况，卡片保留原文，回复按普通方式发送
+        card_instance.ai_finish(markdown=text)
+        if reply and reply.type:
+            self._send(reply, context)
+
     def generate_button_markdown_content(self, context, reply):
         image_url = context.kwargs.get("image_url")
         promptEn = context.kwargs.get("promptEn")
@@ -8,7 +8,7 @@
 # -*- coding=utf-8 -*-
 import uuid
 
-import requests
+from common import http_client
 import web
 from channel.feishu.feishu_message import FeishuMessage
 from bridge.context import Context
@@ -80,7 +80,7 @@ class FeiShuChanel(ChatChannel):
                 "msg_type": msg_type,
                 "content": json.dumps({content_key: reply_content})
             }
-            res = requests.post(url=url, headers=headers, json=data, timeout=(5, 10))
+            res = http_client.post(url=url, headers=headers, json=data, timeout=(5, 10))
         else:
             url = "https://open.feishu.cn/open-apis/im/v1/messages"
             params = {"receive_id_type": context.get("receive_id_type") or "open_id"}
@@ -89,7 +89,7 @@ class FeiShuChanel(ChatChannel):
                 "msg_type": msg_type,
                 "content": json.dumps({content_key: reply_content})
             }
-            res = requests.post(url=url, headers=headers, params=params, json=data, timeout=(5, 10))
+            res = http_client.post(url=url, headers=headers, params=params, json=data, timeout=(5, 10))
         res = res.json()
         if res.get("code") == 0:
             logger.info(f"[FeiShu] send message success")
@@ -107,7 +107,7 @@ class FeiShuChanel(ChatChannel):
             "app_secret": self.feishu_app_secret
         }
         data = bytes(json.dumps(req_body), encoding='utf8')
-        response = requests.post(url=url, data=data, headers=headers)
+        response = http_client.post(url=url, data=data, headers=headers)
         if response.status_code == 200:
             res = response.json()
             if res.get("code") != 0:
@@ -121,7 +121,7 @@ class FeiShuChanel(ChatChannel):
 
     def _upload_image_url(self, img_url, access_token):
         logger.debug(f"[WX] start download image, img_url={img_url}")
-        response = requests.get(img_url)
+        response = http_client.get(img_url)
         suffix = utils.get_path_suffix(img_url)
         temp_name = str(uuid.uuid4()) + "." + suffix
         if response.status_code == 200:
@@ -138,7 +138,7 @@ class FeiShuChanel(ChatChannel):
             'Authorization': f'Bearer {access_token}',
         }
         with open(temp_name, "rb") as file:
-            upload_response = requests.post(upload_url, files={"image": file}, data=data, headers=headers)
+            upload_response = http_client.post(upload_url, files={"image": file}, data=data, headers=headers)
             logger.info(f"[FeiShu] upload file, res={upload_response.content}")
             os.remove(temp_name)
             return upload_response.json().get("data").get("image_key")
@@ -0,0 +1,58 @@
+"""
+基于aiohttp的gewechat回调服务器
+
+- POST: 解析JSON后交给channel.receive_callback校验、去重并放入处理队列，立即返回success，
+  gewechat回调突增时不会因为等待消息解析和插件处理而超时重发；队列已满时返回503
+- GET ?media=: 下载签名链接对应的媒体文件，FileResponse使用sendfile零拷贝发送，支持Range和ETag
+"""
+import json
+
+from aiohttp import web
+
+from channel.gewechat.media_server import MediaLinks
+from common.log import logger
+
+# 回调中语音消息的数据以base64放在JSON里，放宽aiohttp默认1MB的请求体限制
+CLIENT_MAX_SIZE = 20 * 1024 * 1024
+
+
+def create_app(channel, path):
+    async def handle_post(request: web.Request):
+        body = await request.read()
+        logger.debug("[gewechat] receive data: {}".format(body))
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return web.Response(status=400, text="invalid json")
+        if not channel.receive_callback(data):
+            return web.Response(status=503, text="busy")
+        return web.Response(text="success")
+
+    async def handle_get(request: web.Request):
+        media_id = request.query.get("media")
+        if not media_id:
+            return web.Response(text="gewechat callback server is running")
+        try:
+            media = MediaLinks().resolve(media_id, request.query.get("expires"), request.query.get("sig"))
+        except PermissionError:
+            raise web.HTTPForbidden()
+        except FileNotFoundError:
+            raise web.HTTPNotFound()
+        response = web.FileResponse(media.path, headers={"Content-Type": media.content_type})
+        await response.prepare(request)
+        # 完整下载了文件(不是Range请求或304)才计划删除
+        if response.status == 200:
+            MediaLinks().delivered(media_id)
+        return response
+
+    app = web.Application(client_max_size=CLIENT_MAX_SIZE)
+    app.router.add_post(path, handle_post)
+    app.router.add_get(path, handle_get)
+    return app
+
+
+def run_callback_server(channel, path, port, host="0.0.0.0"):
+    """在当前线程运行回调服务器，阻塞直到退出"""
+    app = create_app(channel, path or "/")
+    logger.info(f"[gewechat] aiohttp callback server listening on {host}:{port}{path}")
+    web.run_app(app, host=host, port=port, handle_signals=False, print=None, access_log=None)
@@ -0,0 +1,90 @@
+"""
+gewechat联系人和群成员缓存
+
+每条消息都需要好友/群名称和群成员的群昵称，原来每条消息都要调用getBriefInfo和getChatroomMemberList两个接口，
+并线性查找成员列表。这里按app_id缓存查询结果，群成员建立wxid索引:
+- 缓存超过gewechat_contact_cache_ttl秒后重新查询
+- 群成员索引中找不到发送者(新成员)时重新查询一次，同一个群的重新查询间隔不少于MEMBER_REFRESH_INTERVAL秒
+- 收到入群、改名、移出成员等通知时使对应的缓存失效
+"""
+import threading
+import time
+
+from common.expired_dict import ExpiredDict
+from common.log import logger
+from common.singleton import singleton
+from config import conf
+
+MEMBER_REFRESH_INTERVAL = 10
+# 按key哈希分配到固定数量的锁上，锁的数量不随联系人数量增长
+KEY_LOCK_STRIPES = 64
+
+
+@singleton
+class ContactCache:
+    def __init__(self, ttl=None, max_size=10000):
+        self.ttl = ttl if ttl is not None else conf().get("gewechat_contact_cache_ttl", 1800)
+        # 过期的条目由ExpiredDict清理，是否需要重新查询由查询时间判断
+        self.nicknames = ExpiredDict(self.ttl, max_size)  # (app_id, wxid) -> (昵称, 查询时间)
+        self.members = ExpiredDict(self.ttl, max_size)  # (app_id, chatroom_id) -> ({wxid: 成员信息}, 查询时间)
+        self.key_locks = [threading.Lock() for _ in range(KEY_LOCK_STRIPES)]
+
+    def _key_lock(self, key):
+        # 同一个key同时只查询一次，其他线程等待查询结果
+        return self.key_locks[hash(key) % KEY_LOCK_STRIPES]
+
+    def _fresh(self, cache, key, max_age):
+        entry = cache.get(key)
+        if entry is not None and time.time() - entry[1] < max_age:
+            return entry
+        return None
+
+    def get_nickname(self, client, app_id, wxid):
+        """好友或群的名称，查询失败返回None"""
+        key = (app_id, wxid)
+        entry = self._fresh(self.nicknames, key, self.ttl)
+        if entry is not None:
+            return entry[0]
+        with self._key_lock(("nickname",) + key):
+            entry = self._fresh(self.nicknames, key, self.ttl)
+            if entry is not None:
+                return entry[0]
+            response = client.get_brief_info(app_id, [wxid])
+            if response.get("ret") != 200 or not response.get("data"):
+                logger.warning(f"[gewechat] get brief info of {wxid} failed: {response}")
+                return None
+            nickname = response["data"][0].get("nickName", "")
+            self.nicknames[key] = (nickname, time.time())
+            return nickname
+
+    def get_member(self, client, app_id, chatroom_id, wxid):
+        """群成员信息，找不到返回None"""
+        key = (app_id, chatroom_id)
+        entry = self._fresh(self.members, key, self.ttl)
+        if entry is not None and wxid in entry[0]:
+            return entry[0][wxid]
+        with self._key_lock(("members",) + key):
+            # 成员不在索引中时，可能是新入群的成员，索引查询时间超过MEMBER_REFRESH_INTERVAL才重新查询
+            entry = self._fresh(self.members, key, self.ttl if entry is None else MEMBER_REFRESH_INTERVAL)
+            if entry is None:
+                entry = self._load_members(client, app_id, chatroom_id)
+                if entry is None:
+                    return None
+            return entry[0].get(wxid)
+
+    def _load_members(self, client, app_id, chatroom_id):
+        response = client.get_chatroom_member_list(app_id, chatroom_id)
+        member_list = (response.get("data") or {}).get("memberList") if response.get("ret", 0) == 200 else None
+        if not member_list:
+            logger.warning(f"[gewechat] get member list of {chatroom_id} failed: {response}")
+            return None
+        entry = ({member["wxid"]: member for member in member_list}, time.time())
+        self.members[(app_id, chatroom_id)] = entry
+        logger.debug(f"[gewechat] member list of {chatroom_id} cached, count={len(member_list)}")
+        return entry
+
+    def invalidate(self, app_id, wxid):
+        """好友或群的信息发生变化，删除名称和群成员缓存"""
+        self.nicknames.pop((app_id, wxid), None)
+        self.members.pop((app_id, wxid), None)
+        logger.debug(f"[gewechat] contact cache of {wxid} invalidated")
@@ -1,19 +1,26 @@
 import os
+import threading
 import time
 import json
 import web
+from queue import Full
 from urllib.parse import urlparse
 
 from bridge.context import Context, ContextType
 from bridge.reply import Reply, ReplyType
 from channel.chat_channel import ChatChannel
+from channel.gewechat.contact_cache import ContactCache
 from channel.gewechat.gewechat_message import GeWeChatMessage
+from channel.gewechat.media_server import MediaLinks, iter_file, parse_range
+from common.expired_dict import ExpiredDict
+from common.handler_pool import HandlerLane
 from common.log import logger
 from common.singleton import singleton
 from common.tmp_dir import TmpDir
 from config import conf, save_config
 from lib.gewechat import GewechatClient
 from voice.audio_convert import mp3_to_silk
+from voice.voice_cache import VoiceCache
 import uuid
 
 MAX_UTF8_LEN = 2048
@@ -25,6 +32,11 @@ class GeWeChatChannel(ChatChannel):
     def __init__(self):
         super().__init__()
 
+        # 回调只做校验和去重后立即返回，消息解析(需要调用gewechat接口)在有界的工作线程中进行
+        self.callback_lane = HandlerLane("gewechat-callback", conf().get("gewechat_callback_workers", 4), conf().get("gewechat_callback_queue_size", 200))
+        self.received_msg_ids = ExpiredDict(60 * 10, max_size=10000)  # 最近收到的消息id，gewechat超时重发时去重
+        self.receive_lock = threading.Lock()
+
         self.base_url = conf().get("gewechat_base_url")
         if not self.base_url:
             logger.error("[gewechat] base_url is not set")
@@ -100,10 +112,90 @@ class GeWeChatChannel(ChatChannel):
         # 如果没有指定端口，使用默认端口80
         port = parsed_url.port or 80
         logger.info(f"[gewechat] start callback server: {callback_url}, using port {port}")
+        if conf().get("gewechat_callback_server", "aiohttp") == "aiohttp":
+            try:
+                from channel.gewechat.callback_server import run_callback_server
+            except ImportError as e:
+                logger.warning(f"[gewechat] aiohttp is not installed, fallback to web.py callback server: {e}")
+            else:
+                run_callback_server(self, path, port)
+                return
         urls = (path, "channel.gewechat.gewechat_channel.Query")
         app = web.application(urls, globals(), autoreload=False)
         web.httpserver.runsimple(app.wsgifunc(), ("0.0.0.0", port))
 
+    def receive_callback(self, data) -> bool:
+        """
+        接收gewechat回调，校验和去重后放入处理队列，不等待处理完成
+        :return: 队列已满时返回False，需要让gewechat稍后重发
+        """
+        if not isinstance(data, dict):
+            logger.warning(f"[gewechat] ignore invalid callback data: {data}")
+            return True
+        # gewechat服务发送的回调测试消息
+        if 'testMsg' in data and 'token' in data:
+            logger.debug(f"[gewechat] 收到gewechat服务发送的回调测试消息")
+            return True
+        msg_id = (data.get('Data') or {}).get('NewMsgId')
+        with self.receive_lock:
+            if msg_id is not None and msg_id in self.received_msg_ids:
+                logger.debug(f"[gewechat] ignore duplicate callback, msg_id={msg_id}")
+                return True
+            try:
+                self.callback_lane.submit(self.handle_callback, data)
+            except Full:
+                logger.warning(f"[gewechat] callback queue is full, msg_id={msg_id}")
+                return False
+            if msg_id is not None:
+                self.received_msg_ids[msg_id] = True
+        return True
+
+    def handle_callback(self, data):
+        try:
+            self._handle_callback(data)
+        except NotImplementedError as e:
+            logger.debug(f"[gewechat] {e}")
+        except Exception as e:
+            logger.exception(f"[gewechat] handle callback error: {e}")
+
+    def _handle_callback(self, data):
+        # 联系人或群信息变化(改名、移出成员、删除等)，使缓存失效
+        if data.get('TypeName') in ('ModContacts', 'DelContacts'):
+            user_name = (data.get('Data') or {}).get('UserName', {}).get('string')
+            if user_name:
+                ContactCache().invalidate(self.app_id, user_name)
+
+        gewechat_msg = GeWeChatMessage(data, self.client)
+
+        # 微信客户端的状态同步消息
+        if gewechat_msg.ctype == ContextType.STATUS_SYNC:
+            logger.debug(f"[gewechat] ignore status sync message: {gewechat_msg.content}")
+            return
+
+        # 忽略非用户消息（如公众号、系统通知等）
+        if gewechat_msg.ctype == ContextType.NON_USER_MSG:
+            logger.debug(f"[gewechat] ignore non-user message from {gewechat_msg.from_user_id}: {gewechat_msg.content}")
+            return
+
+        # 忽略来自自己的消息
+        if gewechat_msg.my_msg:
+            logger.debug(f"[gewechat] ignore message from myself: {gewechat_msg.actual_user_id}: {gewechat_msg.content}")
+            return
+
+        # 忽略过期的消息
+        if int(gewechat_msg.create_time) < int(time.time()) - 60 * 5: # 跳过5分钟前的历史消息
+            logger.debug(f"[gewechat] ignore expired message from {gewechat_msg.actual_user_id}: {gewechat_msg.content}")
+            return
+
+        context = self._compose_context(
+            gewechat_msg.ctype,
+            gewechat_msg.content,
+            isgroup=gewechat_msg.is_group,
+            msg=gewechat_msg,
+        )
+        if context:
+            self.produce(context)
+
     def send(self, reply: Reply, context: Context):
         receiver = context["receiver"]
         gewechat_message = context.get("msg")
@@ -120,9 +212,8 @@ class GeWeChatChannel(ChatChannel):
                 if content.endswith('.mp3'):
                     # 如果是mp3文件，转换为silk格式
                     silk_path = content + '.silk'
-                    duration = mp3_to_silk(content, silk_path)
-                    callback_url = conf().get("gewechat_callback_url")
-                    silk_url = callback_url + "?file=" + silk_path
+                    duration = VoiceCache().convert(content, silk_path, mp3_to_silk)
+                    silk_url = MediaLinks().publish(silk_path)
                     self.client.post_voice(self.app_id, receiver, silk_url, duration)
                     logger.info(f"[gewechat] Do send voice to {receiver}: {silk_url}, duration: {duration/1000.0} seconds")
                     return
@@ -143,74 +234,54 @@ class GeWeChatChannel(ChatChannel):
             img_file_path = TmpDir().path() + img_file_name
             with open(img_file_path, "wb") as f:
                 f.write(img_data)
-            # Construct callback URL
-            callback_url = conf().get("gewechat_callback_url")
-            img_url = callback_url + "?file=" + img_file_path
+            # 生成签名下载链接，gewechat下载完成后删除文件
+            img_url = MediaLinks().publish(img_file_path)
             self.client.post_image(self.app_id, receiver, img_url)
             logger.info("[gewechat] sendImage, receiver={}, url={}".format(receiver, img_url))
 
 class Query:
     def GET(self):
-        # 搭建简单的文件服务器，用于向gewechat服务传输语音等文件，但只允许访问tmp目录下的文件
-        params = web.input(file="")
-        file_path = params.file
-        if file_path:
-            # 使用os.path.abspath清理路径
-            clean_path = os.path.abspath(file_path)
-            # 获取tmp目录的绝对路径
-            tmp_dir = os.path.abspath("tmp")
-            # 检查文件路径是否在tmp目录下
-            if not clean_path.startswith(tmp_dir):
-                logger.error(f"[gewechat] Forbidden access to file outside tmp directory: file_path={file_path}, clean_path={clean_path}, tmp_dir={tmp_dir}")
-                raise web.forbidden()
-
-            if os.path.exists(clean_path):
-                with open(clean_path, 'rb') as f:
-                    return f.read()
-            else:
-                logger.error(f"[gewechat] File not found: {clean_path}")
-                raise web.notfound()
-        return "gewechat callback server is running"
+        # 搭建简单的文件服务器，用于向gewechat服务传输语音等文件，只允许通过签名链接下载
+        params = web.input(media="", expires="", sig="")
+        if not params.media:
+            return "gewechat callback server is running"
+        links = MediaLinks()
+        try:
+            media = links.resolve(params.media, params.expires, params.sig)
+        except PermissionError:
+            raise web.forbidden()
+        except FileNotFoundError:
+            raise web.notfound()
+        if web.ctx.env.get("HTTP_IF_NONE_MATCH") == media.etag:
+            raise web.notmodified()
+        try:
+            byte_range = parse_range(web.ctx.env.get("HTTP_RANGE"), media.size)
+        except ValueError:
+            web.header("Content-Range", f"bytes */{media.size}")
+            raise web.HTTPError("416 Range Not Satisfiable")
+        web.header("Content-Type", media.content_type)
+        web.header("ETag", media.etag)
+        web.header("Accept-Ranges", "bytes")
+        if byte_range:
+            start, end = byte_range
+            web.ctx.status = "206 Partial Content"
+            web.header("Content-Range", f"bytes {start}-{end}/{media.size}")
+            on_complete = None
+        else:
+            start, end = 0, media.size - 1
+            on_complete = lambda: links.delivered(params.media)
+        web.header("Content-Length", str(end - start + 1))
+        # 分块返回，不把整个文件读入内存
+        return iter_file(media.path, start, end, on_complete)
 
     def POST(self):
         channel = GeWeChatChannel()
         web_data = web.data()
         logger.debug("[gewechat] receive data: {}".format(web_data))
-        data = json.loads(web_data)
-        
-        # gewechat服务发送的回调测试消息
-        if isinstance(data, dict) and 'testMsg' in data and 'token' in data:
-            logger.debug(f"[gewechat] 收到gewechat服务发送的回调测试消息")
-            return "success"
-
-        gewechat_msg = GeWeChatMessage(data, channel.client)
-        
-        # 微信客户端的状态同步消息
-        if gewechat_msg.ctype == ContextType.STATUS_SYNC:
-            logger.debug(f"[gewechat] ignore status sync message: {gewechat_msg.content}")
-            return "success"
-
-        # 忽略非用户消息（如公众号、系统通知等）
-        if gewechat_msg.ctype == ContextType.NON_USER_MSG:
-            logger.debug(f"[gewechat] ignore non-user message from {gewechat_msg.from_user_id}: {gewechat_msg.content}")
-            return "success"
-
-        # 忽略来自自己的消息
-        if gewechat_msg.my_msg:
-            logger.debug(f"[gewechat] ignore message from myself: {gewechat_msg.actual_user_id}: {gewechat_msg.content}")
-            return "success"
-
-        # 忽略过期的消息
-        if int(gewechat_msg.create_time) < int(time.time()) - 60 * 5: # 跳过5分钟前的历史消息
-            logger.debug(f"[gewechat] ignore expired message from {gewechat_msg.actual_user_id}: {gewechat_msg.content}")
-            return "success"
-
-        context = channel._compose_context(
-            gewechat_msg.ctype,
-            gewechat_msg.content,
-            isgroup=gewechat_msg.is_group,
-            msg=gewechat_msg,
-        )
-        if context:
-            channel.produce(context)
+        try:
+            data = json.loads(web_data)
+        except ValueError:
+            raise web.badrequest()
+        if not channel.receive_callback(data):
+            raise web.HTTPError("503 Service Unavailable", data="busy")
         return "success"
@@ -3,6 +3,7 @@ import uuid
 import re
 from bridge.context import ContextType
 from channel.chat_message import ChatMessage
+from channel.gewechat.contact_cache import ContactCache
 from common.log import logger
 from common.tmp_dir import TmpDir
 from config import conf
@@ -398,6 +399,7 @@ class GeWeChatMessage(ChatMessage):
         elif msg_type == 10002:  # Group System Message
             if self.is_group:
                 content = msg['Data']['Content']['string']
+                ContactCache().invalidate(self.app_id, self.from_user_id)  # 入群、改名等群通知，群信息已变化
                 if any(note_bot_join_group in content for note_bot_join_group in notes_bot_join_group):  # 邀请机器人加入群聊
                     logger.warn("机器人加入群聊消息，不处理~")
                     pass
@@ -436,12 +438,9 @@ class GeWeChatMessage(ChatMessage):
             raise NotImplementedError("Unsupported message type: Type:{}".format(msg_type))
 
         # 获取群聊或好友的名称
-        brief_info_response = self.client.get_brief_info(self.app_id, [self.other_user_id])
-        if brief_info_response['ret'] == 200 and brief_info_response['data']:
-            brief_info = brief_info_response['data'][0]
-            self.other_user_nickname = brief_info.get('nickName', '')
-            if not self.other_user_nickname:
-                self.other_user_nickname = self.other_user_id
+        nickname = ContactCache().get_nickname(self.client, self.app_id, self.other_user_id)
+        if nickname is not None:
+            self.other_user_nickname = nickname or self.other_user_id
 
         if self.is_group:
             # 如果是群聊消息，获取实际发送者信息
@@ -478,16 +477,12 @@ class GeWeChatMessage(ChatMessage):
                 }
             }
             """
-            chatroom_member_list_response = self.client.get_chatroom_member_list(self.app_id, self.from_user_id)
-            if chatroom_member_list_response.get('ret', 0) == 200 and chatroom_member_list_response.get('data', {}).get('memberList', []):
-                # 从群成员列表中匹配acual_user_id
-                for member_info in chatroom_member_list_response['data']['memberList']:
-                    if member_info['wxid'] == self.actual_user_id:
-                        # 先获取displayName，如果displayName为空，再获取nickName
-                        self.actual_user_nickname = member_info.get('displayName', '')
-                        if not self.actual_user_nickname:
-                            self.actual_user_nickname = member_info.get('nickName', '')
-                        break
+            member_info = ContactCache().get_member(self.client, self.app_id, self.from_user_id, self.actual_user_id)
+            if member_info:
+                # 先获取displayName，如果displayName为空，再获取nickName
+                self.actual_user_nickname = member_info.get('displayName', '')
+                if not self.actual_user_nickname:
+                    self.actual_user_nickname = member_info.get('nickName', '')
             # 如果actual_user_nickname为空，使用actual_user_id作为nickname
             if not self.actual_user_nickname:
                 self.actual_user_nickname = self.actual_user_id
@@ -0,0 +1,144 @@
+"""
+向gewechat服务提供语音、图片等媒体文件的下载
+
+发送语音和图片时，gewechat服务需要从回调服务器下载文件。这里为每个文件生成短期有效的签名链接，
+不在url中暴露本地路径；文件被完整下载后延迟删除，一直没有被下载的文件在链接过期后删除，避免tmp目录堆积
+"""
+import hashlib
+import hmac
+import mimetypes
+import os
+import secrets
+import threading
+import time
+from urllib.parse import urlencode
+
+from common.log import logger
+from common.singleton import singleton
+from common.tmp_dir import ScratchSpace
+from config import conf
+
+CHUNK_SIZE = 64 * 1024
+CONTENT_TYPES = {".silk": "audio/silk"}
+
+
+class MediaFile:
+    def __init__(self, path, expires, delete):
+        stat = os.stat(path)
+        self.path = path
+        self.size = stat.st_size
+        self.etag = '"{:x}-{:x}"'.format(stat.st_mtime_ns, stat.st_size)
+        ext = os.path.splitext(path)[1].lower()
+        self.content_type = CONTENT_TYPES.get(ext) or mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.expires = expires
+        self.delete = delete  # 是否由这里负责删除文件
+        self.delete_at = None  # 下载完成后计划删除的时间
+        self.release = ScratchSpace().retain(path)  # 请求处理完成后文件仍要保留到被下载
+
+
+@singleton
+class MediaLinks:
+    def __init__(self):
+        self.secret = (conf().get("gewechat_media_secret") or secrets.token_hex(16)).encode("utf-8")
+        self.ttl = conf().get("gewechat_media_url_ttl", 600)
+        self.delete_delay = conf().get("gewechat_media_delete_delay", 60)
+        self.files = {}  # media_id -> MediaFile
+        self.lock = threading.Lock()
+        threading.Thread(target=self._sweep_loop, name="gewechat-media-sweeper", daemon=True).start()
+
+    def _sign(self, media_id, expires):
+        return hmac.new(self.secret, "{}:{}".format(media_id, expires).encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+    def publish(self, path, delete=True) -> str:
+        """
+        登记要提供下载的文件，返回签名链接
+        :param delete: 下载完成或链接过期后是否删除文件
+        """
+        media_id = secrets.token_urlsafe(12)
+        expires = int(time.time()) + self.ttl
+        with self.lock:
+            self.files[media_id] = MediaFile(os.path.abspath(path), expires, delete)
+        query = urlencode({"media": media_id, "expires": expires, "sig": self._sign(media_id, expires)})
+        return conf().get("gewechat_callback_url") + "?" + query
+
+    def resolve(self, media_id, expires, sig) -> MediaFile:
+        """校验签名链接，签名错误或已过期抛出PermissionError，文件不存在抛出FileNotFoundError"""
+        try:
+            expires = int(expires)
+        except (TypeError, ValueError):
+            raise PermissionError("invalid expires")
+        if not hmac.compare_digest(self._sign(media_id, expires), sig or "") or expires < time.time():
+            raise PermissionError("invalid or expired signature")
+        with self.lock:
+            media = self.files.get(media_id)
+        if media is None or not os.path.isfile(media.path):
+            raise FileNotFoundError(media_id)
+        return media
+
+    def delivered(self, media_id):
+        """文件已被完整下载，延迟删除(留出gewechat重试下载的时间)"""
+        with self.lock:
+            media = self.files.get(media_id)
+            if media is not None and media.delete_at is None:
+                media.delete_at = time.time() + self.delete_delay
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(30)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"[gewechat] sweep media files error: {e}")
+
+    def sweep(self):
+        now = time.time()
+        with self.lock:
+            expired = [media_id for media_id, media in self.files.items() if media.expires < now or (media.delete_at is not None and media.delete_at < now)]
+            removed = [self.files.pop(media_id) for media_id in expired]
+        for media in removed:
+            if media.delete:
+                try:
+                    os.remove(media.path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"[gewechat] remove media file {media.path} failed: {e}")
+            media.release()
+        if removed:
+            logger.debug(f"[gewechat] {len(removed)} media links expired")
+
+
+def parse_range(range_header, size):
+    """
+    解析单个Range请求头，返回(start, end)，end包含在内；没有Range头返回None，范围不合法抛出ValueError
+    """
+    if not range_header:
+        return None
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        raise ValueError(range_header)
+    start, _, end = spec.strip().partition("-")
+    if start:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    else:  # bytes=-N 表示最后N个字节
+        length = int(end)
+        start, end = max(0, size - length), size - 1
+    if start > end or start >= size:
+        raise ValueError(range_header)
+    return start, end
+
+
+def iter_file(path, start, end, on_complete=None):
+    """分块读取文件，不把整个文件读入内存，读完后调用on_complete"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    if remaining <= 0 and on_complete:
+        on_complete()
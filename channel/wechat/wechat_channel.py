@@ -17,6 +17,7 @@ from bridge.reply import *
 from channel.chat_channel import ChatChannel
 from channel import chat_channel
 from channel.wechat.wechat_message import *
+from common.contact_directory import KIND_FRIEND, KIND_GROUP, ContactDirectory
 from common.expired_dict import ExpiredDict
 from common.log import logger
 from common.singleton import singleton
@@ -111,6 +112,9 @@ class WechatChannel(ChatChannel):
         super().__init__()
         self.receivedMsgs = ExpiredDict(conf().get("expires_in_seconds"))
         self.auto_login_times = 0
+        directory = ContactDirectory()
+        directory.register_loader("wx", KIND_GROUP, lambda: [(c["UserName"], c["NickName"]) for c in itchat.get_chatrooms()])
+        directory.register_loader("wx", KIND_FRIEND, lambda: [(f["UserName"], f["NickName"]) for f in itchat.get_friends(update=True)])
 
     def startup(self):
         try:
@@ -142,13 +146,15 @@ class WechatChannel(ChatChannel):
                 time.sleep(2)
                 self.auto_login_times += 1
                 if self.auto_login_times < 100:
-                    chat_channel.handler_pool._shutdown = False
+                    chat_channel.handler_pool.revive()
                     self.startup()
         except Exception as e:
             pass
 
     def loginCallback(self):
         logger.debug("Login success")
+        # 重新登录后群和好友的UserName都会变化
+        ContactDirectory().invalidate("wx")
         _send_login_success()
 
     # handle_* 系列函数处理收到的消息后构造Context，然后传入produce函数中处理Context和发送回复
@@ -20,6 +20,7 @@ from common.singleton import singleton
 from common.utils import compress_imgfile, fsize, split_string_by_utf8_length
 from config import conf, subscribe_msg
 from voice.audio_convert import any_to_amr, split_audio
+from voice.voice_cache import VoiceCache
 
 MAX_UTF8_LEN = 2048
 
@@ -66,7 +67,7 @@ class WechatComAppChannel(ChatChannel):
                 media_ids = []
                 file_path = reply.content
                 amr_file = os.path.splitext(file_path)[0] + ".amr"
-                any_to_amr(file_path, amr_file)
+                VoiceCache().convert(file_path, amr_file, any_to_amr)
                 duration, files = split_audio(amr_file, 60 * 1000)
                 if len(files) > 1:
                     logger.info("[wechatcom] voice too long {}s > 60s , split into {} parts".format(duration / 1000.0, len(files)))
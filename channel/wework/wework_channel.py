@@ -13,9 +13,11 @@ from bridge.reply import *
 from channel.chat_channel import ChatChannel
 from channel.wework.wework_message import *
 from channel.wework.wework_message import WeworkMessage
+from common.contact_directory import KIND_GROUP, ContactDirectory
 from common.singleton import singleton
 from common.log import logger
 from common.time_check import time_checker
+from common.tmp_dir import TmpDir
 from common.utils import compress_imgfile, fsize
 from config import conf
 from channel.wework.run import wework
@@ -32,11 +34,8 @@ def get_wxid_by_name(room_members, group_wxid, name):
 
 
 def download_and_compress_image(url, filename, quality=30):
-    # 确定保存图片的目录
-    directory = os.path.join(os.getcwd(), "tmp")
-    # 如果目录不存在，则创建目录
-    if not os.path.exists(directory):
-        os.makedirs(directory)
+    # 保存到当前请求的临时目录，发送完成后自动删除
+    directory = TmpDir().path()
 
     # 下载图片
     pic_res = requests.get(url, stream=True)
@@ -63,11 +62,8 @@ def download_and_compress_image(url, filename, quality=30):
 
 
 def download_video(url, filename):
-    # 确定保存视频的目录
-    directory = os.path.join(os.getcwd(), "tmp")
-    # 如果目录不存在，则创建目录
-    if not os.path.exists(directory):
-        os.makedirs(directory)
+    # 保存到当前请求的临时目录，发送完成后自动删除
+    directory = TmpDir().path()
 
     # 下载视频
     response = requests.get(url, stream=True)
@@ -178,6 +174,9 @@ class WeworkChannel(ChatChannel):
 
     def __init__(self):
         super().__init__()
+        ContactDirectory().register_loader(
+            "wework", KIND_GROUP, lambda: [(room.get("conversation_id"), room.get("nickname")) for room in wework.get_rooms().get("room_list", [])]
+        )
 
     def startup(self):
         smart = conf().get("wework_smart", True)
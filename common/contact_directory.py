@@ -0,0 +1,164 @@
+"""
+通道无关的联系人目录缓存，维护 名称 -> id 和 id -> 名称 两个索引
+
+按名称查找群/好友时不再每次遍历通道的完整联系人列表:
+- 各通道通过register_loader注册全量拉取函数，首次查询、缓存过期(contact_directory_ttl)时拉取一次
+- 收到消息、联系人变化时通过update/remove增量更新，重新登录导致id变化时通过invalidate清空
+- 按名称查找未命中时才会再次全量拉取，同一通道两次拉取的间隔不小于contact_directory_min_refresh
+"""
+import threading
+import time
+
+from common import metrics_server
+from common.log import logger
+from common.singleton import singleton
+from config import conf
+
+KIND_GROUP = "group"
+KIND_FRIEND = "friend"
+
+
+class _Book:
+    """某个通道某类联系人的索引"""
+
+    def __init__(self):
+        self.name_to_id = {}
+        self.id_to_name = {}
+        self.loaded_at = 0  # 上次全量拉取成功的时间，0表示未拉取
+        self.attempted_at = 0  # 上次尝试全量拉取的时间
+        self.refresh_lock = threading.Lock()  # 同一时间只有一个线程拉取
+
+
+@singleton
+class ContactDirectory:
+    def __init__(self):
+        self.ttl = conf().get("contact_directory_ttl", 3600)
+        self.min_refresh = conf().get("contact_directory_min_refresh", 60)
+        self.lock = threading.Lock()
+        self.loaders = {}  # (channel_type, kind) -> 无参函数，返回 (id, 名称) 的可迭代对象
+        self.books = {}  # (channel_type, kind) -> _Book
+        self.hits = self.misses = self.refreshes = 0
+        metrics_server.register("contacts", self.stats)
+
+    def register_loader(self, channel_type, kind, loader):
+        with self.lock:
+            self.loaders[(channel_type, kind)] = loader
+            self.books.pop((channel_type, kind), None)
+
+    def has_loader(self, channel_type, kind) -> bool:
+        return (channel_type, kind) in self.loaders
+
+    def _book(self, channel_type, kind) -> _Book:
+        key = (channel_type, kind)
+        book = self.books.get(key)
+        if book is None:
+            book = self.books.setdefault(key, _Book())
+        return book
+
+    def update(self, channel_type, kind, contact_id, name):
+        """增量更新一个联系人，名称变化时同时移除旧名称的索引"""
+        if not contact_id or not name:
+            return
+        with self.lock:
+            book = self._book(channel_type, kind)
+            old_name = book.id_to_name.get(contact_id)
+            if old_name == name and book.name_to_id.get(name) == contact_id:
+                return
+            if old_name is not None and book.name_to_id.get(old_name) == contact_id:
+                del book.name_to_id[old_name]
+            book.id_to_name[contact_id] = name
+            book.name_to_id[name] = contact_id
+
+    def remove(self, channel_type, kind, contact_id):
+        with self.lock:
+            book = self._book(channel_type, kind)
+            name = book.id_to_name.pop(contact_id, None)
+            if name is not None and book.name_to_id.get(name) == contact_id:
+                del book.name_to_id[name]
+
+    def invalidate(self, channel_type=None):
+        """清空缓存，下次查询时重新拉取，如重新登录后id发生变化"""
+        with self.lock:
+            for key in list(self.books):
+                if channel_type is None or key[0] == channel_type:
+                    del self.books[key]
+
+    def get_id(self, channel_type, kind, name):
+        """按名称查找id，找不到返回None"""
+        return self._lookup(channel_type, kind, name, by_name=True)
+
+    def get_name(self, channel_type, kind, contact_id):
+        """按id查找名称，找不到返回None"""
+        return self._lookup(channel_type, kind, contact_id, by_name=False)
+
+    def _lookup(self, channel_type, kind, value, by_name):
+        if not value:
+            return None
+        book = self._fresh_book(channel_type, kind)
+        result = self._get(book, value, by_name)
+        if result is None and self._can_refresh(book):
+            # 可能是新加入的群或新好友，重新拉取一次
+            book = self._refresh(channel_type, kind, book)
+            result = self._get(book, value, by_name)
+        with self.lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def _get(self, book, value, by_name):
+        with self.lock:
+            return book.name_to_id.get(value) if by_name else book.id_to_name.get(value)
+
+    def _fresh_book(self, channel_type, kind) -> _Book:
+        with self.lock:
+            book = self._book(channel_type, kind)
+        if book.loaded_at and time.monotonic() - book.loaded_at < self.ttl:
+            return book
+        if book.attempted_at and time.monotonic() - book.attempted_at < self.min_refresh:
+            return book
+        return self._refresh(channel_type, kind, book)
+
+    def _can_refresh(self, book) -> bool:
+        return time.monotonic() - book.attempted_at >= self.min_refresh
+
+    def _refresh(self, channel_type, kind, book) -> _Book:
+        loader = self.loaders.get((channel_type, kind))
+        if loader is None:
+            return book
+        with book.refresh_lock:
+            # 等待锁期间其他线程可能已经拉取过了
+            if book.attempted_at and time.monotonic() - book.attempted_at < self.min_refresh:
+                return book
+            book.attempted_at = time.monotonic()
+            try:
+                contacts = list(loader() or [])
+            except Exception as e:
+                logger.warning("[ContactDirectory] load {} {} failed: {}".format(channel_type, kind, e))
+                return book
+            name_to_id = {}
+            id_to_name = {}
+            for contact_id, name in contacts:
+                if not contact_id:
+                    continue
+                id_to_name[contact_id] = name
+                if name:
+                    # 重名时与原来遍历列表的行为一致，取第一个
+                    name_to_id.setdefault(name, contact_id)
+            with self.lock:
+                book.name_to_id = name_to_id
+                book.id_to_name = id_to_name
+                book.loaded_at = time.monotonic()
+                self.refreshes += 1
+        logger.debug("[ContactDirectory] loaded {} {} contacts of {}".format(len(id_to_name), kind, channel_type))
+        return book
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "books": {"{}:{}".format(*key): len(book.id_to_name) for key, book in self.books.items()},
+                "hits": self.hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+            }
@@ -1,22 +1,47 @@
-from datetime import datetime, timedelta
+import threading
+import time
+import weakref
+from collections import OrderedDict
 
 
-class ExpiredDict(dict):
-    def __init__(self, expires_in_seconds):
+class ExpiredDict(OrderedDict):
+    """
+    带过期时间的字典，每次读写都会刷新key的过期时间
+    所有key的过期时长相同，因此按最后访问时间排序的顺序就是过期顺序，过期的key总在队首，清理时从队首弹出即可，读写均为O(1)
+    max_size大于0时，超出容量会淘汰最久未访问的key(LRU)
+    """
+
+    def __init__(self, expires_in_seconds, max_size=0):
         super().__init__()
         self.expires_in_seconds = expires_in_seconds
+        self.max_size = max_size
+        self.lock = threading.RLock()
+        _sweeper.register(self)
 
     def __getitem__(self, key):
-        value, expiry_time = super().__getitem__(key)
-        if datetime.now() > expiry_time:
-            del self[key]
-            raise KeyError("expired {}".format(key))
-        self.__setitem__(key, value)
-        return value
+        with self.lock:
+            value, expiry_time = super().__getitem__(key)
+            now = time.monotonic()
+            if now > expiry_time:
+                super().__delitem__(key)
+                raise KeyError("expired {}".format(key))
+            super().__setitem__(key, (value, now + self.expires_in_seconds))
+            self.move_to_end(key)
+            return value
 
     def __setitem__(self, key, value):
-        expiry_time = datetime.now() + timedelta(seconds=self.expires_in_seconds)
-        super().__setitem__(key, (value, expiry_time))
+        with self.lock:
+            now = time.monotonic()
+            super().__setitem__(key, (value, now + self.expires_in_seconds))
+            self.move_to_end(key)
+            self._sweep(now)
+            if self.max_size > 0:
+                while super().__len__() > self.max_size:
+                    self.popitem(last=False)
+
+    def __delitem__(self, key):
+        with self.lock:
+            super().__delitem__(key)
 
     def get(self, key, default=None):
         try:
@@ -25,18 +50,129 @@ class ExpiredDict(dict):
             return default
 
     def __contains__(self, key):
-        try:
-            self[key]
+        # 只判断是否存在，不刷新过期时间
+        with self.lock:
+            if not super().__contains__(key):
+                return False
+            _, expiry_time = super().__getitem__(key)
+            if time.monotonic() > expiry_time:
+                super().__delitem__(key)
+                return False
             return True
-        except KeyError:
-            return False
+
+    def pop(self, key, *args):
+        with self.lock:
+            if key not in self:
+                if args:
+                    return args[0]
+                raise KeyError(key)
+            value, _ = super().pop(key)
+            return value
+
+    def setdefault(self, key, default=None):
+        with self.lock:
+            if key not in self:
+                self[key] = default
+            return self[key]
+
+    def popitem(self, last=True):
+        with self.lock:
+            key, (value, _) = super().popitem(last=last)
+            return key, value
+
+    def _sweep(self, now=None):
+        # 从队首开始清理，遇到第一个未过期的key即停止
+        now = now or time.monotonic()
+        while super().__len__() > 0:
+            key = next(super().__iter__())
+            _, expiry_time = super().__getitem__(key)
+            if expiry_time > now:
+                break
+            super().__delitem__(key)
+
+    def sweep(self):
+        """清理所有已过期的key"""
+        with self.lock:
+            self._sweep()
+
+    def __len__(self):
+        with self.lock:
+            self._sweep()
+            return super().__len__()
 
     def keys(self):
-        keys = list(super().keys())
-        return [key for key in keys if key in self]
+        with self.lock:
+            self._sweep()
+            return list(super().keys())
+
+    def values(self):
+        with self.lock:
+            self._sweep()
+            return [value for value, _ in super().values()]
 
     def items(self):
-        return [(key, self[key]) for key in self.keys()]
+        with self.lock:
+            self._sweep()
+            return [(key, value) for key, (value, _) in super().items()]
 
     def __iter__(self):
         return self.keys().__iter__()
+
+    def __repr__(self):
+        return "{}({}, expires_in_seconds={})".format(type(self).__name__, dict(self.items()), self.expires_in_seconds)
+
+
+class _Sweeper:
+    """后台清理线程，定期清理所有ExpiredDict中没有再被访问的过期key，所有实例共用一个线程"""
+
+    def __init__(self, interval=60):
+        self.interval = interval
+        self.refs = []  # dict不可哈希，不能用WeakSet，这里保存弱引用列表
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def register(self, expired_dict):
+        with self.lock:
+            self.refs.append(weakref.ref(expired_dict))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="expired-dict-sweeper", daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                self.refs = [ref for ref in self.refs if ref() is not None]
+                refs = list(self.refs)
+            for ref in refs:
+                d = ref()
+                if d is not None:
+                    d.sweep()
+
+
+_sweeper = _Sweeper()
+
+
+if __name__ == "__main__":
+    # 微基准测试: 10万个key的读、写、遍历耗时
+    n = 100000
+    d = ExpiredDict(3600)
+    start = time.perf_counter()
+    for i in range(n):
+        d[i] = i
+    print("set {} keys: {:.1f} ms".format(n, (time.perf_counter() - start) * 1000))
+    start = time.perf_counter()
+    for i in range(n):
+        d[i]
+    print("get {} keys: {:.1f} ms".format(n, (time.perf_counter() - start) * 1000))
+    start = time.perf_counter()
+    for i in range(n):
+        i in d
+    print("contains {} keys: {:.1f} ms".format(n, (time.perf_counter() - start) * 1000))
+    start = time.perf_counter()
+    items = d.items()
+    print("items of {} keys: {:.1f} ms".format(len(items), (time.perf_counter() - start) * 1000))
+    d = ExpiredDict(3600, max_size=1000)
+    for i in range(n):
+        d[i] = i
+    print("lru capped size: {}".format(len(d)))
@@ -0,0 +1,161 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Full
+
+from common import metrics_server
+from common.log import logger
+from config import conf
+
+LANE_FAST = "fast"  # 管理命令、插件指令等不需要调用大模型的轻量任务
+LANE_LLM = "llm"  # 需要调用大模型的文本对话
+LANE_MEDIA = "media"  # 语音、图片、文件等媒体处理
+
+# lane名称 -> (线程数配置项, 默认线程数)
+LANE_SETTINGS = {
+    LANE_FAST: ("handler_pool_fast_workers", 4),
+    LANE_LLM: ("handler_pool_llm_workers", 8),
+    LANE_MEDIA: ("handler_pool_media_workers", 4),
+}
+
+
+class HandlerLane:
+    """
+    一条独立的处理通道，内部是一个线程池，排队任务数有上限，超出上限时拒绝提交并登记回调，腾出空位时再通知提交方重试
+    """
+
+    def __init__(self, name, max_workers, max_queue):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue  # 排队(未开始执行)任务数上限，<=0表示不限制
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="handler-{}".format(name))
+        self.lock = threading.Lock()
+        self.waiters = deque()  # 因队列已满被拒绝的提交方回调
+        self.pending = 0
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.run_time_total = 0.0
+        self.run_time_max = 0.0
+
+    def submit(self, fn, *args, retry_callback=None, **kwargs) -> Future:
+        """
+        提交任务，队列已满时抛出queue.Full，并在有空位时调用retry_callback
+        """
+        with self.lock:
+            if 0 < self.max_queue <= self.pending:
+                self.rejected += 1
+                if retry_callback:
+                    self.waiters.append(retry_callback)
+                raise Full("handler lane {} is full".format(self.name))
+            self.pending += 1
+            self.submitted += 1
+        enqueue_time = time.monotonic()
+
+        def run():
+            start_time = time.monotonic()
+            self._on_start(start_time - enqueue_time)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._on_finish(time.monotonic() - start_time)
+
+        future = self.executor.submit(run)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_start(self, wait_time):
+        with self.lock:
+            self.pending -= 1
+            self.running += 1
+            self.wait_time_total += wait_time
+            self.wait_time_max = max(self.wait_time_max, wait_time)
+            waiter = self.waiters.popleft() if self.waiters else None
+        if waiter:
+            waiter()
+
+    def _on_finish(self, run_time):
+        with self.lock:
+            self.running -= 1
+            self.completed += 1
+            self.run_time_total += run_time
+            self.run_time_max = max(self.run_time_max, run_time)
+
+    def _on_done(self, future: Future):
+        if not future.cancelled():
+            return
+        # 被取消的任务不会执行run，需要在这里归还排队名额
+        with self.lock:
+            self.pending -= 1
+            waiter = self.waiters.popleft() if self.waiters else None
+        if waiter:
+            waiter()
+
+    def stats(self) -> dict:
+        with self.lock:
+            started = self.submitted - self.pending
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self.pending,
+                "running": self.running,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait_time": self.wait_time_total / started if started else 0.0,
+                "max_wait_time": self.wait_time_max,
+                "avg_run_time": self.run_time_total / self.completed if self.completed else 0.0,
+                "max_run_time": self.run_time_max,
+            }
+
+
+class HandlerPool:
+    """
+    消息处理线程池，按任务类型划分为fast/llm/media三条互不阻塞的通道，线程数和排队上限由配置决定
+    """
+
+    def __init__(self):
+        self.lanes = {}
+        self.initializer = None
+        self.lock = threading.Lock()
+        metrics_server.register("handler_pool", self.stats)
+
+    def lane(self, name) -> HandlerLane:
+        if name not in LANE_SETTINGS:
+            name = LANE_LLM
+        with self.lock:
+            if name not in self.lanes:
+                workers_key, default_workers = LANE_SETTINGS[name]
+                max_workers = max(1, int(conf().get(workers_key, default_workers)))
+                max_queue = int(conf().get("handler_pool_queue_size", 100))
+                lane = HandlerLane(name, max_workers, max_queue)
+                if self.initializer:
+                    lane.executor._initializer = self.initializer
+                self.lanes[name] = lane
+                logger.info("[HandlerPool] lane {} started, workers={}, max_queue={}".format(name, max_workers, max_queue))
+            return self.lanes[name]
+
+    def submit(self, lane_name, fn, *args, **kwargs) -> Future:
+        return self.lane(lane_name).submit(fn, *args, **kwargs)
+
+    def set_initializer(self, initializer):
+        """设置工作线程的初始化函数，对已创建和之后创建的通道都生效"""
+        with self.lock:
+            self.initializer = initializer
+            for lane in self.lanes.values():
+                lane.executor._initializer = initializer
+
+    def revive(self):
+        """itchat重新登录后恢复线程池，使其可以继续接收任务"""
+        with self.lock:
+            for lane in self.lanes.values():
+                lane.executor._shutdown = False
+
+    def stats(self) -> dict:
+        with self.lock:
+            lanes = list(self.lanes.values())
+        return {lane.name: lane.stats() for lane in lanes}
@@ -0,0 +1,176 @@
+"""
+共享的HTTP客户端，所有bot、channel、插件的出站请求复用同一组按host划分的长连接池，避免每次请求都重新建立TCP+TLS连接
+
+用法与requests一致:
+    from common import http_client
+    res = http_client.post(url, json=body, headers=headers, timeout=(5, 10))
+"""
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common.log import logger
+from config import conf
+
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+_session = None
+_http2_client = None
+_lock = threading.Lock()
+
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=conf().get("http_pool_connections", 20),  # 最多缓存多少个host的连接池
+        pool_maxsize=conf().get("http_pool_maxsize", 20),  # 每个host最多保持多少个长连接
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _build_http2_client():
+    try:
+        import httpx
+
+        return httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_connections=conf().get("http_pool_maxsize", 20) * conf().get("http_pool_connections", 20)),
+        )
+    except Exception as e:
+        logger.warning("[HttpClient] http2 is not available, fallback to http/1.1: {}".format(e))
+        return None
+
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def _get_http2_client():
+    global _http2_client
+    if _http2_client is None:
+        with _lock:
+            if _http2_client is None:
+                _http2_client = _build_http2_client() or False
+    return _http2_client or None
+
+
+def _can_use_http2(kwargs):
+    # httpx不支持的requests参数，走http/1.1
+    return conf().get("http_client_http2", False) and not any(k in kwargs for k in ("stream", "proxies", "verify", "cert", "files", "allow_redirects"))
+
+
+class _Http2Response:
+    """包装httpx.Response，使调用方可以按requests.Response的方式使用，其余属性透传给httpx.Response"""
+
+    def __init__(self, response):
+        self._response = response
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    @property
+    def url(self):
+        return str(self._response.url)
+
+    @property
+    def reason(self):
+        return self._response.reason_phrase
+
+    @property
+    def ok(self):
+        return self._response.status_code < 400
+
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        if decode_unicode:
+            return self._response.iter_text(chunk_size)
+        return self._response.iter_bytes(chunk_size)
+
+    def raise_for_status(self):
+        status_code = self._response.status_code
+        if 400 <= status_code < 600:
+            kind = "Client" if status_code < 500 else "Server"
+            raise requests.exceptions.HTTPError("{} {} Error: {} for url: {}".format(status_code, kind, self.reason, self.url), response=self)
+
+
+def _send(method, url, **kwargs):
+    if _can_use_http2(kwargs):
+        client = _get_http2_client()
+        if client:
+            import httpx
+
+            timeout = kwargs.pop("timeout", None)
+            if isinstance(timeout, tuple):
+                timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+            data = kwargs.pop("data", None)
+            if isinstance(data, (bytes, str)):
+                kwargs["content"] = data
+            elif data is not None:
+                kwargs["data"] = data
+            try:
+                return _Http2Response(client.request(method, url, timeout=timeout, follow_redirects=True, **kwargs))
+            except httpx.ConnectTimeout as e:
+                raise requests.exceptions.ConnectTimeout(str(e))
+            except httpx.ReadTimeout as e:
+                raise requests.exceptions.ReadTimeout(str(e))
+            except httpx.TimeoutException as e:
+                raise requests.exceptions.Timeout(str(e))
+            except httpx.TransportError as e:
+                raise requests.exceptions.ConnectionError(str(e))
+    return get_session().request(method, url, **kwargs)
+
+
+def request(method, url, retries=None, **kwargs):
+    """
+    发送请求，参数同requests.request
+    :param retries: 重试次数，默认取配置http_client_retries
+        GET等幂等请求在连接失败或返回429/502/503/504时重试；POST等请求只在连接超时或返回429时重试，避免重复提交
+        上传文件(files)的请求不重试，文件对象在第一次发送时已被读完
+    """
+    if "timeout" not in kwargs:
+        kwargs["timeout"] = conf().get("http_client_timeout", 60)
+    if retries is None:
+        retries = conf().get("http_client_retries", 2)
+    if kwargs.get("files"):
+        retries = 0
+    backoff = conf().get("http_client_backoff", 0.5)
+    idempotent = method.upper() in IDEMPOTENT_METHODS
+    retry_status_codes = RETRY_STATUS_CODES if idempotent else (429,)
+    retry_exceptions = requests.exceptions.ConnectionError if idempotent else requests.exceptions.ConnectTimeout
+    for attempt in range(retries + 1):
+        try:
+            response = _send(method, url, **kwargs)
+            if response.status_code not in retry_status_codes or attempt == retries:
+                return response
+            logger.warning("[HttpClient] {} {} got status {}, retry {}/{}".format(method, url, response.status_code, attempt + 1, retries))
+        except retry_exceptions as e:
+            if attempt == retries:
+                raise e
+            logger.warning("[HttpClient] {} {} connection error: {}, retry {}/{}".format(method, url, e, attempt + 1, retries))
+        time.sleep(backoff * (2**attempt) * random.uniform(0.5, 1.5))  # 指数退避加随机抖动，避免大量请求同时重试
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def put(url, **kwargs):
+    return request("PUT", url, **kwargs)
+
+
+def delete(url, **kwargs):
+    return request("DELETE", url, **kwargs)
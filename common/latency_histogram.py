@@ -0,0 +1,51 @@
+import bisect
+import math
+
+# 桶边界(秒)，从0.05ms开始按1.2倍递增到约5分钟，相对误差不超过20%
+_BOUNDARIES = [0.00005 * 1.2**i for i in range(int(math.log(300 / 0.00005, 1.2)) + 2)]
+
+
+class LatencyHistogram:
+    """
+    固定对数分桶的耗时直方图，记录一次只需一次二分查找和一次计数，内存占用固定，可估算任意分位数
+    非线程安全，由调用方加锁
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(_BOUNDARIES) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(_BOUNDARIES, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """估算分位数(秒)，取所在桶的上边界，不超过记录到的最大值"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * p / 100))
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                if index >= len(_BOUNDARIES):
+                    return self.max
+                return min(_BOUNDARIES[index], self.max)
+        return self.max
+
+    def snapshot(self) -> dict:
+        """单位毫秒"""
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50) * 1000, 2),
+            "p95_ms": round(self.percentile(95) * 1000, 2),
+            "p99_ms": round(self.percentile(99) * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+            "total_ms": round(self.total * 1000, 2),
+        }
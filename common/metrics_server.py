@@ -0,0 +1,70 @@
+"""
+以JSON格式对外暴露运行指标，便于监控系统定时抓取
+
+    GET /metrics           所有指标
+    GET /metrics/<name>    指定名称的指标，如 /metrics/plugins
+
+各模块通过register注册指标函数，配置metrics_port后启动服务
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common.log import logger
+
+_providers = {}
+_server = None
+_lock = threading.Lock()
+
+
+def register(name, provider):
+    """注册指标，provider为无参函数，返回可JSON序列化的数据"""
+    _providers[name] = provider
+
+
+def collect(name=None) -> dict:
+    names = [name] if name else list(_providers)
+    result = {}
+    for n in names:
+        try:
+            result[n] = _providers[n]()
+        except Exception as e:
+            result[n] = {"error": str(e)}
+    return result
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path == "/metrics":
+            self._send(200, collect())
+        elif path.startswith("/metrics/") and path[len("/metrics/") :] in _providers:
+            self._send(200, collect(path[len("/metrics/") :]))
+        else:
+            self._send(404, {"error": "not found"})
+
+    def _send(self, status, data):
+        body = json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("[Metrics] " + format % args)
+
+
+def start(port, host="127.0.0.1"):
+    global _server
+    with _lock:
+        if _server is not None:
+            return
+        try:
+            _server = ThreadingHTTPServer((host, port), _Handler)
+        except OSError as e:
+            logger.error("[Metrics] start metrics server on {}:{} failed: {}".format(host, port, e))
+            return
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        logger.info("[Metrics] metrics server started at http://{}:{}/metrics".format(host, port))
@@ -1,13 +1,31 @@
 import os
 import pathlib
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 
+from common import metrics_server
+from common.log import logger
+from common.singleton import singleton
 from config import conf
 
+REQUESTS_DIR = "requests"
+# 最近修改过的文件可能正在使用，超出容量时也不删除
+PROTECT_SECONDS = 300
+
 
 class TmpDir(object):
-    """A temporary directory that is deleted when the object is destroyed."""
+    """
+    临时目录
+
+    在request_scope中(ChatChannel处理一条消息期间)，path()返回该请求独立的子目录，请求处理完成后整个子目录被删除；
+    其他情况返回tmp目录本身，其中的文件由ScratchSpace的清理线程按时间和容量清理
+    """
 
     tmpFilePath = pathlib.Path("./tmp/")
+    _local = threading.local()
 
     def __init__(self):
         pathExists = os.path.exists(self.tmpFilePath)
@@ -15,4 +33,191 @@ class TmpDir(object):
             os.makedirs(self.tmpFilePath)
 
     def path(self):
+        handle = getattr(self._local, "handle", None)
+        if handle is not None:
+            return handle.path()
         return str(self.tmpFilePath) + "/"
+
+    @contextmanager
+    def request_scope(self):
+        handle = ScratchSpace().acquire()
+        previous = getattr(self._local, "handle", None)
+        self._local.handle = handle
+        try:
+            yield handle
+        finally:
+            self._local.handle = previous
+            handle.release()
+
+
+class ScratchHandle:
+    """一个请求的临时子目录，引用计数归零后交给清理线程删除"""
+
+    def __init__(self, space, dir_path):
+        self.space = space
+        self.dir_path = dir_path
+        self.refs = 1
+
+    def path(self):
+        return self.dir_path + "/"
+
+    def retain(self):
+        with self.space.lock:
+            self.refs += 1
+        return self
+
+    def release(self):
+        with self.space.lock:
+            self.refs -= 1
+            if self.refs > 0:
+                return
+            self.space.handles.pop(self.dir_path, None)
+            self.space.pending.append(self.dir_path)
+        self.space.wakeup.set()
+
+
+@singleton
+class ScratchSpace:
+    def __init__(self):
+        TmpDir()
+        self.root = os.path.abspath(str(TmpDir.tmpFilePath))
+        self.requests_root = os.path.join(self.root, REQUESTS_DIR)
+        os.makedirs(self.requests_root, exist_ok=True)
+        self.max_age = conf().get("tmp_max_age", 3600)
+        self.max_size = conf().get("tmp_max_size", 1024) * 1024 * 1024
+        self.interval = conf().get("tmp_janitor_interval", 300)
+        self.lock = threading.Lock()
+        self.handles = {}  # 子目录路径 -> ScratchHandle
+        self.pins = {}  # 请求子目录以外被引用的文件路径 -> 引用数
+        self.pending = []  # 等待删除的子目录
+        self.wakeup = threading.Event()
+        self.counters = {
+            "requests_acquired": 0,
+            "request_bytes_written": 0,
+            "bytes_reclaimed": 0,
+            "files_reclaimed": 0,
+            "usage_bytes": 0,
+            "usage_files": 0,
+            "last_scan": None,
+        }
+        metrics_server.register("tmp", self.stats)
+        threading.Thread(target=self._janitor_loop, name="tmp-janitor", daemon=True).start()
+
+    def acquire(self) -> ScratchHandle:
+        dir_path = os.path.join(self.requests_root, uuid.uuid4().hex)
+        os.makedirs(dir_path)
+        handle = ScratchHandle(self, dir_path)
+        with self.lock:
+            self.handles[dir_path] = handle
+            self.counters["requests_acquired"] += 1
+        return handle
+
+    def retain(self, file_path):
+        """
+        文件在请求结束后仍需使用(如等待gewechat下载)时引用它，返回释放引用的函数
+        请求子目录中的文件引用整个子目录，其他文件在引用期间不会被清理线程删除
+        """
+        file_path = os.path.abspath(file_path)
+        with self.lock:
+            handle = self.handles.get(os.path.dirname(file_path))
+            if handle is not None:
+                handle.refs += 1
+                return handle.release
+            self.pins[file_path] = self.pins.get(file_path, 0) + 1
+
+        def unpin():
+            with self.lock:
+                count = self.pins.pop(file_path, 1) - 1
+                if count > 0:
+                    self.pins[file_path] = count
+
+        return unpin
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(self.counters, requests_active=len(self.handles), pending=len(self.pending))
+
+    def _janitor_loop(self):
+        next_scan = time.time() + self.interval
+        while True:
+            self.wakeup.wait(max(0, next_scan - time.time()))
+            self.wakeup.clear()
+            try:
+                self._remove_pending()
+                if time.time() >= next_scan:
+                    self.scan()
+                    next_scan = time.time() + self.interval
+            except Exception as e:
+                logger.exception(f"[TmpDir] janitor error: {e}")
+
+    def _remove_pending(self):
+        with self.lock:
+            pending, self.pending = self.pending, []
+        for dir_path in pending:
+            size, count = _tree_size(dir_path)
+            shutil.rmtree(dir_path, ignore_errors=True)
+            with self.lock:
+                self.counters["request_bytes_written"] += size
+                self._reclaimed(size, count)
+
+    def _reclaimed(self, size, count):
+        self.counters["bytes_reclaimed"] += size
+        self.counters["files_reclaimed"] += count
+
+    def scan(self):
+        """删除超过tmp_max_age的文件，总大小超过tmp_max_size时从最旧的文件开始删除"""
+        now = time.time()
+        entries = []  # (修改时间, 路径, 大小, 文件数)
+        for base in (self.root, self.requests_root):
+            for entry in os.scandir(base):
+                if entry.path == self.requests_root:
+                    continue
+                try:
+                    mtime = entry.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    size, count = _tree_size(entry.path)
+                else:
+                    size, count = entry.stat().st_size, 1
+                entries.append((mtime, entry.path, size, count))
+        entries.sort()
+        with self.lock:
+            in_use = set(self.handles) | set(self.pins)
+        total = sum(entry[2] for entry in entries)
+        removed_size = removed_count = 0
+        for mtime, path, size, count in entries:
+            if path in in_use or now - mtime < PROTECT_SECONDS:
+                continue
+            if now - mtime < self.max_age and total <= self.max_size:
+                continue
+            try:
+                if os.path.isdir(path) and not os.path.islink(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except OSError as e:
+                logger.warning(f"[TmpDir] remove {path} failed: {e}")
+                continue
+            total -= size
+            removed_size += size
+            removed_count += count
+        with self.lock:
+            self._reclaimed(removed_size, removed_count)
+            self.counters["usage_bytes"] = total
+            self.counters["usage_files"] = sum(entry[3] for entry in entries) - removed_count
+            self.counters["last_scan"] = int(now)
+        if removed_count:
+            logger.info(f"[TmpDir] reclaimed {removed_count} files, {removed_size} bytes, usage {total} bytes")
+
+
+def _tree_size(path):
+    size = count = 0
+    for dir_path, _, file_names in os.walk(path):
+        for name in file_names:
+            try:
+                size += os.path.getsize(os.path.join(dir_path, name))
+                count += 1
+            except OSError:
+                pass
+    return size, count
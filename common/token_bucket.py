@@ -1,39 +1,75 @@
+import asyncio
 import threading
 import time
+from collections import OrderedDict
 
 
 class TokenBucket:
-    def __init__(self, tpm, timeout=None):
+    """
+    令牌桶限流，获取令牌时根据距上次补充经过的时间计算可用令牌数，不需要单独的令牌生成线程
+    支持按key(用户、群、api key等)分别限流，每个key一个桶，超过max_keys时淘汰最久未使用的桶
+    """
+
+    def __init__(self, tpm, timeout=None, max_keys=10000):
         self.capacity = int(tpm)  # 令牌桶容量
-        self.tokens = 0  # 初始令牌数为0
         self.rate = int(tpm) / 60  # 令牌每秒生成速率
         self.timeout = timeout  # 等待令牌超时时间
-        self.cond = threading.Condition()  # 条件变量
-        self.is_running = True
-        # 开启令牌生成线程
-        threading.Thread(target=self._generate_tokens).start()
-
-    def _generate_tokens(self):
-        """生成令牌"""
-        while self.is_running:
-            with self.cond:
-                if self.tokens < self.capacity:
-                    self.tokens += 1
-                self.cond.notify()  # 通知获取令牌的线程
-            time.sleep(1 / self.rate)
-
-    def get_token(self):
-        """获取令牌"""
-        with self.cond:
-            while self.tokens <= 0:
-                flag = self.cond.wait(self.timeout)
-                if not flag:  # 超时
+        self.max_keys = max_keys  # 最多保留多少个key的桶
+        self.buckets = OrderedDict()  # key -> [剩余令牌数, 上次补充时间]
+        self.lock = threading.Lock()
+
+    def _take(self, key):
+        """尝试取一个令牌，成功返回0，否则返回还需等待的秒数"""
+        with self.lock:
+            now = time.monotonic()
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = [self.capacity, now]  # 新的桶是满的
+                self.buckets[key] = bucket
+                while len(self.buckets) > self.max_keys:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end(key)
+                bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            return (1 - bucket[0]) / self.rate
+
+    def get_token(self, key=None):
+        """获取令牌，等待超时返回False"""
+        if self.rate <= 0:
+            return False
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while True:
+            wait = self._take(key)
+            if wait <= 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining < wait:  # 超时前等不到令牌
+                    return False
+            time.sleep(wait)
+
+    async def acquire(self, key=None):
+        """get_token的异步版本"""
+        if self.rate <= 0:
+            return False
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while True:
+            wait = self._take(key)
+            if wait <= 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining < wait:
                     return False
-            self.tokens -= 1
-        return True
+            await asyncio.sleep(wait)
 
     def close(self):
-        self.is_running = False
+        """兼容旧接口，已没有需要停止的线程"""
+        pass
 
 
 if __name__ == "__main__":
@@ -42,4 +78,7 @@ if __name__ == "__main__":
     for i in range(3):
         if token_bucket.get_token():
             print(f"第{i+1}次请求成功")
+    per_user_bucket = TokenBucket(2, 0.1)  # 每个用户每分钟2次
+    for user in ["user1", "user1", "user1", "user2"]:
+        print(f"{user}请求{'成功' if per_user_bucket.get_token(user) else '被限流'}")
     token_bucket.close()
@@ -56,12 +56,23 @@ available_setting = {
     "image_proxy": True,  # 是否需要图片代理，国内访问LinkAI时需要
     "image_create_prefix": ["画", "看", "找"],  # 开启图片回复的前缀
     "concurrency_in_session": 1,  # 同一会话最多有多少条消息在处理中，大于1可能乱序
+    "stream_reply": False,  # 是否流式回复，开启后支持的bot边生成边按段落或句子发送，钉钉卡片模式下实时更新卡片(有插件处理回复时，接收完整后再发送)
+    "stream_reply_min_chars": 50,  # 流式回复每段最少字符数
+    # 消息处理线程池配置，fast处理管理命令和插件指令，llm处理大模型对话，media处理语音图片等
+    "handler_pool_fast_workers": 4,  # fast通道线程数
+    "handler_pool_llm_workers": 8,  # llm通道线程数
+    "handler_pool_media_workers": 4,  # media通道线程数
+    "handler_pool_queue_size": 100,  # 每个通道最多排队的消息数，超出后消息留在会话队列中等待，<=0表示不限制
     "image_create_size": "256x256",  # 图片大小,可选有 256x256, 512x512, 1024x1024 (dall-e-3默认为1024x1024)
     "group_chat_exit_group": False,
     "group_exit_msg": "",  # 退出群聊的消息
     "accept_friend_msg": "",  # 接受好友请求后发送的消息
     # chatgpt会话参数
     "expires_in_seconds": 3600,  # 无操作会话的过期时间
+    "session_store": "memory",  # 会话存储方式，memory为内存(重启后丢失)，sqlite为持久化到数据目录，重启后可恢复上下文
+    "session_store_shards": 4,  # sqlite会话存储的分片文件数
+    "session_store_hot_size": 1000,  # sqlite会话存储在内存中缓存的会话数
+    "session_store_flush_interval": 2,  # sqlite会话存储批量写回的间隔，单位秒
     # 人格描述
     "character_desc": "你是ChatGPT, 一个由OpenAI训练的大型语言模型, 你旨在回答并解决人们的任何问题，并且可以使用多种语言与人交流。",
     "conversation_max_tokens": 1000,  # 支持上下文记忆的最多字符数
@@ -123,6 +134,9 @@ available_setting = {
     "text_to_voice": "openai",  # 语音合成引擎，支持openai,baidu,google,azure,xunfei,ali,pytts(offline),elevenlabs,edge(online)
     "text_to_voice_model": "tts-1",
     "tts_voice_id": "alloy",
+    "tts_cache": True,  # 是否缓存语音合成结果，相同文本直接使用缓存的语音文件
+    "tts_cache_variants": True,  # 是否同时缓存转换后的silk/amr等格式，跳过重复的格式转换
+    "tts_cache_max_size": 200,  # 语音缓存容量上限(MB)，超出时淘汰最久未使用的文件
     # baidu 语音api配置， 使用百度语音识别和语音合成时需要
     "baidu_app_id": "",
     "baidu_api_key": "",
@@ -180,6 +194,13 @@ available_setting = {
     "gewechat_token": "",
     "gewechat_app_id": "",
     "gewechat_callback_url": "", # 回调地址，示例：http://172.17.0.1:9919/v2/api/callback/collect
+    "gewechat_callback_server": "aiohttp",  # 回调服务器实现，aiohttp(需安装aiohttp，未安装时自动使用web.py)或web.py
+    "gewechat_callback_workers": 4,  # 解析回调消息的线程数
+    "gewechat_callback_queue_size": 200,  # 等待解析的回调消息上限，超出后返回503让gewechat稍后重发
+    "gewechat_media_url_ttl": 600,  # 发送给gewechat的语音、图片下载链接有效期(秒)，过期后未被下载的文件会被删除
+    "gewechat_media_delete_delay": 60,  # 文件被完整下载后延迟多少秒删除，留出gewechat重试下载的时间
+    "gewechat_media_secret": "",  # 下载链接的签名密钥，为空时每次启动随机生成
+    "gewechat_contact_cache_ttl": 1800,  # 好友/群名称和群成员信息的缓存时间，单位秒，收到改名、入群等通知时会立即刷新
     
     # chatgpt指令自定义触发词
     "clear_memory_commands": ["#清除记忆"],  # 重置会话指令，必须以#开头
@@ -188,10 +209,20 @@ available_setting = {
     "subscribe_msg": "",  # 订阅消息, 支持: wechatmp, wechatmp_service, wechatcom_app
     "debug": False,  # 是否开启debug模式，开启后会打印更多日志
     "appdata_dir": "",  # 数据目录
+    "tmp_max_age": 3600,  # tmp目录中超过该时间(秒)未修改的文件会被清理
+    "tmp_max_size": 1024,  # tmp目录容量上限(MB)，超出时从最旧的文件开始清理
+    "tmp_janitor_interval": 300,  # tmp目录清理的间隔时间(秒)
+    "contact_directory_ttl": 3600,  # 群名称/好友昵称与id对应关系的缓存时间(秒)，过期后重新拉取完整的联系人列表
+    "contact_directory_min_refresh": 60,  # 按名称查找未命中时，两次重新拉取联系人列表的最小间隔(秒)
     # 插件配置
     "plugin_trigger_prefix": "$",  # 规范插件提供聊天相关指令的前缀，建议不要和管理员指令前缀"#"冲突
     # 是否使用全局插件配置
     "use_global_plugin_config": False,
+    "plugin_passive_workers": 4,  # 只读(passive)插件处理函数的后台线程数
+    "plugin_passive_queue_size": 1000,  # 只读插件处理函数最多排队的任务数，超出后在当前线程同步执行
+    "plugin_slow_threshold": 1,  # 插件处理函数耗时超过该值(秒)时打印警告日志，0表示不打印
+    "metrics_port": 0,  # 指标服务端口，开启后可通过 http://127.0.0.1:端口/metrics 获取插件耗时等JSON格式的运行指标，0表示不开启
+    "metrics_host": "127.0.0.1",  # 指标服务监听地址
     "max_media_send_count": 3,  # 单次最大发送媒体资源的个数
     "media_send_interval": 1,  # 发送图片的事件间隔，单位秒
     # 智谱AI 平台配置
@@ -208,6 +239,13 @@ available_setting = {
     "Minimax_group_id": "",
     "Minimax_base_url": "",
     "web_port": 9899,
+    # 共享HTTP客户端配置
+    "http_pool_connections": 20,  # 最多缓存多少个host的连接池
+    "http_pool_maxsize": 20,  # 每个host最多保持的长连接数
+    "http_client_timeout": 60,  # 未指定timeout时的默认超时时间，单位秒
+    "http_client_retries": 2,  # 连接失败或返回429/502/503/504时的重试次数
+    "http_client_backoff": 0.5,  # 重试退避的基础时间，单位秒
+    "http_client_http2": False,  # 是否使用http2，需要安装httpx[http2]
 }
 
 
@@ -1,4 +1,4 @@
-import requests
+from common import http_client
 
 def post_json(base_url, route, token, data):
     headers = {
@@ -10,7 +10,7 @@ def post_json(base_url, route, token, data):
     url = base_url + route
 
     try:
-        response = requests.post(url, json=data, headers=headers, timeout=60)
+        response = http_client.post(url, json=data, headers=headers, timeout=60)
         response.raise_for_status()
         result = response.json()
 
@@ -103,6 +103,8 @@ def produce_msg(core, msgList):
                 'FileName' : '%s.mp3' % time.strftime('%y%m%d-%H%M%S', time.localtime()),
                 'Text': download_fn,}
         elif m['MsgType'] == 37: # friends
+            if isinstance(m['User'], templates.ContactView): # search results are read-only
+                m['User'] = utils.contact_deep_copy(core, m['User'])
             m['User']['UserName'] = m['RecommendInfo']['UserName']
             msg = {
                 'Type': 'Friends',
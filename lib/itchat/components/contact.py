@@ -7,7 +7,7 @@ import logging
 
 from .. import config, utils
 from ..returnvalues import ReturnValue
-from ..storage import contact_change
+from ..storage import contact_change, invalidate_indexes
 from ..utils import update_info_dict
 
 logger = logging.getLogger('itchat')
@@ -182,7 +182,6 @@ def update_local_friends(core, l):
     '''
         get a list of friends or mps for updating local contact
     '''
-    fullList = core.memberList + core.mpList
     for friend in l:
         if 'NickName' in friend:
             utils.emoji_formatter(friend, 'NickName')
@@ -190,8 +189,8 @@ def update_local_friends(core, l):
             utils.emoji_formatter(friend, 'DisplayName')
         if 'RemarkName' in friend:
             utils.emoji_formatter(friend, 'RemarkName')
-        oldInfoDict = utils.search_dict_list(
-            fullList, 'UserName', friend['UserName'])
+        oldInfoDict = core.memberList.search_first('UserName', friend['UserName']) or \
+            core.mpList.search_first('UserName', friend['UserName'])
         if oldInfoDict is None:
             oldInfoDict = copy.deepcopy(friend)
             if oldInfoDict['VerifyFlag'] & 8 == 0:
@@ -224,9 +223,9 @@ def update_local_uin(core, msg):
             for uin, username in zip(uins, usernames):
                 if not '@' in username:
                     continue
-                fullContact = core.memberList + core.chatroomList + core.mpList
-                userDicts = utils.search_dict_list(fullContact,
-                                                   'UserName', username)
+                userDicts = core.memberList.search_first('UserName', username) or \
+                    core.chatroomList.search_first('UserName', username) or \
+                    core.mpList.search_first('UserName', username)
                 if userDicts:
                     if userDicts.get('Uin', 0) == 0:
                         userDicts['Uin'] = uin
@@ -356,7 +355,9 @@ def set_alias(self, userName, alias):
                     headers=headers)
     r = ReturnValue(rawResponse=r)
     if r:
-        oldFriendInfo['RemarkName'] = alias
+        with self.storageClass.updateLock:
+            oldFriendInfo['RemarkName'] = alias
+            invalidate_indexes()
     return r
 
 
@@ -4,12 +4,17 @@ from threading import Lock
 from .messagequeue import Queue
 from .templates import (
     ContactList, AbstractUserDict, User,
-    MassivePlatform, Chatroom, ChatroomMember)
+    MassivePlatform, Chatroom, ChatroomMember,
+    contact_view, invalidate_indexes, search_contacts)
 
 def contact_change(fn):
     def _contact_change(core, *args, **kwargs):
         with core.storageClass.updateLock:
-            return fn(core, *args, **kwargs)
+            try:
+                return fn(core, *args, **kwargs)
+            finally:
+                # contacts may be renamed in place by update_info_dict
+                invalidate_indexes()
     return _contact_change
 
 class Storage(object):
@@ -63,55 +68,21 @@ class Storage(object):
             wechatAccount=None):
         with self.updateLock:
             if (name or userName or remarkName or nickName or wechatAccount) is None:
-                return copy.deepcopy(self.memberList[0]) # my own account
+                return contact_view(self.memberList[0]) # my own account
             elif userName: # return the only userName match
-                for m in self.memberList:
-                    if m['UserName'] == userName:
-                        return copy.deepcopy(m)
+                return contact_view(self.memberList.search_first('UserName', userName))
             else:
-                matchDict = {
-                    'RemarkName' : remarkName,
-                    'NickName'   : nickName,
-                    'Alias'      : wechatAccount, }
-                for k in ('RemarkName', 'NickName', 'Alias'):
-                    if matchDict[k] is None:
-                        del matchDict[k]
-                if name: # select based on name
-                    contact = []
-                    for m in self.memberList:
-                        if any([m.get(k) == name for k in ('RemarkName', 'NickName', 'Alias')]):
-                            contact.append(m)
-                else:
-                    contact = self.memberList[:]
-                if matchDict: # select again based on matchDict
-                    friendList = []
-                    for m in contact:
-                        if all([m.get(k) == v for k, v in matchDict.items()]):
-                            friendList.append(m)
-                    return copy.deepcopy(friendList)
-                else:
-                    return copy.deepcopy(contact)
+                return [contact_view(m) for m in search_contacts(self.memberList,
+                    name, remarkName, nickName, wechatAccount)]
     def search_chatrooms(self, name=None, userName=None):
         with self.updateLock:
             if userName is not None:
-                for m in self.chatroomList:
-                    if m['UserName'] == userName:
-                        return copy.deepcopy(m)
+                return contact_view(self.chatroomList.search_first('UserName', userName))
             elif name is not None:
-                matchList = []
-                for m in self.chatroomList:
-                    if name in m['NickName']:
-                        matchList.append(copy.deepcopy(m))
-                return matchList
+                return [contact_view(m) for m in self.chatroomList if name in m['NickName']]
     def search_mps(self, name=None, userName=None):
         with self.updateLock:
             if userName is not None:
-                for m in self.mpList:
-                    if m['UserName'] == userName:
-                        return copy.deepcopy(m)
+                return contact_view(self.mpList.search_first('UserName', userName))
             elif name is not None:
-                matchList = []
-                for m in self.mpList:
-                    if name in m['NickName']:
-                        matchList.append(copy.deepcopy(m))
-                return matchList
+                return [contact_view(m) for m in self.mpList if name in m['NickName']]
@@ -26,8 +26,28 @@ class UnInitializedItchat(object):
     def __getattr__(self, value):
         return self._raise_error
 
+# keys of contacts that can be searched through indexes
+INDEX_KEYS = ('UserName', 'NickName', 'RemarkName', 'Alias')
+# bumped whenever contacts may have been changed in place (see storage.contact_change),
+# indexes built before that are rebuilt on next search.
+# code writing any of INDEX_KEYS of a stored contact in place must call invalidate_indexes,
+# otherwise the contact can no longer be found by its new value
+_indexGeneration = [0]
+
+def invalidate_indexes():
+    _indexGeneration[0] += 1
+
+def _index_contact(index, contact, position):
+    index['positions'][id(contact)] = position
+    for k in INDEX_KEYS:
+        v = contact.get(k)
+        if v:
+            index[k].setdefault(v, []).append(contact)
+
 class ContactList(list):
-    ''' when a dict is append, init function will be called to format that dict '''
+    ''' when a dict is append, init function will be called to format that dict
+        contacts are indexed by UserName, NickName, RemarkName and Alias,
+        appending updates the indexes, other changes make them rebuilt on next search '''
     def __init__(self, *args, **kwargs):
         super(ContactList, self).__init__(*args, **kwargs)
         self.__setstate__(None)
@@ -48,6 +68,35 @@ class ContactList(list):
         if self.contactInitFn is not None:
             contact = self.contactInitFn(self, contact) or contact
         super(ContactList, self).append(contact)
+        index = getattr(self, '_index', None)
+        if index is not None and index['generation'] == _indexGeneration[0]:
+            _index_contact(index, contact, len(self) - 1)
+    def _get_index(self):
+        index = getattr(self, '_index', None)
+        if index is None or index['generation'] != _indexGeneration[0]:
+            index = {'generation': _indexGeneration[0], 'positions': {}}
+            for k in INDEX_KEYS:
+                index[k] = {}
+            for i, contact in enumerate(list.__iter__(self)):
+                _index_contact(index, contact, i)
+            self._index = index
+        return index
+    def search(self, key, value):
+        ''' return contacts whose key equals value in list order '''
+        if key not in INDEX_KEYS or not value:
+            return [c for c in self if c.get(key) == value]
+        matches = self._get_index()[key].get(value, [])
+        if any(c.get(key) != value for c in matches):
+            # stale match changed in place without invalidate_indexes, rebuild indexes.
+            # contacts changed to a new value are only found after invalidate_indexes
+            self._index = None
+            matches = self._get_index()[key].get(value, [])
+        return list(matches)
+    def search_first(self, key, value):
+        matches = self.search(key, value)
+        return matches[0] if matches else None
+    def position(self, contact):
+        return self._get_index()['positions'].get(id(contact), -1)
     def __deepcopy__(self, memo):
         r = self.__class__([copy.deepcopy(v) for v in self])
         r.contactInitFn = self.contactInitFn
@@ -65,6 +114,42 @@ class ContactList(list):
         return '<%s: %s>' % (self.__class__.__name__.split('.')[-1],
             self.__str__())
 
+def _drop_index(name):
+    method = getattr(list, name)
+    def _method(self, *args, **kwargs):
+        r = method(self, *args, **kwargs)
+        self._index = None
+        return r
+    return _method
+
+for _name in ('__setitem__', '__delitem__', '__iadd__', 'extend', 'insert',
+        'pop', 'remove', 'clear', 'sort', 'reverse'):
+    setattr(ContactList, _name, _drop_index(_name))
+
+def search_contacts(contactList, name=None, remarkName=None, nickName=None,
+        wechatAccount=None):
+    ''' search contacts by name (any of RemarkName, NickName and Alias) and exact values
+     * same rules as the former linear search, candidates are narrowed by indexes '''
+    matchDict = {
+        'RemarkName' : remarkName,
+        'NickName'   : nickName,
+        'Alias'      : wechatAccount, }
+    for k in ('RemarkName', 'NickName', 'Alias'):
+        if matchDict[k] is None:
+            del matchDict[k]
+    if name: # select based on name
+        contact = {}
+        for k in ('RemarkName', 'NickName', 'Alias'):
+            for m in contactList.search(k, name):
+                contact[id(m)] = m
+        contact = sorted(contact.values(), key=contactList.position)
+    elif matchDict:
+        k, v = next(iter(matchDict.items()))
+        contact = contactList.search(k, v)
+    else:
+        contact = contactList[:]
+    return [m for m in contact if all([m.get(k) == v for k, v in matchDict.items()])]
+
 class AbstractUserDict(AttributeDict):
     def __init__(self, *args, **kwargs):
         super(AbstractUserDict, self).__init__(*args, **kwargs)
@@ -149,6 +234,7 @@ class User(AbstractUserDict):
         r = self.core.update_friend(self.userName)
         if r:
             update_info_dict(self, r)
+            invalidate_indexes()
         return r
     def set_alias(self, alias):
         return self.core.set_alias(self.userName, alias)
@@ -200,7 +286,9 @@ class Chatroom(AbstractUserDict):
         r = self.core.update_chatroom(self.userName, detailedMember)
         if r:
             update_info_dict(self, r)
-            self['MemberList'] = r['MemberList']
+            invalidate_indexes()
+            if getattr(r, '_contact', None) is not self:
+                self['MemberList'] = r['MemberList']
         return r
     def set_alias(self, alias):
         return self.core.set_chatroom_name(self.userName, alias)
@@ -212,36 +300,15 @@ class Chatroom(AbstractUserDict):
         return self.core.add_member_into_chatroom(self.userName, userName)
     def search_member(self, name=None, userName=None, remarkName=None, nickName=None,
             wechatAccount=None):
+        memberList = getattr(self.memberList, 'contactList', self.memberList)
         with self.core.storageClass.updateLock:
             if (name or userName or remarkName or nickName or wechatAccount) is None:
                 return None
             elif userName: # return the only userName match
-                for m in self.memberList:
-                    if m.userName == userName:
-                        return copy.deepcopy(m)
+                return contact_view(memberList.search_first('UserName', userName))
             else:
-                matchDict = {
-                    'RemarkName' : remarkName,
-                    'NickName'   : nickName,
-                    'Alias'      : wechatAccount, }
-                for k in ('RemarkName', 'NickName', 'Alias'):
-                    if matchDict[k] is None:
-                        del matchDict[k]
-                if name: # select based on name
-                    contact = []
-                    for m in self.memberList:
-                        if any([m.get(k) == name for k in ('RemarkName', 'NickName', 'Alias')]):
-                            contact.append(m)
-                else:
-                    contact = self.memberList[:]
-                if matchDict: # select again based on matchDict
-                    friendList = []
-                    for m in contact:
-                        if all([m.get(k) == v for k, v in matchDict.items()]):
-                            friendList.append(m)
-                    return copy.deepcopy(friendList)
-                else:
-                    return copy.deepcopy(contact)
+                return [contact_view(m) for m in search_contacts(memberList,
+                    name, remarkName, nickName, wechatAccount)]
     def __setstate__(self, state):
         super(Chatroom, self).__setstate__(state)
         if not 'MemberList' in self:
@@ -303,6 +370,97 @@ class ChatroomMember(AbstractUserDict):
         super(ChatroomMember, self).__setstate__(state)
         self['MemberList'] = fakeContactList
 
+class ContactView(object):
+    ''' read-only snapshot of a stored contact returned by search functions
+     * values are shared with the stored contact instead of deep copied,
+       contacts in MemberList are wrapped into views when accessed
+     * use copy.deepcopy to get a writable copy '''
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('%s is read-only, use copy.deepcopy to get a writable copy' % \
+            self.__class__.__name__)
+    __setitem__ = __delitem__ = pop = popitem = setdefault = clear = _read_only
+    def __copy__(self):
+        return self
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(self._contact, memo)
+    def __reduce_ex__(self, protocol):
+        return contact_view, (self._contact,)
+
+class ContactListView(tuple):
+    ''' read-only snapshot of a ContactList, contacts are wrapped into views when accessed '''
+    def __new__(cls, contactList):
+        r = super(ContactListView, cls).__new__(cls, contactList)
+        r.contactList = contactList
+        return r
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [contact_view(c) for c in tuple.__getitem__(self, i)]
+        return contact_view(tuple.__getitem__(self, i))
+    def __iter__(self):
+        for c in tuple.__iter__(self):
+            yield contact_view(c)
+    @property
+    def core(self):
+        return self.contactList.core
+    def search(self, key, value):
+        return [contact_view(c) for c in self.contactList.search(key, value)]
+    def search_first(self, key, value):
+        return contact_view(self.contactList.search_first(key, value))
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(self.contactList, memo)
+    def __reduce_ex__(self, protocol):
+        return ContactListView, (self.contactList,)
+
+class UserView(ContactView, User):
+    def update(self):
+        return self.core.update_friend(self.userName)
+
+class MassivePlatformView(ContactView, MassivePlatform):
+    pass
+
+class ChatroomView(ContactView, Chatroom):
+    @property
+    def core(self):
+        return getattr(self, '_core', lambda: fakeItchat)() or fakeItchat
+    @core.setter
+    def core(self, value):
+        # members of the stored chatroom already have core set
+        self._core = ref(value)
+    def update(self, detailedMember=False):
+        return self.core.update_chatroom(self.userName, detailedMember)
+
+class ChatroomMemberView(ContactView, ChatroomMember):
+    @property
+    def chatroom(self):
+        return contact_view(ChatroomMember.chatroom.fget(self))
+    @chatroom.setter
+    def chatroom(self, value):
+        ChatroomMember.chatroom.fset(self, value)
+
+_viewClasses = {
+    User           : UserView,
+    MassivePlatform: MassivePlatformView,
+    Chatroom       : ChatroomView,
+    ChatroomMember : ChatroomMemberView, }
+
+def contact_view(contact):
+    ''' wrap a stored contact into a read-only view without copying its members '''
+    if contact is None or isinstance(contact, (ContactView, ContactListView)):
+        return contact
+    viewClass = _viewClasses.get(type(contact))
+    if viewClass is None:
+        return copy.deepcopy(contact)
+    view = viewClass.__new__(viewClass)
+    dict.update(view, contact)
+    view.__dict__.update(contact.__dict__)
+    view._contact = contact
+    for k, v in dict.items(contact):
+        if isinstance(v, ContactList) and v is not fakeContactList:
+            dict.__setitem__(view, k, ContactListView(v))
+        elif isinstance(v, AbstractUserDict):
+            dict.__setitem__(view, k, contact_view(v))
+    return view
+
 def wrap_user_dict(d):
     userName = d.get('UserName')
     if '@@' in userName:
@@ -113,7 +113,10 @@ def struct_friend_info(knownInfo):
 
 def search_dict_list(l, key, value):
     ''' Search a list of dict
-        * return dict with specific value & key '''
+        * return dict with specific value & key
+        * contact lists are searched through their indexes '''
+    if hasattr(l, 'search_first'):
+        return l.search_first(key, value)
     for i in l:
         if i.get(key) == value:
             return i
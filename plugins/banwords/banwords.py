@@ -2,14 +2,20 @@
 
 import json
 import os
+import threading
+import time
+import weakref
 
 import plugins
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
+from common import http_client
 from common.log import logger
 from plugins import *
 
-from .lib.WordsSearch import WordsSearch
+from .lib.CompiledWordsSearch import CompiledWordsSearch, keywords_digest
+
+GLOBAL_TAG = ""
 
 
 @plugins.register(
@@ -35,25 +41,145 @@ class Banwords(Plugin):
                     with open(config_path, "w") as f:
                         json.dump(conf, f, indent=4)
 
-            self.searchr = WordsSearch()
             self.action = conf["action"]
-            banwords_path = os.path.join(curdir, "banwords.txt")
-            with open(banwords_path, "r", encoding="utf-8") as f:
-                words = []
-                for line in f:
-                    word = line.strip()
-                    if word:
-                        words.append(word)
-            self.searchr.SetKeywords(words)
+            self.banwords_path = os.path.join(curdir, "banwords.txt")
+            self.cache_path = os.path.join(curdir, "banwords.cache")
+            # 按群配置的额外词表，群名称 -> 词表文件(相对插件目录)，只在对应群生效
+            self.group_banwords = {group: os.path.join(curdir, path) for group, path in conf.get("group_banwords", {}).items()}
+            # 远程词表，定时拉取并保存到本地，与banwords.txt合并后全局生效
+            self.remote_url = conf.get("remote_url")
+            self.remote_interval = conf.get("remote_interval", 600)
+            self.remote_path = os.path.join(curdir, "banwords_remote.txt")
+            self.remote_etag = None
+            self.next_remote_fetch = 0
+            self.file_stamps = self._file_stamps()
+            self.reload_pending = False  # 检测到变化但还没有成功重新构建
+            self._set_searcher(self._build_searcher())
             self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
             if conf.get("reply_filter", True):
                 self.handlers[Event.ON_DECORATE_REPLY] = self.on_decorate_reply
                 self.reply_action = conf.get("reply_action", "ignore")
+            # 后台线程检查词表变化，在线程中重新构建自动机后整体替换，不阻塞消息处理
+            watch_interval = conf.get("watch_interval", 5)
+            if watch_interval > 0 or self.remote_url:
+                threading.Thread(target=_watch, args=(weakref.ref(self), watch_interval > 0, watch_interval if watch_interval > 0 else self.remote_interval), name="banwords-watcher", daemon=True).start()
             logger.info("[Banwords] inited")
         except Exception as e:
             logger.warn("[Banwords] init failed, ignore or see https://github.com/zhayujie/chatgpt-on-wechat/tree/master/plugins/banwords .")
             raise e
 
+    @staticmethod
+    def _read_words(path):
+        with open(path, "r", encoding="utf-8") as f:
+            words = []
+            for line in f:
+                word = line.strip()
+                if word:
+                    words.append(word)
+        return words
+
+    def _file_stamps(self):
+        stamps = {}
+        for path in [self.banwords_path] + list(self.group_banwords.values()):
+            try:
+                stamps[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                stamps[path] = None
+        return stamps
+
+    def _collect_words(self):
+        """合并所有词表，返回(关键词列表, 标签列表)，全局词的标签为GLOBAL_TAG，群词表的标签为群名称"""
+        word_tags = {}
+        words = self._read_words(self.banwords_path)
+        if self.remote_url and os.path.exists(self.remote_path):
+            words += self._read_words(self.remote_path)
+        for word in words:
+            word_tags.setdefault(word, set()).add(GLOBAL_TAG)
+        for group, path in self.group_banwords.items():
+            if not os.path.exists(path):
+                logger.warn("[Banwords] group banwords file not found: {}".format(path))
+                continue
+            for word in self._read_words(path):
+                word_tags.setdefault(word, set()).add(group)
+        words = list(word_tags)
+        if not self.group_banwords:
+            return words, None
+        return words, [word_tags[word] for word in words]
+
+    def _build_searcher(self):
+        words, tags = self._collect_words()
+        # 词库没变时直接加载编译好的自动机，大词库不用每次启动都重新构建
+        searcher = CompiledWordsSearch()
+        if searcher.load(self.cache_path, keywords_digest(words, tags)):
+            logger.debug("[Banwords] loaded {} words from cache".format(len(words)))
+            return searcher
+        searcher.SetKeywords(words, tags)
+        try:
+            searcher.save(self.cache_path)
+        except Exception as e:
+            logger.warn("[Banwords] save cache failed: {}".format(e))
+        return searcher
+
+    def _set_searcher(self, searcher):
+        self.searchr = searcher
+        # 流式回复分段发送时，敏感词可能跨越切分点，需要切分点前后各保留(最长敏感词长度-1)个字符一起检查
+        self.stream_holdback = max(0, max((len(word) for word in searcher._keywords), default=0) - 1)
+
+    def _fetch_remote(self):
+        """拉取远程词表，内容有变化时保存到本地并返回True"""
+        headers = {"If-None-Match": self.remote_etag} if self.remote_etag else {}
+        res = http_client.get(self.remote_url, headers=headers, timeout=(5, 30))
+        if res.status_code == 304:
+            return False
+        if res.status_code != 200:
+            logger.warn("[Banwords] fetch remote banwords failed, status_code={}".format(res.status_code))
+            return False
+        self.remote_etag = res.headers.get("ETag")
+        text = res.content.decode("utf-8")
+        if os.path.exists(self.remote_path):
+            with open(self.remote_path, "r", encoding="utf-8") as f:
+                if f.read() == text:
+                    return False
+        tmp_path = self.remote_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, self.remote_path)
+        return True
+
+    def check_update(self, watch_files=True):
+        """检查本地和远程词表，有变化时重新构建自动机并替换"""
+        stamps = None
+        if watch_files:
+            stamps = self._file_stamps()
+            if stamps != self.file_stamps:
+                self.reload_pending = True
+        if self.remote_url and time.monotonic() >= self.next_remote_fetch:
+            self.next_remote_fetch = time.monotonic() + self.remote_interval
+            try:
+                if self._fetch_remote():
+                    self.reload_pending = True
+            except Exception as e:
+                logger.warn("[Banwords] fetch remote banwords error: {}".format(e))
+        if not self.reload_pending:
+            return False
+        start = time.time()
+        searcher = self._build_searcher()
+        self._set_searcher(searcher)  # 整体替换引用，处理中的消息继续使用旧的自动机
+        # 构建成功后才记录已处理的变化，构建失败时下次检查会重试
+        self.reload_pending = False
+        if stamps is not None:
+            self.file_stamps = stamps
+        logger.info("[Banwords] ban list reloaded, words={}, cost={:.0f}ms".format(len(searcher._keywords), (time.time() - start) * 1000))
+        return True
+
+    def _match_tags(self, context):
+        """当前消息适用的词表标签，没有配置群词表时不区分标签"""
+        if not self.group_banwords:
+            return None
+        if context.get("isgroup", False):
+            return {GLOBAL_TAG, context["msg"].from_user_nickname}
+        return {GLOBAL_TAG}
+
     def on_handle_context(self, e_context: EventContext):
         if e_context["context"].type not in [
             ContextType.TEXT,
@@ -63,15 +189,17 @@ class Banwords(Plugin):
 
         content = e_context["context"].content
         logger.debug("[Banwords] on_handle_context. content: %s" % content)
+        searchr = self.searchr
+        tags = self._match_tags(e_context["context"])
         if self.action == "ignore":
-            f = self.searchr.FindFirst(content)
+            f = searchr.FindFirst(content, tags=tags)
             if f:
                 logger.info("[Banwords] %s in message" % f["Keyword"])
                 e_context.action = EventAction.BREAK_PASS
                 return
         elif self.action == "replace":
-            if self.searchr.ContainsAny(content):
-                reply = Reply(ReplyType.INFO, "发言中包含敏感词，请重试: \n" + self.searchr.Replace(content))
+            if searchr.ContainsAny(content, tags=tags):
+                reply = Reply(ReplyType.INFO, "发言中包含敏感词，请重试: \n" + searchr.Replace(content, tags=tags))
                 e_context["reply"] = reply
                 e_context.action = EventAction.BREAK_PASS
                 return
@@ -82,19 +210,44 @@ class Banwords(Plugin):
 
         reply = e_context["reply"]
         content = reply.content
+        searchr = self.searchr
+        tags = self._match_tags(e_context["context"])
+        lookbehind = e_context["context"].get("stream_lookbehind") or ""
+        lookahead = e_context["context"].get("stream_lookahead") or ""
+        if lookbehind or lookahead:
+            # 流式回复的一段：连同切分点前后的内容一起检查，找出落在这一段内(包括跨越切分点)的敏感词
+            text = lookbehind + content + lookahead
+            start, end = len(lookbehind), len(lookbehind) + len(content)
+            f = next((f for f in searchr.FindAll(text, tags=tags) if f["End"] >= start and f["Start"] < end), None)
+        else:
+            text, start, end = content, 0, len(content)
+            f = searchr.FindFirst(content, tags=tags)
         if self.reply_action == "ignore":
-            f = self.searchr.FindFirst(content)
             if f:
                 logger.info("[Banwords] %s in reply" % f["Keyword"])
                 e_context["reply"] = None
                 e_context.action = EventAction.BREAK_PASS
                 return
         elif self.reply_action == "replace":
-            if self.searchr.ContainsAny(content):
-                reply = Reply(ReplyType.INFO, "已替换回复中的敏感词: \n" + self.searchr.Replace(content))
+            if f:
+                reply = Reply(ReplyType.INFO, "已替换回复中的敏感词: \n" + searchr.Replace(text, tags=tags)[start:end])
                 e_context["reply"] = reply
                 e_context.action = EventAction.CONTINUE
                 return
 
     def get_help_text(self, **kwargs):
         return "过滤消息中的敏感词。"
+
+
+def _watch(plugin_ref, watch_files, interval):
+    # 只持有插件的弱引用，插件被重新加载后旧实例回收，线程随之退出
+    while True:
+        plugin = plugin_ref()
+        if plugin is None:
+            return
+        try:
+            plugin.check_update(watch_files)
+        except Exception as e:
+            logger.warn("[Banwords] reload ban list error: {}".format(e))
+        del plugin
+        time.sleep(interval)
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# 与WordsSearch接口一致的AC自动机，自动机编译为紧凑数组(排序边表)，可序列化到缓存文件，大词库启动时无需重新构建
+
+import bisect
+import hashlib
+import os
+import pickle
+from array import array
+
+__all__ = ["CompiledWordsSearch"]
+
+CACHE_VERSION = 2
+
+
+class CompiledWordsSearch:
+    """
+    状态按BFS顺序编号，0为根状态
+    - 状态s的转移边为 edge_chars/edge_targets[edge_start[s]:edge_start[s+1]]，按字符排序，查找用二分
+      每个状态的边已合并失败链上(根以外)的转移，与WordsSearch的TrieNode2一致，找不到时回到根状态查找
+    - 状态s命中的关键词为 outputs[output_start[s]:output_start[s+1]]，第一个是最长的关键词
+    - 根状态的转移用dict保存，大部分字符在根状态就被过滤掉
+    - 关键词可以带标签(如所属群)，多个词表共用一个自动机，查找时传入tags只匹配带有其中任一标签的关键词
+    """
+
+    def __init__(self):
+        self._keywords = []
+        self._indexs = []
+        self._tags = None
+        self.digest = None
+        self.edge_start = array("l", [0, 0])
+        self.edge_chars = array("l")
+        self.edge_targets = array("l")
+        self.output_start = array("l", [0, 0])
+        self.outputs = array("l")
+        self._root = {}
+
+    def SetKeywords(self, keywords, tags=None):
+        """
+        :param keywords: 关键词列表
+        :param tags: 与keywords一一对应的标签集合列表，为None表示关键词不区分标签
+        """
+        self._keywords = list(keywords)
+        self._indexs = list(range(len(self._keywords)))
+        self._tags = [frozenset(t) for t in tags] if tags is not None else None
+        self.digest = keywords_digest(self._keywords, self._tags)
+
+        # 构建trie
+        children = [{}]
+        own_results = [[]]
+        for i, word in enumerate(self._keywords):
+            state = 0
+            for ch in word:
+                c = ord(ch)
+                nxt = children[state].get(c)
+                if nxt is None:
+                    nxt = len(children)
+                    children.append({})
+                    own_results.append([])
+                    children[state][c] = nxt
+                state = nxt
+            own_results[state].append(i)
+
+        # BFS计算失败指针、合并转移边和输出，并按BFS顺序重新编号
+        count = len(children)
+        fail = [0] * count
+        results = [None] * count
+        edges = [None] * count
+        results[0] = []
+        edges[0] = {}
+        order = [0]
+        queue_index = 0
+        while queue_index < len(order):
+            state = order[queue_index]
+            queue_index += 1
+            for c, nxt in children[state].items():
+                if state == 0:
+                    fail[nxt] = 0
+                else:
+                    f = fail[state]
+                    while f and c not in children[f]:
+                        f = fail[f]
+                    fail[nxt] = children[f].get(c, 0)
+                f = fail[nxt]
+                merged = own_results[nxt] + [r for r in results[f] if r not in own_results[nxt]]
+                results[nxt] = merged
+                edge = dict(edges[f]) if f else {}
+                edge.update(children[nxt])
+                edges[nxt] = edge
+                order.append(nxt)
+
+        new_id = [0] * count
+        for i, state in enumerate(order):
+            new_id[state] = i
+
+        edge_start = array("l", [0])
+        edge_chars = array("l")
+        edge_targets = array("l")
+        output_start = array("l", [0])
+        outputs = array("l")
+        for state in order:
+            if state:
+                for c in sorted(edges[state]):
+                    edge_chars.append(c)
+                    edge_targets.append(new_id[edges[state][c]])
+            edge_start.append(len(edge_chars))
+            outputs.extend(results[state])
+            output_start.append(len(outputs))
+        self.edge_start = edge_start
+        self.edge_chars = edge_chars
+        self.edge_targets = edge_targets
+        self.output_start = output_start
+        self.outputs = outputs
+        self._root = {c: new_id[nxt] for c, nxt in children[0].items()}
+
+    def save(self, path):
+        """序列化自动机到缓存文件"""
+        data = {
+            "version": CACHE_VERSION,
+            "digest": self.digest,
+            "keywords": self._keywords,
+            "tags": self._tags,
+            "edge_start": self.edge_start,
+            "edge_chars": self.edge_chars,
+            "edge_targets": self.edge_targets,
+            "output_start": self.output_start,
+            "outputs": self.outputs,
+            "root": self._root,
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def load(self, path, digest=None):
+        """从缓存文件加载自动机，digest不一致(词库已变化)时返回False"""
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+        except Exception:
+            return False
+        if data.get("version") != CACHE_VERSION or (digest is not None and data.get("digest") != digest):
+            return False
+        self._keywords = data["keywords"]
+        self._indexs = list(range(len(self._keywords)))
+        self._tags = data["tags"]
+        self.digest = data["digest"]
+        self.edge_start = data["edge_start"]
+        self.edge_chars = data["edge_chars"]
+        self.edge_targets = data["edge_targets"]
+        self.output_start = data["output_start"]
+        self.outputs = data["outputs"]
+        self._root = data["root"]
+        return True
+
+    def _scan(self, text):
+        """逐字符推进自动机，产出(位置, 状态)，只产出有命中关键词的状态"""
+        edge_start = self.edge_start
+        edge_chars = self.edge_chars
+        edge_targets = self.edge_targets
+        output_start = self.output_start
+        root = self._root
+        bisect_left = bisect.bisect_left
+        state = 0
+        for index, ch in enumerate(text):
+            c = ord(ch)
+            nxt = -1
+            if state:
+                lo = edge_start[state]
+                hi = edge_start[state + 1]
+                if lo < hi:
+                    j = bisect_left(edge_chars, c, lo, hi)
+                    if j < hi and edge_chars[j] == c:
+                        nxt = edge_targets[j]
+            if nxt < 0:
+                nxt = root.get(c, 0)
+            state = nxt
+            if state and output_start[state] < output_start[state + 1]:
+                yield index, state
+
+    def _outputs(self, state, tags):
+        """状态命中的关键词，按长度从长到短，只保留带有tags中任一标签的关键词"""
+        items = self.outputs[self.output_start[state] : self.output_start[state + 1]]
+        if tags is None or self._tags is None:
+            return items
+        return [item for item in items if not self._tags[item].isdisjoint(tags)]
+
+    def _result(self, item, index):
+        keyword = self._keywords[item]
+        return {"Keyword": keyword, "Success": True, "End": index, "Start": index + 1 - len(keyword), "Index": self._indexs[item]}
+
+    def FindFirst(self, text, tags=None):
+        for index, state in self._scan(text):
+            items = self._outputs(state, tags)
+            if items:
+                return self._result(items[0], index)
+        return None
+
+    def FindAll(self, text, tags=None):
+        result = []
+        for index, state in self._scan(text):
+            for item in self._outputs(state, tags):
+                result.append(self._result(item, index))
+        return result
+
+    def ContainsAny(self, text, tags=None):
+        for _, state in self._scan(text):
+            if self._outputs(state, tags):
+                return True
+        return False
+
+    def Replace(self, text, replaceChar="*", tags=None):
+        result = list(text)
+        for index, state in self._scan(text):
+            items = self._outputs(state, tags)
+            if not items:
+                continue
+            max_length = len(self._keywords[items[0]])
+            for j in range(index + 1 - max_length, index + 1):
+                result[j] = replaceChar
+        return "".join(result)
+
+
+def keywords_digest(keywords, tags=None):
+    digest = hashlib.sha1("\n".join(keywords).encode("utf-8"))
+    if tags is not None:
+        digest.update("\n".join(",".join(sorted(t)) for t in tags).encode("utf-8"))
+    return digest.hexdigest()
+
+
+if __name__ == "__main__":
+    # 基准测试: 与WordsSearch对比构建、缓存加载和长回复匹配耗时
+    import random
+    import sys
+    import tempfile
+    import time
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from WordsSearch import WordsSearch
+
+    random.seed(0)
+    chars = [chr(c) for c in range(0x4E00, 0x4E00 + 3000)]
+    words = list({"".join(random.choice(chars) for _ in range(random.randint(2, 6))) for _ in range(100000)})
+    text = "".join(random.choice(chars) for _ in range(5000)) + words[0]
+
+    start = time.perf_counter()
+    old = WordsSearch()
+    old.SetKeywords(words)
+    print("WordsSearch build {} words: {:.0f} ms".format(len(words), (time.perf_counter() - start) * 1000))
+
+    start = time.perf_counter()
+    new = CompiledWordsSearch()
+    new.SetKeywords(words)
+    print("CompiledWordsSearch build {} words: {:.0f} ms".format(len(words), (time.perf_counter() - start) * 1000))
+
+    cache_path = os.path.join(tempfile.gettempdir(), "banwords_bench.cache")
+    new.save(cache_path)
+    start = time.perf_counter()
+    loaded = CompiledWordsSearch()
+    loaded.load(cache_path, keywords_digest(words))
+    print("CompiledWordsSearch load from cache: {:.0f} ms".format((time.perf_counter() - start) * 1000))
+    os.remove(cache_path)
+
+    for name, searcher in [("WordsSearch", old), ("CompiledWordsSearch", loaded)]:
+        start = time.perf_counter()
+        for _ in range(20):
+            searcher.FindFirst(text)
+            searcher.ContainsAny(text)
+            searcher.Replace(text)
+        print("{} FindFirst+ContainsAny+Replace on {} chars x20: {:.0f} ms".format(name, len(text), (time.perf_counter() - start) * 1000))
+    assert old.Replace(text) == loaded.Replace(text)
+    assert old.FindAll(text) == loaded.FindAll(text)
@@ -3,6 +3,7 @@ import time
 import urllib.parse
 import urllib.request
 import requests
+from common import http_client
 import random
 
 from typing import Any
@@ -28,7 +29,7 @@ def get_hero_info(hero_name):
     }
 
     try:
-        response = requests.post(base_url, params=params, headers=headers)
+        response = http_client.post(base_url, params=params, headers=headers)
         if response.status_code == 200:
             response_data = response.json()
             hero_info = response_data.get('data', {}).get('heroInfo', {})
@@ -72,7 +73,7 @@ def search_bing(subscription_key, query, count=10):
 
     # Call the API
     try:
-        response = requests.get(endpoint, headers=headers, params=params)
+        response = http_client.get(endpoint, headers=headers, params=params)
         response.raise_for_status()
 
         # Parse the response
@@ -111,7 +112,7 @@ def get_morning_news(api_key):
     headers = {'Content-Type': "application/x-www-form-urlencoded"}
 
     try:
-        response = requests.request("POST", url, data=payload, headers=headers)
+        response = http_client.request("POST", url, data=payload, headers=headers)
         morning_news_info = response.json()
         if morning_news_info['code'] == 200:  # 验证请求是否成功
             return json.dumps(morning_news_info, ensure_ascii=False)
@@ -161,7 +162,7 @@ def get_hotlist(api_key, type):
         payload = {"token": api_key, "type": api_type}
         headers = {'Content-Type': "application/x-www-form-urlencoded"}
 
-        response = requests.request("POST", url, data=payload, headers=headers)
+        response = http_client.request("POST", url, data=payload, headers=headers)
         hotlist_info = response.json()
         if hotlist_info['code'] == 200:  # 验证请求是否成功
             return hotlist_info  # 返回整个热榜数据
@@ -189,7 +190,7 @@ def search_bing_news(count, subscription_key, query):
 
     try:
         # Send the request
-        response = requests.get(endpoint, headers=headers, params=params)
+        response = http_client.get(endpoint, headers=headers, params=params)
         response.raise_for_status()  # 如果发生网络错误，此句会抛出异常
         # Get and return the response data
         data = response.json()
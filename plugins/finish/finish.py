@@ -15,6 +15,7 @@ from plugins import *
     desc="A plugin that check unknown command",
     version="1.0",
     author="js00000",
+    triggers={"prefix": ["{trigger_prefix}"]},
 )
 class Finish(Plugin):
     def __init__(self):
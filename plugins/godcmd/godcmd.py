@@ -127,6 +127,11 @@ ADMIN_COMMANDS = {
         "args": ["插件名"],
         "desc": "更新指定插件",
     },
+    "pstats": {
+        "alias": ["pstats", "插件耗时"],
+        "args": ["[reset]"],
+        "desc": "查看各插件处理耗时统计，reset清空统计",
+    },
     "debug": {
         "alias": ["debug", "调试模式", "DEBUG"],
         "desc": "开启机器调试日志",
@@ -170,6 +175,19 @@ def get_help_text(isadmin, isgroup):
     return help_text
 
 
+def get_plugin_stats_text():
+    stats = PluginManager().get_handler_stats()
+    rows = [(name, event, item) for name, events in stats.items() for event, item in events.items()]
+    if not rows:
+        return "暂无插件耗时统计"
+    rows.sort(key=lambda row: row[2]["total_ms"], reverse=True)  # 总耗时最多的排在前面
+    text = "插件耗时统计(毫秒)：\n"
+    for name, event, item in rows:
+        text += f"{name} {event}{'(只读)' if item['passive'] else ''}\n"
+        text += f"  次数{item['count']} p50 {item['p50_ms']} p95 {item['p95_ms']} p99 {item['p99_ms']} max {item['max_ms']} 中断{item['breaks']}\n"
+    return text
+
+
 @plugins.register(
     name="Godcmd",
     desire_priority=999,
@@ -362,6 +380,12 @@ class Godcmd(Plugin):
                                     result += "已启用\n"
                                 else:
                                     result += "未启用\n"
+                        elif cmd == "pstats":
+                            if args and args[0] == "reset":
+                                PluginManager().reset_handler_stats()
+                                ok, result = True, "插件耗时统计已清空"
+                            else:
+                                ok, result = True, get_plugin_stats_text()
                         elif cmd == "scanp":
                             new_plugins = PluginManager().scan_plugins()
                             ok, result = True, "插件扫描完成"
@@ -7,6 +7,7 @@ import plugins
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
 from common.log import logger
+from common.tmp_dir import TmpDir
 from plugins import *
 
 
@@ -63,11 +64,8 @@ class Keyword(Plugin):
                 
             elif (reply_text.startswith("http://") or reply_text.startswith("https://")) and any(reply_text.endswith(ext) for ext in [".pdf", ".doc", ".docx", ".xls", "xlsx",".zip", ".rar"]):
             # 如果是以 http:// 或 https:// 开头，且".pdf", ".doc", ".docx", ".xls", "xlsx",".zip", ".rar"结尾，则下载文件到tmp目录并发送给用户
-                file_path = "tmp"
-                if not os.path.exists(file_path):
-                    os.makedirs(file_path)
                 file_name = reply_text.split("/")[-1]  # 获取文件名
-                file_path = os.path.join(file_path, file_name)
+                file_path = TmpDir().path() + file_name  # 写到当前请求的临时目录，发送后自动删除
                 response = requests.get(reply_text)
                 with open(file_path, "wb") as f:
                     f.write(response.content)
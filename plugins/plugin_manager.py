@@ -1,17 +1,26 @@
 # encoding:utf-8
 
+import copy
 import importlib
 import importlib.util
 import json
 import os
 import sys
-
+import threading
+import time
+from queue import Full
+
+from bridge.context import Context, ContextType
+from common import metrics_server
+from common.handler_pool import HandlerLane
+from common.latency_histogram import LatencyHistogram
 from common.log import logger
 from common.singleton import singleton
 from common.sorted_dict import SortedDict
 from config import conf, write_plugin_config
 
 from .event import *
+from .trigger_router import TriggerRouter
 
 
 @singleton
@@ -23,6 +32,11 @@ class PluginManager:
         self.pconf = {}
         self.current_plugin_path = None
         self.loaded = {}
+        self.passive_lane = None
+        self.stats_lock = threading.Lock()
+        self.handler_stats = {}  # (插件名, 事件) -> [耗时直方图, 中断次数]
+        self.trigger_router = None
+        metrics_server.register("plugins", self.get_handler_stats)
 
     def register(self, name: str, desire_priority: int = 0, **kwargs):
         def wrapper(plugincls):
@@ -34,6 +48,10 @@ class PluginManager:
             plugincls.version = kwargs.get("version") if kwargs.get("version") != None else "1.0"
             plugincls.namecn = kwargs.get("namecn") if kwargs.get("namecn") != None else name
             plugincls.hidden = kwargs.get("hidden") if kwargs.get("hidden") != None else False
+            # 只读处理函数: True表示插件所有处理函数，或传入事件列表，只读处理函数在后台线程执行，不能修改回复或中断事件
+            plugincls.passive = kwargs.get("passive") if kwargs.get("passive") != None else False
+            # ON_HANDLE_CONTEXT的触发条件，声明后文本消息只有命中条件时才交给插件处理，格式见TriggerRouter
+            plugincls.triggers = kwargs.get("triggers")
             plugincls.enabled = True
             if self.current_plugin_path == None:
                 raise Exception("Plugin path not set")
@@ -136,6 +154,26 @@ class PluginManager:
     def refresh_order(self):
         for event in self.listening_plugins.keys():
             self.listening_plugins[event].sort(key=lambda name: self.plugins[name].priority, reverse=True)
+        self.trigger_router = None  # 插件变化后重新编译触发条件
+
+    def _get_trigger_router(self) -> TriggerRouter:
+        router = self.trigger_router
+        trigger_prefix = conf().get("plugin_trigger_prefix", "$")
+        # 重新加载配置后插件指令前缀可能变化，需要重新编译
+        if router is None or router.trigger_prefix != trigger_prefix:
+            triggers = {name: plugincls.triggers for name, plugincls in self.plugins.items() if plugincls.triggers}
+            router = TriggerRouter(triggers, trigger_prefix)
+            self.trigger_router = router
+        return router
+
+    def _match_triggers(self, e_context: EventContext):
+        """返回文本消息触发的插件名集合，不需要按触发条件过滤时返回None"""
+        if e_context.event != Event.ON_HANDLE_CONTEXT:
+            return None
+        context = e_context.econtext.get("context")
+        if context is None or context.type != ContextType.TEXT or not isinstance(context.content, str):
+            return None
+        return self._get_trigger_router().match(context.content)
 
     def activate_plugins(self):  # 生成新开启的插件实例
         failed_plugins = []
@@ -184,16 +222,111 @@ class PluginManager:
 
     def emit_event(self, e_context: EventContext, *args, **kwargs):
         if e_context.event in self.listening_plugins:
+            matched = self._match_triggers(e_context)
             for name in self.listening_plugins[e_context.event]:
+                if matched is not None and self.plugins[name].triggers and name not in matched:
+                    continue  # 声明了触发条件但消息没有命中，跳过
                 if self.plugins[name].enabled and e_context.action == EventAction.CONTINUE:
                     logger.debug("Plugin %s triggered by event %s" % (name, e_context.event))
                     instance = self.instances[name]
-                    instance.handlers[e_context.event](e_context, *args, **kwargs)
+                    handler = instance.handlers[e_context.event]
+                    if self._is_passive(name, e_context.event):
+                        # 只读处理函数不影响后续流程，交给后台线程执行，传入提交时事件上下文的快照
+                        passive_context = EventContext(e_context.event, self._snapshot_econtext(e_context.econtext))
+                        self._submit_passive(name, handler, passive_context, *args, **kwargs)
+                        continue
+                    self._run_handler(name, handler, e_context, *args, **kwargs)
                     if e_context.is_break():
                         e_context["breaked_by"] = name
                         logger.debug("Plugin %s breaked event %s" % (name, e_context.event))
         return e_context
 
+    def has_listeners(self, event) -> bool:
+        """是否有启用的插件处理该事件"""
+        return any(self.plugins[name].enabled for name in self.listening_plugins.get(event, []))
+
+    def get_stream_holdback(self) -> int:
+        """流式回复切分时要给ON_DECORATE_REPLY插件保留的前后文长度，取各插件stream_holdback属性的最大值"""
+        holdback = 0
+        for name in self.listening_plugins.get(Event.ON_DECORATE_REPLY, []):
+            instance = self.instances.get(name)
+            if self.plugins[name].enabled and instance is not None:
+                holdback = max(holdback, getattr(instance, "stream_holdback", 0))
+        return holdback
+
+    def _snapshot_econtext(self, econtext):
+        # 后续流程会修改Context(如去掉前缀、改写type)，后台线程需要读取提交时的内容
+        snapshot = dict(econtext)
+        for key, value in snapshot.items():
+            if isinstance(value, Context):
+                context = copy.copy(value)
+                context.kwargs = dict(value.kwargs)
+                snapshot[key] = context
+        return snapshot
+
+    def _is_passive(self, name, event):
+        passive = self.plugins[name].passive
+        if isinstance(passive, (list, tuple, set)):
+            return event in passive
+        return bool(passive)
+
+    def _run_handler(self, name, handler, e_context: EventContext, *args, **kwargs):
+        start = time.monotonic()
+        try:
+            handler(e_context, *args, **kwargs)
+        finally:
+            cost = time.monotonic() - start
+            self._record_stats(name, e_context, cost)
+            slow_threshold = conf().get("plugin_slow_threshold", 1)
+            if slow_threshold and cost >= slow_threshold:
+                context = e_context.econtext.get("context")
+                logger.warning(
+                    "Plugin %s handled event %s slowly: %.0fms, context_type=%s" % (name, e_context.event.name, cost * 1000, context.type if context else None)
+                )
+
+    def _run_passive(self, name, handler, e_context: EventContext, *args, **kwargs):
+        try:
+            self._run_handler(name, handler, e_context, *args, **kwargs)
+        except Exception as e:
+            logger.exception("Passive plugin %s failed on event %s: %s" % (name, e_context.event, e))
+
+    def _submit_passive(self, name, handler, e_context: EventContext, *args, **kwargs):
+        if self.passive_lane is None:
+            with self.stats_lock:
+                if self.passive_lane is None:
+                    self.passive_lane = HandlerLane("plugin", max(1, int(conf().get("plugin_passive_workers", 4))), int(conf().get("plugin_passive_queue_size", 1000)))
+        try:
+            self.passive_lane.submit(self._run_passive, name, handler, e_context, *args, **kwargs)
+        except Full:
+            logger.warning("Passive plugin queue is full, run %s synchronously" % name)
+            self._run_passive(name, handler, e_context, *args, **kwargs)
+
+    def _record_stats(self, name, e_context: EventContext, cost):
+        breaked = e_context.is_break() and not self._is_passive(name, e_context.event)  # 只读处理函数设置的中断不生效
+        with self.stats_lock:
+            stats = self.handler_stats.get((name, e_context.event))
+            if stats is None:
+                stats = [LatencyHistogram(), 0]
+                self.handler_stats[(name, e_context.event)] = stats
+            stats[0].record(cost)
+            if breaked:
+                stats[1] += 1
+
+    def get_handler_stats(self) -> dict:
+        """各插件处理函数的耗时统计，{插件名: {事件名: {count, p50_ms, p95_ms, p99_ms, ..., breaks}}}"""
+        result = {}
+        with self.stats_lock:
+            for (name, event), (histogram, breaks) in self.handler_stats.items():
+                stats = histogram.snapshot()
+                stats["breaks"] = breaks
+                stats["passive"] = self._is_passive(name, event) if name in self.plugins else False
+                result.setdefault(name, {})[event.name] = stats
+        return result
+
+    def reset_handler_stats(self):
+        with self.stats_lock:
+            self.handler_stats = {}
+
     def set_plugin_priority(self, name: str, priority: int):
         name = name.upper()
         if name not in self.plugins:
@@ -12,9 +12,9 @@ import datetime
 from common.log import logger
 import plugins
 # import openai
-from collections import Counter
 # from .lib import wxmsg as wx
 from .lib.model_factory import ModelGenerator
+from .lib.record_writer import get_record_writer
 import re
 
 
@@ -24,7 +24,9 @@ import re
     desc="A plugin that summarize",
     version="0.1.0",
     author="cc",
-    desire_priority=70
+    desire_priority=70,
+    passive=[Event.ON_RECEIVE_MESSAGE],  # 记录聊天消息只读取上下文，在后台线程执行
+    triggers={"contains": ["总结群聊", "群聊统计"], "prefix": ["查群聊关键词"], "regex": [r"^@[\w\s]+的聊天$"]},
 )
 
 
@@ -44,6 +46,12 @@ class ChatStatistics(Plugin):
 
         # 初始化数据库
         self.initialize_database()
+        # 聊天记录由单独的写线程批量写入
+        self.record_writer = get_record_writer(
+            self.db_path,
+            batch_size=config.get("record_batch_size", 100),
+            flush_interval_ms=config.get("record_flush_interval_ms", 500),
+        )
 
         # 设置事件处理器
         self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
@@ -66,22 +74,32 @@ class ChatStatistics(Plugin):
                 c.execute("PRAGMA table_info(chat_records);")
                 if not any(column[1] == 'is_triggered' for column in c.fetchall()):
                     c.execute("ALTER TABLE chat_records ADD COLUMN is_triggered INTEGER DEFAULT 0;")
+
+                # 按会话和时间查询的索引
+                c.execute("CREATE INDEX IF NOT EXISTS idx_chat_records_session_time ON chat_records (sessionid, timestamp)")
+
+                # 按天、按用户汇总的消息数，由写线程增量维护，统计查询直接读汇总表
+                c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='chat_daily_stats'")
+                rollup_exists = c.fetchone() is not None
+                c.execute('''CREATE TABLE IF NOT EXISTS chat_daily_stats
+                            (sessionid TEXT, day TEXT, user TEXT, count INTEGER,
+                            PRIMARY KEY (sessionid, day, user))''')
+                if not rollup_exists:
+                    # 首次创建时从历史记录回填
+                    c.execute('''INSERT INTO chat_daily_stats (sessionid, day, user, count)
+                                SELECT sessionid, strftime('%Y-%m-%d', timestamp, 'unixepoch', 'localtime'), user, COUNT(*)
+                                FROM chat_records GROUP BY 1, 2, 3''')
+                    logger.info("[c_summary] chat_daily_stats backfilled, {} rows".format(c.rowcount))
         except Exception as e:
             logger.error(f"Database initialization error: {e}")
 
     def _insert_record(self, session_id, msg_id, user, content, msg_type, timestamp, is_triggered=0):
-        """向数据库中插入一条新记录"""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                c = conn.cursor()
-                c.execute("INSERT OR REPLACE INTO chat_records VALUES (?,?,?,?,?,?,?)", 
-                          (session_id, msg_id, user, content, msg_type, timestamp, is_triggered))
-            logger.debug("insert chat record to db: %s", (session_id, msg_id, user, content, msg_type, timestamp, is_triggered))
-        except Exception as e:
-            logger.error(f"Error inserting record: {e}")
+        """向写线程提交一条新记录"""
+        self.record_writer.insert((session_id, msg_id, user, content, msg_type, timestamp, is_triggered))
+        logger.debug("insert chat record to queue: %s", (session_id, msg_id, user, content, msg_type, timestamp, is_triggered))
 
-    def _get_records(self, session_id, excluded_users=None, specific_day=None):
-        """获取指定会话的聊天记录，排除特定用户列表中的用户，可选特定日期"""
+    def _get_records(self, session_id, excluded_users=None, specific_day=None, user=None, limit=None):
+        """获取指定会话的聊天记录，排除特定用户列表中的用户，可选特定日期、特定用户和最多条数"""
         if excluded_users is None:
             excluded_users = ["Oʀ ."]  # 默认排除的用户列表
 
@@ -99,10 +117,17 @@ class ChatStatistics(Plugin):
 
                 # 构建排除用户的 SQL 条件
                 excluded_users_placeholder = ','.join('?' for _ in excluded_users)
-                query = f"SELECT * FROM chat_records WHERE sessionid=? AND timestamp BETWEEN ? AND ? AND user NOT IN ({excluded_users_placeholder}) ORDER BY timestamp DESC"
+                query = f"SELECT * FROM chat_records WHERE sessionid=? AND timestamp BETWEEN ? AND ? AND user NOT IN ({excluded_users_placeholder})"
 
                 # 准备查询参数
                 query_params = [session_id, start_timestamp, end_timestamp] + excluded_users
+                if user is not None:
+                    query += " AND user=?"
+                    query_params.append(user)
+                query += " ORDER BY timestamp DESC"
+                if limit is not None:
+                    query += " LIMIT ?"
+                    query_params.append(limit)
 
                 # 执行查询
                 c.execute(query, query_params)
@@ -112,6 +137,30 @@ class ChatStatistics(Plugin):
             logger.error(f"Error fetching records: {e}")
             return []
 
+    def _get_daily_user_counts(self, c, session_id, day, excluded_users, limit=None):
+        """从汇总表获取某天各用户的消息数，按消息数降序"""
+        excluded_users_placeholder = ','.join('?' for _ in excluded_users)
+        query = f"""
+            SELECT user, count FROM chat_daily_stats
+            WHERE sessionid = ? AND day = ? AND user NOT IN ({excluded_users_placeholder})
+            ORDER BY count DESC
+        """
+        query_params = [session_id, day.strftime('%Y-%m-%d')] + excluded_users
+        if limit is not None:
+            query += " LIMIT ?"
+            query_params.append(limit)
+        c.execute(query, query_params)
+        return c.fetchall()
+
+    def _get_daily_count(self, c, session_id, day, excluded_users):
+        """从汇总表获取某天的消息总数"""
+        excluded_users_placeholder = ','.join('?' for _ in excluded_users)
+        c.execute(f"""
+            SELECT COALESCE(SUM(count), 0) FROM chat_daily_stats
+            WHERE sessionid = ? AND day = ? AND user NOT IN ({excluded_users_placeholder})
+        """, [session_id, day.strftime('%Y-%m-%d')] + excluded_users)
+        return c.fetchone()[0]
+
 
     def on_receive_message(self, e_context: EventContext):
         context = e_context['context']
@@ -151,6 +200,9 @@ class ChatStatistics(Plugin):
         prefix = "查群聊关键词"
 
         # 解析用户请求
+        if "总结群聊" in content or "群聊统计" in content:
+            self.record_writer.flush()  # 统计前确保排队中的记录已写入
+
         if "总结群聊" in content:
             logger.debug("开始总结群聊...")
             result = remove_markdown(self.summarize_group_chat(session_id, 100) ) # 总结最近100条群聊消息
@@ -186,10 +238,10 @@ class ChatStatistics(Plugin):
                 e_context.action = EventAction.CONTINUE
 
     def summarize_group_chat(self, session_id, count):
-        # 从 _get_records 方法获取当天的所有聊天记录
-        all_records = self._get_records(session_id)
-        # 从所有记录中提取最新的 count 条记录，并只获取 user, content, timestamp 字段
-        recent_records = [{"user": record[2], "content": record[3], "timestamp": record[5]} for record in all_records[:count]]
+        # 从 _get_records 方法获取当天最新的 count 条聊天记录
+        all_records = self._get_records(session_id, limit=count)
+        # 只获取 user, content, timestamp 字段
+        recent_records = [{"user": record[2], "content": record[3], "timestamp": record[5]} for record in all_records]
         logger.debug("recent_records: {}".format(recent_records))
         
         # 将所有聊天记录合并成一个字符串
@@ -205,36 +257,22 @@ class ChatStatistics(Plugin):
         try:
             # 定义要排除的用户列表
             excluded_users = ["Oʀ ."]
-            # 获取今天的聊天记录
-            today_records = self._get_records(session_id)
-            today_count = len(today_records)  # 计算今日聊天记录总条数
-
-            # 获取昨天的聊天记录
-            yesterday = datetime.datetime.now() - datetime.timedelta(days=1)
-            yesterday_records = self._get_records(session_id, specific_day=yesterday)
-            yesterday_count = len(yesterday_records)  # 计算昨日聊天记录总条数
-
-            # 计算今日与昨日聊天量的百分比变化
-            percent_change = ((today_count - yesterday_count) / yesterday_count * 100) if yesterday_count > 0 else float('inf')
-            # percent_change_str = f"+{percent_change:.0f}%" if percent_change >= 0 else f"{percent_change:.0f}%"
-            percent_change_str = f"{percent_change:+.2f}%"
-            # 组装今日聊天榜信息和昨日数据
-            today_info = f"😈 今日群员聊天榜🏆 总 {today_count} 条"
-            change_emoji = "🔺" if percent_change >= 0 else "🔻"
-            yesterday_info = f"😴 较昨日: {yesterday_count} 条 {percent_change_str}"
-
-            # 获取历史单日最高聊天量和对应用户
+            today = datetime.datetime.now()
+            yesterday = today - datetime.timedelta(days=1)
+            excluded_users_placeholder = ','.join('?' for _ in excluded_users)
+            # 聊天量、排行和历史记录都从按天汇总表中查询
             with sqlite3.connect(self.db_path) as conn:
                 c = conn.cursor()
-                excluded_users_placeholder = ','.join('?' for _ in excluded_users)
-                
+                # 今日与昨日聊天记录总条数
+                today_count = self._get_daily_count(c, session_id, today, excluded_users)
+                yesterday_count = self._get_daily_count(c, session_id, yesterday, excluded_users)
+
                 # 查询历史单日用户发送消息最高记录，排除特定用户，限定特定session_id
                 c.execute(f"""
-                    SELECT user, COUNT(*) as count, strftime('%Y-%m-%d', timestamp, 'unixepoch') as date 
-                    FROM chat_records 
+                    SELECT user, count, day
+                    FROM chat_daily_stats
                     WHERE sessionid = ? AND user NOT IN ({excluded_users_placeholder})
-                    GROUP BY date, user 
-                    ORDER BY count DESC 
+                    ORDER BY count DESC
                     LIMIT 1
                 """, [session_id] + excluded_users)
                 top_user_record = c.fetchone()
@@ -242,24 +280,31 @@ class ChatStatistics(Plugin):
 
                 # 查询特定session_id下历史单日聊天量最高的记录
                 c.execute(f"""
-                    SELECT COUNT(*) as count, strftime('%Y-%m-%d', timestamp, 'unixepoch') as date 
-                    FROM chat_records 
+                    SELECT SUM(count) as total, day
+                    FROM chat_daily_stats
                     WHERE sessionid = ? AND user NOT IN ({excluded_users_placeholder})
-                    GROUP BY date 
-                    ORDER BY count DESC 
+                    GROUP BY day
+                    ORDER BY total DESC
                     LIMIT 1
                 """, [session_id] + excluded_users)
                 top_day_record = c.fetchone()
                 top_day_count, top_day_date = top_day_record if top_day_record else (0, "无日期")
 
- 
-            # 获取今日活跃用户信息
-            user_message_count = Counter(record[2] for record in today_records)
-            sorted_users = user_message_count.most_common(6)
+                # 获取今日活跃用户信息
+                sorted_users = self._get_daily_user_counts(c, session_id, today, excluded_users, limit=6)
+
+            # 计算今日与昨日聊天量的百分比变化
+            percent_change = ((today_count - yesterday_count) / yesterday_count * 100) if yesterday_count > 0 else float('inf')
+            # percent_change_str = f"+{percent_change:.0f}%" if percent_change >= 0 else f"{percent_change:.0f}%"
+            percent_change_str = f"{percent_change:+.2f}%"
+            # 组装今日聊天榜信息和昨日数据
+            today_info = f"😈 今日群员聊天榜🏆 总 {today_count} 条"
+            change_emoji = "🔺" if percent_change >= 0 else "🔻"
+            yesterday_info = f"😴 较昨日: {yesterday_count} 条 {percent_change_str}"
 
-            # 提取今日最活跃用户的聊天内容
+            # 提取今日最活跃用户最近的聊天内容
             top_user_today = sorted_users[0][0] if sorted_users else None
-            top_user_today_messages = [record[3] for record in today_records if record[2] == top_user_today]
+            top_user_today_messages = [record[3] for record in self._get_records(session_id, user=top_user_today, limit=5)] if top_user_today else []
             #打印获取到的top_user_today_messages的数量
             logger.debug(f"今日top_user共发送了{len(top_user_today_messages)}条消息")
             model_analysis = ""
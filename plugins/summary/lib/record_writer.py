@@ -0,0 +1,121 @@
+import atexit
+import datetime
+import sqlite3
+import threading
+import time
+from collections import Counter
+from queue import Empty, Queue
+
+from common.log import logger
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_record_writer(db_path, batch_size=100, flush_interval_ms=500):
+    """同一个数据库只启动一个写线程，插件重新加载时复用"""
+    with _writers_lock:
+        writer = _writers.get(db_path)
+        if writer is None:
+            writer = ChatRecordWriter(db_path, batch_size, flush_interval_ms)
+            _writers[db_path] = writer
+        return writer
+
+
+class ChatRecordWriter:
+    """
+    聊天记录写线程，消息处理线程只把记录放入队列，
+    写线程持有一个长连接(WAL模式)，每攒够batch_size条或每隔flush_interval_ms毫秒提交一次事务
+    """
+
+    def __init__(self, db_path, batch_size=100, flush_interval_ms=500):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.queue = Queue()
+        self.thread = threading.Thread(target=self._run, name="c_summary-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def insert(self, record):
+        """record: (sessionid, msgid, user, content, type, timestamp, is_triggered)"""
+        self.queue.put(record)
+
+    def flush(self, timeout=5):
+        """等待队列中已有的记录全部写入"""
+        if not self.thread.is_alive():
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(5)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _run(self):
+        conn = self._connect()
+        running = True
+        while running:
+            item = self.queue.get()
+            batch = []
+            waiters = []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    running = False
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except Empty:
+                    break
+            if batch:
+                self._write_batch(conn, batch)
+            for waiter in waiters:
+                waiter.set()
+        conn.close()
+
+    def _write_batch(self, conn, batch):
+        try:
+            with conn:
+                daily_counts = Counter()
+                for record in batch:
+                    cur = conn.execute("INSERT OR IGNORE INTO chat_records VALUES (?,?,?,?,?,?,?)", record)
+                    if cur.rowcount == 1:
+                        session_id, _, user, _, _, timestamp, _ = record
+                        daily_counts[(session_id, record_day(timestamp), user)] += 1
+                    else:  # 重复的消息只更新内容，不重复计数
+                        conn.execute(
+                            "UPDATE chat_records SET user=?, content=?, type=?, timestamp=?, is_triggered=? WHERE sessionid=? AND msgid=?",
+                            record[2:] + record[:2],
+                        )
+                # 同步更新按天、按用户汇总的统计表
+                conn.executemany(
+                    """INSERT INTO chat_daily_stats (sessionid, day, user, count) VALUES (?,?,?,?)
+                    ON CONFLICT(sessionid, day, user) DO UPDATE SET count = count + excluded.count""",
+                    [key + (count,) for key, count in daily_counts.items()],
+                )
+            logger.debug("[c_summary] {} chat records written to db".format(len(batch)))
+        except Exception as e:
+            logger.error(f"Error inserting records: {e}")
+
+
+def record_day(timestamp):
+    """记录所属的日期(本地时间)，与sqlite的strftime('%Y-%m-%d', timestamp, 'unixepoch', 'localtime')一致"""
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d")
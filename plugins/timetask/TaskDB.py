@@ -0,0 +1,207 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+import os
+import sqlite3
+import threading
+import time
+from typing import List
+
+from lib import itchat
+from plugins.timetask.Tool import ExcelTool, TimeTaskModel
+
+#列名，顺序与 TimeTaskModel.get_formatItem 一致
+COLUMNS = ["taskId", "enable", "timeStr", "circleTimeStr", "eventStr", "fromUser", "fromUser_id", "toUser", "toUser_id",
+           "other_user_nickname", "other_user_id", "isGroup", "originMsg", "is_today_consumed"]
+TASK_TABLE = "tasks"
+HISTORY_TABLE = "history_tasks"
+
+
+#SQLite任务存储：每次增删改只更新对应的行，不再整体读写Excel
+class TaskDB(object):
+    __db_name = "timeTask.db"
+    __lock = threading.RLock()
+    __conn = None
+
+    #数据库连接（进程内共享一个连接，读写加锁）
+    def get_conn(self):
+        if TaskDB.__conn is None:
+            with TaskDB.__lock:
+                if TaskDB.__conn is None:
+                    conn = sqlite3.connect(ExcelTool().get_file_path(self.__db_name), check_same_thread=False)
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    self.create_tables(conn)
+                    TaskDB.__conn = conn
+                    self.migrateFromExcel()
+        return TaskDB.__conn
+
+    #建表、索引
+    def create_tables(self, conn):
+        columns = ", ".join(f"{name} TEXT" for name in COLUMNS)
+        with conn:
+            for table in (TASK_TABLE, HISTORY_TABLE):
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY AUTOINCREMENT, {columns}, next_fire INTEGER)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_tasks_taskId ON {TASK_TABLE}(taskId)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_tasks_next_fire ON {TASK_TABLE}(next_fire)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_tasks_other_user ON {TASK_TABLE}(other_user_id, isGroup)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_history_taskId ON {HISTORY_TABLE}(taskId)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    #执行SQL
+    def execute(self, sql, params=()):
+        conn = self.get_conn()
+        with TaskDB.__lock, conn:
+            return conn.execute(sql, params).fetchall()
+
+    #计算下次触发时间
+    def next_fire(self, item):
+        try:
+            return TimeTaskModel(item, None, False).get_next_fireTime()
+        except Exception as e:
+            print(f"[timetask] 计算任务下次触发时间失败：{item[0]}, {e}")
+            return None
+
+    #行数据（补齐列数）
+    def format_row(self, item):
+        row = [None if value is None else str(value) for value in list(item)[:len(COLUMNS)]]
+        return row + [None] * (len(COLUMNS) - len(row))
+
+    #读取任务列表,返回元组列表
+    def readTasks(self, table=TASK_TABLE):
+        return self.execute(f"SELECT {', '.join(COLUMNS)} FROM {table} ORDER BY id")
+
+    #读取单个任务
+    def readTask(self, taskId):
+        rows = self.execute(f"SELECT {', '.join(COLUMNS)} FROM {TASK_TABLE} WHERE taskId = ? ORDER BY id", (taskId,))
+        return rows[0] if rows else None
+
+    #读取 截止时间前 需要触发的任务
+    def readDueTasks(self, until_timestamp):
+        return self.execute(f"SELECT {', '.join(COLUMNS)} FROM {TASK_TABLE} WHERE next_fire <= ? ORDER BY next_fire", (int(until_timestamp),))
+
+    #读取 发给某个用户/群 的任务
+    def readTasksWithUser(self, other_user_id, isGroup=None):
+        if isGroup is None:
+            return self.execute(f"SELECT {', '.join(COLUMNS)} FROM {TASK_TABLE} WHERE other_user_id = ? ORDER BY id", (other_user_id,))
+        return self.execute(f"SELECT {', '.join(COLUMNS)} FROM {TASK_TABLE} WHERE other_user_id = ? AND isGroup = ? ORDER BY id",
+                            (other_user_id, "1" if isGroup else "0"))
+
+    #添加任务
+    def addTask(self, item, table=TASK_TABLE):
+        row = self.format_row(item)
+        self.execute(f"INSERT INTO {table} ({', '.join(COLUMNS)}, next_fire) VALUES ({', '.join('?' * (len(COLUMNS) + 1))})",
+                     row + [self.next_fire(row) if table == TASK_TABLE else None])
+
+    #更新任务的某一列（column从1开始，与Excel列号一致），返回 是否存在、任务模型
+    def write_columnValue_withTaskId(self, taskId, column: int, columnValue: str):
+        name = COLUMNS[column - 1]
+        with TaskDB.__lock:
+            rows = self.execute(f"SELECT id, {', '.join(COLUMNS)} FROM {TASK_TABLE} WHERE taskId = ?", (taskId,))
+            if len(rows) <= 0:
+                return False, None
+            taskContent = None
+            for row in rows:
+                item = list(row[1:])
+                item[column - 1] = columnValue
+                self.execute(f"UPDATE {TASK_TABLE} SET {name} = ?, next_fire = ? WHERE id = ?", (columnValue, self.next_fire(item), row[0]))
+                taskContent = TimeTaskModel(row[1:], None, False)
+            return True, taskContent
+
+    #将历史任务迁移至历史表，返回最新任务列表
+    def moveTasksToHistory(self, tasks):
+        conn = self.get_conn()
+        hisIds = []
+        with TaskDB.__lock, conn:
+            for item in tasks:
+                taskId = item[0]
+                hisIds.append(taskId)
+                conn.execute(f"DELETE FROM {TASK_TABLE} WHERE taskId = ?", (taskId,))
+                conn.execute(f"INSERT INTO {HISTORY_TABLE} ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", self.format_row(item))
+        print(f"将任务表中的 过期任务 迁移至 -> 历史表 完毕~ \n 迁移的任务ID为：{hisIds}")
+        return self.readTasks()
+
+    #凌晨重新计算所有任务的下次触发时间
+    def refresh_nextFire(self):
+        with TaskDB.__lock:
+            for row in self.execute(f"SELECT id, {', '.join(COLUMNS)} FROM {TASK_TABLE}"):
+                self.execute(f"UPDATE {TASK_TABLE} SET next_fire = ? WHERE id = ?", (self.next_fire(row[1:]), row[0]))
+
+    #更新用户ID（重新登录后itchat的用户ID会变化）
+    def update_userId(self):
+        tempArray: List[TimeTaskModel] = [TimeTaskModel(item, None, False) for item in self.readTasks()]
+        if len(tempArray) <= 0:
+            return
+
+        #id字典数组：将相同目标人的ID聚合为一个数组
+        idsDic = {}
+        groupIdsDic = {}
+        for model in tempArray:
+            targetDic = groupIdsDic if model.isGroup else idsDic
+            targetDic.setdefault(model.other_user_nickname, []).append(model)
+        #只有群任务时也需要重新映射群ID
+        if len(idsDic) <= 0 and len(groupIdsDic) <= 0:
+            return
+
+        #原始ID ：新ID
+        oldAndNewIDDic = ExcelTool().getNewId(idsDic, groupIdsDic)
+        if len(oldAndNewIDDic) <= 0:
+            return
+
+        #机器人ID
+        robot_user_id = itchat.instance.storageClass.userName
+        with TaskDB.__lock:
+            for row in self.execute(f"SELECT id, {', '.join(COLUMNS)} FROM {TASK_TABLE}"):
+                model = TimeTaskModel(row[1:], None, False)
+                oldId = model.other_user_id
+                newId = oldAndNewIDDic.get(oldId)
+                if newId is None or len(newId) <= 0:
+                    continue
+                #替换原始消息体中的目标ID、机器人ID
+                newString = model.originMsg.replace(oldId, newId).replace(model.toUser_id, robot_user_id)
+                self.execute(f"UPDATE {TASK_TABLE} SET fromUser_id = ?, toUser_id = ?, other_user_id = ?, originMsg = ? WHERE id = ?",
+                             (newId, robot_user_id, newId, newString, row[0]))
+
+    #读取元数据
+    def get_meta(self, key):
+        rows = self.execute("SELECT value FROM meta WHERE key = ?", (key,))
+        return rows[0][0] if rows else None
+
+    #写入元数据
+    def set_meta(self, key, value):
+        self.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    #从Excel迁移任务（只执行一次）
+    def migrateFromExcel(self):
+        if self.get_meta("excel_migrated"):
+            return
+        excelTool = ExcelTool()
+        excel_path = excelTool.get_file_path()
+        count = 0
+        if os.path.exists(excel_path):
+            from openpyxl import load_workbook
+            wb = load_workbook(excel_path)
+            for sheet_name, table in (("定时任务", TASK_TABLE), ("历史任务", HISTORY_TABLE)):
+                if sheet_name not in wb.sheetnames:
+                    continue
+                for item in wb[sheet_name].values:
+                    if item is None or len(item) < 13 or not item[0]:
+                        continue
+                    #统一时间、日期格式（Excel中编辑过的单元格可能是datetime类型）
+                    self.addTask(TimeTaskModel(item, None, False).get_formatItem(), table)
+                    count += 1
+            print(f"[timetask] 已将Excel中的{count}条任务迁移至SQLite：{excel_path}")
+        self.set_meta("excel_migrated", str(int(time.time())))
+
+    #导出为Excel报表
+    def exportToExcel(self, file_name="timeTask_export.xlsx"):
+        from openpyxl import Workbook
+        wb = Workbook()
+        wb.remove(wb.active)
+        for sheet_name, table in (("定时任务", TASK_TABLE), ("历史任务", HISTORY_TABLE)):
+            ws = wb.create_sheet(sheet_name)
+            for item in self.readTasks(table):
+                ws.append(item)
+        file_path = ExcelTool().get_file_path(file_name)
+        wb.save(file_path)
+        print(f"[timetask] 任务已导出至Excel：{file_path}")
+        return file_path
@@ -0,0 +1,123 @@
+# encoding:utf-8
+
+import threading
+import time
+from collections import deque
+
+from common import metrics_server
+from common.handler_pool import HandlerLane
+from common.latency_histogram import LatencyHistogram
+from common.log import logger
+
+
+#按通道限制发送速率的令牌桶
+class SendRateLimiter(object):
+
+    def __init__(self, rate, burst=None):
+        #每秒发送条数，<=0表示不限制
+        self.rate = rate
+        self.capacity = burst or max(1, rate)
+        self.tokens = self.capacity
+        self.updateTime = time.monotonic()
+        self.lock = threading.Lock()
+
+    #取得一个发送名额，没有名额时等待
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updateTime) * self.rate)
+                self.updateTime = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                waitSeconds = (1 - self.tokens) / self.rate
+            time.sleep(waitSeconds)
+
+
+#并行执行到期的定时任务：线程数有上限，同一接收者的任务按触发顺序依次执行，发送按通道限速
+class TaskRunner(object):
+
+    def __init__(self, runFunc, workers=4, send_rate=2):
+        #执行单个任务的函数
+        self.runFunc = runFunc
+        self.lane = HandlerLane("timetask", max(1, workers), 0)
+        self.send_rate = send_rate
+        self.lock = threading.Lock()
+        #接收者 -> 等待执行的任务队列；有队列表示该接收者的任务正在执行
+        self.receiverQueues = {}
+        #通道 -> 限速器
+        self.limiters = {}
+        #触发延迟（实际发送时间 - 应触发时间）
+        self.fireDelay = LatencyHistogram()
+        self.missed = 0
+        self.caughtUp = 0
+        metrics_server.register("timetask", self.get_stats)
+
+    #提交到期任务
+    def submit(self, model, dueTime):
+        receiver = self.get_receiverKey(model)
+        with self.lock:
+            queue = self.receiverQueues.get(receiver)
+            if queue is not None:
+                queue.append((model, dueTime))
+                return
+            self.receiverQueues[receiver] = deque([(model, dueTime)])
+        self.lane.submit(self.drain, receiver)
+
+    #依次执行一个接收者的任务，队列为空时退出
+    def drain(self, receiver):
+        while True:
+            with self.lock:
+                queue = self.receiverQueues[receiver]
+                if len(queue) <= 0:
+                    del self.receiverQueues[receiver]
+                    return
+                model, dueTime = queue.popleft()
+            try:
+                self.runFunc(model, dueTime)
+            except Exception as e:
+                logger.exception(f"[timetask] 执行定时任务【{model.taskId}】发生了错误：{e}")
+
+    #任务的接收者：个人为群聊制定的任务以群标题区分
+    def get_receiverKey(self, model):
+        if model.isPerson_makeGrop():
+            _, groupTitle = model.get_Persion_makeGropTitle_eventStr()
+            return "group:" + groupTitle
+        return model.other_user_id
+
+    #发送前等待通道的发送名额
+    def acquire_send(self, channel_name):
+        with self.lock:
+            limiter = self.limiters.get(channel_name)
+            if limiter is None:
+                limiter = SendRateLimiter(self.send_rate)
+                self.limiters[channel_name] = limiter
+        limiter.acquire()
+
+    #记录触发延迟
+    def record_fireDelay(self, dueTime):
+        if dueTime is None:
+            return
+        with self.lock:
+            self.fireDelay.record(max(0.0, time.time() - dueTime))
+
+    #记录停机期间错过的任务
+    def record_missed(self, caughtUp):
+        with self.lock:
+            self.missed += 1
+            if caughtUp:
+                self.caughtUp += 1
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "executor": self.lane.stats(),
+                "busy_receivers": len(self.receiverQueues),
+                "queued": sum(len(queue) for queue in self.receiverQueues.values()),
+                "fire_delay": self.fireDelay.snapshot(),
+                "missed": self.missed,
+                "caught_up": self.caughtUp,
+            }
@@ -1,11 +1,13 @@
 # encoding:utf-8
 
-from plugins.timetask.Tool import ExcelTool
+from plugins.timetask.TaskDB import TaskDB
+from plugins.timetask.TaskRunner import TaskRunner
 from plugins.timetask.Tool import TimeTaskModel
 import logging
 import time
 import arrow
 import threading
+import heapq
 from typing import List
 from plugins.timetask.config import conf, load_config
 from lib import itchat
@@ -17,6 +19,10 @@ except Exception as e:
     print(f"未安装ntchat: {e}")
 
 
+# 没有任务到期时，检测重新登录的间隔（秒）
+RELOGIN_CHECK_INTERVAL = 60
+
+
 class TaskManager(object):
     
     def __init__(self, timeTaskFunc):
@@ -24,6 +30,20 @@ class TaskManager(object):
         #保存定时任务回调
         self.timeTaskFunc = timeTaskFunc
         
+        #任务数组
+        self.timeTasks = []
+        #按下次触发时间排序的最小堆：(触发时间戳, 序号, 任务模型)
+        self.taskHeap = []
+        self.heapSeq = 0
+        #任务列表的版本，每次刷新加一
+        self.generation = 0
+        #任务最近一次触发的时间戳，避免同一分钟内刷新数据后重复触发
+        self.lastFireTimes = {}
+        #任务变化时唤醒调度线程
+        self.condition = threading.Condition()
+        #到期任务的执行线程池
+        self.runner = TaskRunner(self.runTaskItem, conf().get("task_workers", 4), conf().get("send_rate_limit", 2))
+
         # 创建子线程
         t = threading.Thread(target=self.pingTimeTask_in_sub_thread)
         t.setDaemon(True) 
@@ -37,39 +57,47 @@ class TaskManager(object):
         #检测是否重新登录了
         self.isRelogin = False
         
-        #迁移任务的标识符：用于标识在目标时间，只迁移一次
-        self.moveHistoryTask_identifier = ""
-        
-        #刷新任务的标识符：用于标识在目标时间，只刷新一次
-        self.refreshTimeTask_identifier = ""
-        
-        #存放历史数据
-        self.historyTasks = []
-        
         #配置加载
         load_config()
         self.conf = conf()
         self.debug = self.conf.get("debug", False)
         #迁移任务的时间
         self.move_historyTask_time = self.conf.get("move_historyTask_time", "04:00:00")
-        #默认每秒检测一次
+        #未登录时的检测间隔
         self.time_check_rate = self.conf.get("time_check_rate", 1)
         
-        #excel创建
-        obj = ExcelTool()
-        obj.create_excel()
-        #任务数组
+        #任务数组（首次启动时会自动迁移Excel中的任务）
         self.refreshDataFromExcel()
-        #过期任务数组、现在待消费数组、未来任务数组
-        historyArray, _, _ = self.getFuncArray(self.timeTasks)
+        #处理停机期间错过的任务
+        self.catchUp_missedTasks()
         #启动时，默认迁移一次过期任务
-        self.moveTask_toHistory(historyArray)
+        self.moveTask_toHistory()
         
-        #循环
+        #凌晨刷新、迁移历史任务的时间
+        self.refreshTime = self.get_nextTargetTime("00:00:00")
+        self.moveHistoryTime = self.get_nextTargetTime(self.move_historyTask_time)
+
+        #循环：休眠到最近的任务触发时间，添加、取消任务时被唤醒
         while True:
-            # 定时检测
-            self.timeCheck()
-            time.sleep(int(self.time_check_rate))
+            with self.condition:
+                waitSeconds = self.get_nextWakeupTime() - time.time()
+                if waitSeconds > 0:
+                    self.condition.wait(waitSeconds)
+            try:
+                self.timeCheck()
+            except Exception as e:
+                print(f"[timetask] 定时检测发生了错误：{e}")
+                time.sleep(int(self.time_check_rate))
+            #重新登录、未登录时，到期的任务保留在堆中，等待登录完成
+            if self.isRelogin:
+                time.sleep(int(self.time_check_rate))
+
+    #下次需要唤醒的时间
+    def get_nextWakeupTime(self):
+        wakeupTime = min(self.refreshTime, self.moveHistoryTime, time.time() + RELOGIN_CHECK_INTERVAL)
+        if len(self.taskHeap) > 0:
+            wakeupTime = min(wakeupTime, self.taskHeap[0][0])
+        return wakeupTime
     
     #时间检查
     def timeCheck(self):
@@ -80,55 +108,47 @@ class TaskManager(object):
         if self.isRelogin:
             return
         
-        #过期任务数组、现在待消费数组、未来任务数组
-        modelArray = self.timeTasks
-        historyArray, currentExpendArray, featureArray = self.getFuncArray(modelArray)
-        
-        #存放历史数据
-        if len(historyArray) > 0:
-            for item in historyArray:
-                if item not in currentExpendArray and item not in featureArray and item not in self.historyTasks:
-                      self.historyTasks.append(item)
+        now = time.time()
         
-        #是否到了凌晨00:00 - 目标时间，刷新今天的cron任务
-        if self.is_targetTime("00:00"):
-            #刷新cron时间任务、周期任务的今天执行态
-            self.refresh_times(featureArray) 
-        elif len(self.refreshTimeTask_identifier) > 0:
-            self.refreshTimeTask_identifier = ""
+        #是否到了凌晨00:00 - 目标时间，刷新周期任务的今天执行态
+        if now >= self.refreshTime:
+            self.refreshTime = self.get_nextTargetTime("00:00:00")
+            self.refresh_times()
             
-        
         #是否到了迁移历史任务 - 目标时间
-        if self.is_targetTime(self.move_historyTask_time):
-            #迁移过期任务
-            self.moveTask_toHistory(self.historyTasks)
-        elif len(self.moveHistoryTask_identifier) > 0:
-            self.moveHistoryTask_identifier = ""
-            
-        #任务数组
-        if len(modelArray) <= 0:
-            return
-                    
-        #将数组赋值数组，提升性能(若self.timeTasks 未被多线程更新，赋值为待执行任务组)
-        timeTask_ids = '😄'.join(item.taskId for item in self.timeTasks)
-        modelArray_ids = '😄'.join(item.taskId for item in modelArray)
-        featureArray_ids = '😄'.join(item.taskId for item in featureArray)
-        if timeTask_ids == modelArray_ids and timeTask_ids != featureArray_ids:
-            #将任务数组 更新为 待执行数组； 当前任务在下面执行消费逻辑
-            self.timeTasks = featureArray
-            print(f"内存任务更新：原任务列表 -> 待执行任务列表")
-            print(f"原任务ID列表：{timeTask_ids}")
-            print(f"待执行任务ID列表：{featureArray_ids}")
-        
-        #当前无待消费任务     
+        if now >= self.moveHistoryTime:
+            self.moveHistoryTime = self.get_nextTargetTime(self.move_historyTask_time)
+            self.moveTask_toHistory()
+
+        #取出到期的任务
+        currentExpendArray = []
+        with self.condition:
+            while len(self.taskHeap) > 0 and self.taskHeap[0][0] <= now:
+                fireTime, _, model = heapq.heappop(self.taskHeap)
+                #任务已被刷新替换或时间已变化
+                if model.next_fireTime != fireTime or self.lastFireTimes.get(model.taskId, 0) >= fireTime:
+                    continue
+                self.lastFireTimes[model.taskId] = fireTime
+                currentExpendArray.append((model, fireTime))
+
+        #当前无待消费任务
         if len(currentExpendArray) <= 0:
             if self.debug:
                 logging.info("[timetask][定时检测]：当前时刻 - 无定时任务...")
-            return
+        else:
+            #消费当前task
+            print(f"[timetask][定时检测]：当前时刻 - 存在定时任务, 执行消费 当前时刻任务")
+            self.runTaskArray(currentExpendArray)
+
+            #周期任务放回堆中，等待下次触发
+            with self.condition:
+                for model, _ in currentExpendArray:
+                    #执行过程中任务列表被刷新时，新的任务模型已经放入堆中
+                    if model.generation == self.generation:
+                        self.scheduleTask(model)
         
-        #消费当前task
-        print(f"[timetask][定时检测]：当前时刻 - 存在定时任务, 执行消费 当前时刻任务")
-        self.runTaskArray(currentExpendArray)
+        #记录调度线程的存活时间（在派发之后写入：不晚于该时间的触发都已派发），重启后据此判断停机期间错过的任务
+        TaskDB().set_meta("last_alive", str(now))
         
         
     #检测是否重新登录了    
@@ -174,7 +194,7 @@ class TaskManager(object):
                     time.sleep(3)
                     
                     #更新userId
-                    ExcelTool().update_userId()
+                    TaskDB().update_userId()
                     #刷新数据
                     self.refreshDataFromExcel()
                     
@@ -185,213 +205,160 @@ class TaskManager(object):
             self.isRelogin = True      
         
             
-    #拉取Excel最新数据    
+    #拉取数据库最新数据
     def refreshDataFromExcel(self):
-        tempArray = ExcelTool().readExcel()
+        tempArray = TaskDB().readTasks()
         self.convetDataToModelArray(tempArray) 
         
-    #迁移历史任务   
-    def moveTask_toHistory(self, modelArray):
-        if len(modelArray) <= 0:
+    #迁移历史任务（已停用、不会再触发的任务）
+    def moveTask_toHistory(self):
+        historyArray = [model.get_formatItem() for model in self.timeTasks if model.next_fireTime is None]
+        if len(historyArray) <= 0:
             return
-          
-        #当前时间的小时：分钟
-        current_time_hour_min = arrow.now().format('HH:mm')
-        #执行中 - 标识符
-        identifier_running = f"{current_time_hour_min}_running"
-        #结束 - 标识符
-        identifier_end = f"{current_time_hour_min}_end"
         
-        #当前状态
-        current_task_state = self.moveHistoryTask_identifier
-        
-        #未执行
-        if current_task_state == "":
-            #打印当前任务
-            new_array = [item.taskId for item in self.timeTasks]
-            print(f"[timeTask] 触发了迁移历史任务~ 当前任务ID为：{new_array}")
-            
-            #置为执行中
-            self.moveHistoryTask_identifier = identifier_running
-            #迁移任务
-            newTimeTask = ExcelTool().moveTasksToHistoryExcel(modelArray)
-            #数据刷新
-            self.convetDataToModelArray(newTimeTask)
-            
-        #执行中    
-        elif current_task_state == identifier_running:
-            return
-        
-        #执行完成
-        elif current_task_state == identifier_end:
-            self.moveHistoryTask_identifier == ""
-            
-        #容错：如果时间未跳动，则正常命中【执行完成】； 异常时间跳动时，则比较时间
-        elif "_end" in current_task_state:
-            #标识符中的时间
-            tempTimeStr = current_task_state.replace("_end", ":00")
-            current_time = arrow.now().replace(second=0, microsecond=0).time()
-            task_time = arrow.get(tempTimeStr, "HH:mm:ss").replace(second=0, microsecond=0).time()
-            tempValue = task_time < current_time
-            if tempValue:
-                self.moveHistoryTask_identifier == ""
+        #打印当前任务
+        print(f"[timeTask] 触发了迁移历史任务~ 迁移的任务ID为：{[item[0] for item in historyArray]}")
+        #迁移任务
+        newTimeTask = TaskDB().moveTasksToHistory(historyArray)
+        #数据刷新
+        self.convetDataToModelArray(newTimeTask)
+        #导出Excel报表
+        if self.conf.get("is_export_excel", False):
+            TaskDB().exportToExcel()
                 
                 
-    #刷新c任务   
-    def refresh_times(self, modelArray):
-        #当前时间的小时：分钟
-        current_time_hour_min = arrow.now().format('HH:mm')
-        #执行中 - 标识符
-        identifier_running = f"{current_time_hour_min}_running"
-        #结束 - 标识符
-        identifier_end = f"{current_time_hour_min}_end"
-        
-        #当前状态
-        current_task_state = self.refreshTimeTask_identifier
-        
-        #未执行
-        if current_task_state == "":
-            #打印此时任务
-            new_array = [item.taskId for item in self.timeTasks]
-            print(f"[timeTask] 触发了凌晨刷新任务~ 当前任务ID为：{new_array}")
-            
-            #置为执行中
-            self.refreshTimeTask_identifier = identifier_running
-            #刷新任务
-            for m in modelArray:
-                taskModel : TimeTaskModel = m
-                taskModel.is_today_consumed = False
-                ExcelTool().write_columnValue_withTaskId_toExcel(taskModel.taskId, 14, "0")
-            
-            #刷新数据
-            self.refreshDataFromExcel()
-            
-        #执行中    
-        elif current_task_state == identifier_running:
-            return
+    #凌晨刷新周期任务的今天执行态
+    def refresh_times(self):
+        #打印此时任务
+        new_array = [item.taskId for item in self.timeTasks]
+        print(f"[timeTask] 触发了凌晨刷新任务~ 当前任务ID为：{new_array}")
+
+        #刷新任务
+        for model in self.timeTasks:
+            if model.is_today_consumed:
+                TaskDB().write_columnValue_withTaskId(model.taskId, 14, "0")
+        #重新计算下次触发时间
+        TaskDB().refresh_nextFire()
+
+        #刷新数据
+        self.refreshDataFromExcel()
         
-        #执行完成
-        elif current_task_state == identifier_end:
-            self.refreshTimeTask_identifier == ""
-            
-        #容错：如果时间未跳动，则正常命中【执行完成】； 异常时间跳动时，则比较时间
-        elif "_end" in current_task_state:
-            #标识符中的时间
-            tempTimeStr = current_task_state.replace("_end", ":00")
-            current_time = arrow.now().replace(second=0, microsecond=0).time()
-            task_time = arrow.get(tempTimeStr, "HH:mm:ss").replace(second=0, microsecond=0).time()
-            tempValue = task_time < current_time
-            if tempValue:
-                self.refreshTimeTask_identifier == ""
+    #下一次到达目标时间(HH:mm:ss)的时间戳
+    def get_nextTargetTime(self, timeStr):
+        tempTimeStr = timeStr
+        #如果是分钟
+        if tempTimeStr.count(":") == 1:
+           tempTimeStr = tempTimeStr + ":00"
+        target_time = arrow.get(tempTimeStr, "HH:mm:ss")
+        now = arrow.now()
+        next_time = now.replace(hour=target_time.hour, minute=target_time.minute, second=target_time.second, microsecond=0)
+        if next_time <= now:
+            next_time = next_time.shift(days=1)
+        return next_time.timestamp()
        
-    #获取功能数组    
-    def getFuncArray(self, modelArray):
-        #待消费数组
-        featureArray = []
-        #当前待消费数组
-        currentExpendArray=[]
-        #过期任务数组
-        historyArray=[]
-        #遍历检查时间
-        for item in modelArray:
-            model : TimeTaskModel = item
-            if model.enable:
-                #是否现在时刻
-                is_nowTime, nowTime = model.is_nowTime()
-                #是否未来时刻
-                is_featureTime = model.is_featureTime()
-                #是否today
-                is_today = model.is_today()
-                #是否未来day
-                is_featureDay = model.is_featureDay()
-            
-                #是否历史
-                isHistory = True
-                #由于一个model既可以是当前的任务，又可能是以后得任务，所以这里对一个model同时判定现在和未来的判定
-                #是否现在时刻的任务
-                if is_nowTime and is_today:
-                    #精度为分钟，cron中消费本次任务
-                    if model.isCron_time():
-                       if nowTime in model.cron_today_times:
-                            model.cron_today_times.remove(nowTime)
-                            currentExpendArray.append(model)
-                            isHistory = False
-                        
-                    #今天未被消费
-                    elif not model.is_today_consumed:
-                        currentExpendArray.append(model)
-                        isHistory = False
-                        model.is_today_consumed = True       
-                
-                #是否当前时刻后面待消费任务
-                if (is_featureTime and is_today) or is_featureDay:
-                    featureArray.append(model)
-                    isHistory = False                     
-                
-                #存入历史数组
-                if isHistory:
-                    historyArray.append(model.get_formatItem())
-            else:
-                historyArray.append(model.get_formatItem())  
-        
-        return  historyArray, currentExpendArray, featureArray     
-        
-          
-    #执行task
-    def runTaskArray(self, modelArray):
-        try:
-            #执行任务列表
-            for _, model in enumerate(modelArray):
-                self.runTaskItem(model)
-        except Exception as e:
-            print(f"执行定时任务，发生了错误：{e}")
-            
+    #执行task：在调度线程中标记消费状态（决定下次触发时间），交给执行线程池执行
+    def runTaskArray(self, taskArray):
+        for model, dueTime in taskArray:
+            try:
+                self.expendTaskItem(model)
+                self.runner.submit(model, dueTime)
+            except Exception as e:
+                print(f"执行定时任务，发生了错误：{e}")
                 
-    #执行task
-    def runTaskItem(self, model: TimeTaskModel):
+    #标记task为今日已消费
+    def expendTaskItem(self, model: TimeTaskModel):
         #非cron，置为已消费
         if not model.isCron_time():
             model.is_today_consumed = True
             #置为消费
-            ExcelTool().write_columnValue_withTaskId_toExcel(model.taskId, 14, "1")
-        
+            TaskDB().write_columnValue_withTaskId(model.taskId, 14, "1")
+
+    #执行task（执行线程池中）
+    def runTaskItem(self, model: TimeTaskModel, dueTime=None):
         print(f"😄执行定时任务:【{model.taskId}】，任务详情：{model.circleTimeStr} {model.timeStr} {model.eventStr}")
         #回调定时任务执行
         self.timeTaskFunc(model)
+        self.runner.record_fireDelay(dueTime)
         
-        #任务消费
+        #任务消费：一次性任务置为不可用，等待迁移至历史表
         if not model.is_featureDay():
-            obj = ExcelTool()
-            obj.write_columnValue_withTaskId_toExcel(model.taskId , 2, "0")
-            #刷新数据
-            self.refreshDataFromExcel()
+            TaskDB().write_columnValue_withTaskId(model.taskId , 2, "0")
+            model.enable = False
+            model.next_fireTime = None
+
+    #处理停机期间错过的任务：skip=跳过，run_once=在宽限时间内的任务补发一次
+    def catchUp_missedTasks(self):
+        lastAlive = TaskDB().get_meta("last_alive")
+        if lastAlive is None:
+            return
+        policy = self.conf.get("missed_task_policy", "skip")
+        grace = self.conf.get("missed_task_grace", 3600)
+        lastAliveTime = arrow.get(float(lastAlive)).to("local")
+        #当前分钟内的任务由调度线程正常触发
+        currentMinute = arrow.now().floor("minute").timestamp()
+        today = arrow.now().date()
+
+        catchUpArray = []
+        for model in self.timeTasks:
+            dueTime = model.get_next_fireTime(lastAliveTime)
+            #不晚于心跳时间的触发在停机前已经派发过，从心跳的下一分钟开始计算
+            if dueTime is not None and dueTime <= lastAliveTime.timestamp():
+                dueTime = model.get_next_fireTime(lastAliveTime.floor("minute").shift(minutes=1))
+            if dueTime is None or dueTime >= currentMinute:
+                continue
+            caughtUp = policy == "run_once" and time.time() - dueTime <= grace
+            self.runner.record_missed(caughtUp)
+            print(f"[timetask] 停机期间错过了任务【{model.taskId}】，应触发时间：{arrow.get(dueTime).to('local').format('YYYY-MM-DD HH:mm:ss')}，{'补发' if caughtUp else '跳过'}")
+            if not caughtUp:
+                continue
+            with self.condition:
+                self.lastFireTimes[model.taskId] = dueTime
+            #错过的是今天的任务时，补发后置为今日已消费
+            if arrow.get(dueTime).to("local").date() == today:
+                self.expendTaskItem(model)
+            catchUpArray.append(model)
+            self.runner.submit(model, dueTime)
+
+        #重新计算补发任务的下次触发时间
+        with self.condition:
+            for model in catchUpArray:
+                if model.generation == self.generation:
+                    self.scheduleTask(model)
         
     #添加任务
     def addTask(self, taskModel: TimeTaskModel):
-        taskList = ExcelTool().addItemToExcel(taskModel.get_formatItem())
-        self.convetDataToModelArray(taskList)
+        TaskDB().addTask(taskModel.get_formatItem())
+        self.refreshDataFromExcel()
         return taskModel.taskId   
     
-    #model数组转换
+    #model数组转换，重建调度堆
     def convetDataToModelArray(self, dataArray):
         tempArray = []
         for item in dataArray:
-            model = TimeTaskModel(item, None, False, True)
+            model = TimeTaskModel(item, None, False)
             tempArray.append(model)
-        #赋值
-        self.timeTasks = tempArray
-        
-    #是否目标时间      
-    def is_targetTime(self, timeStr):
-        tempTimeStr = timeStr
-        #对比精准到分（忽略秒）
-        current_time = arrow.now().format('HH:mm')
-        
-        #如果是分钟
-        if tempTimeStr.count(":") == 1:
-           tempTimeStr = tempTimeStr + ":00"
-        
-        #转为分钟时间
-        task_time = arrow.get(tempTimeStr, "HH:mm:ss").format("HH:mm")
-        tempValue = current_time == task_time
-        return tempValue 
\ No newline at end of file
+        with self.condition:
+            #赋值
+            self.timeTasks = tempArray
+            self.generation += 1
+            self.taskHeap = []
+            taskIds = set()
+            for model in tempArray:
+                model.generation = self.generation
+                taskIds.add(model.taskId)
+                self.scheduleTask(model)
+            self.lastFireTimes = {taskId: fireTime for taskId, fireTime in self.lastFireTimes.items() if taskId in taskIds}
+            #唤醒调度线程，按新的任务列表重新计算休眠时间
+            self.condition.notify_all()
+
+    #计算任务下次触发时间并放入堆中（需持有self.condition）
+    def scheduleTask(self, model: TimeTaskModel):
+        lastFireTime = self.lastFireTimes.get(model.taskId)
+        fireTime = model.get_next_fireTime()
+        #本分钟已触发过，从下一分钟开始计算
+        if fireTime is not None and lastFireTime is not None and fireTime <= lastFireTime:
+            fireTime = model.get_next_fireTime(arrow.get(lastFireTime).to("local").shift(minutes=1))
+        model.next_fireTime = fireTime
+        if fireTime is not None:
+            self.heapSeq += 1
+            heapq.heappush(self.taskHeap, (fireTime, self.heapSeq, model))
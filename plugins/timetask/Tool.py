@@ -2,14 +2,10 @@
 # -*- coding: UTF-8 -*-
 
 import os
-from openpyxl import Workbook
-from openpyxl import load_workbook
-from openpyxl.styles import NamedStyle
 import hashlib
 import base64
 import arrow
 import re
-from typing import List
 import time
 from datetime import datetime
 from lib import itchat
@@ -17,214 +13,18 @@ from lib.itchat.content import *
 from channel.chat_message import ChatMessage
 from croniter import croniter
 import threading
+from common.contact_directory import KIND_FRIEND, KIND_GROUP, ContactDirectory
 try:
     from channel.wechatnt.ntchat_channel import wechatnt
+    #ntchat通道的群列表
+    ContactDirectory().register_loader("ntchat", KIND_GROUP, lambda: [(item.get("wxid"), item.get("nickname")) for item in wechatnt.get_rooms()])
 except Exception as e:
     print(f"未安装ntchat: {e}")
 
-try:
-    from channel.wework.run import wework
-except Exception as e:
-    print(f"未安装wework: {e}")
-
 class ExcelTool(object):
     __file_name = "timeTask.xlsx"
-    __sheet_name = "定时任务"
-    __history_sheet_name = "历史任务"
     __dir_name = "taskFile"
     
-    # 新建工作簿
-    def create_excel(self, file_name: str = __file_name, sheet_name=__sheet_name, history_sheet_name=__history_sheet_name):
-        # 文件路径
-        workbook_file_path = self.get_file_path(file_name)
-
-        # 创建Excel
-        if not os.path.exists(workbook_file_path):
-            wb = Workbook()
-            column_list_first = ['A', 'B', 'C', 'D', 'L']
-            width_value_first = 20
-            column_list_two = ['E', 'F', 'H', 'J']
-            width_value_two = 40
-            column_list_three = ['G', 'I', 'K']
-            width_value_three = 70
-            width_value_four = 600
-            
-            # 设置日期格式
-            date_format = NamedStyle(name='date_format')
-            date_format.number_format = 'YYYY-MM-DD'
-
-            #sheet1
-            ws = wb.create_sheet(sheet_name, 0)
-            # 类型处理
-            for column in ws.columns:
-                #日期格式
-                if column == "D":
-                    for cell in column:
-                        cell.style = date_format
-                #字符串        
-                else:
-                    for cell in column:
-                        cell.number_format = '@'
-            
-            #宽度处理 
-            for column in column_list_first:
-                ws.column_dimensions[column].width = width_value_first
-            for column in column_list_two:
-                ws.column_dimensions[column].width = width_value_two
-            for column in column_list_three:
-                ws.column_dimensions[column].width = width_value_three
-            ws.column_dimensions["M"].width = width_value_four 
-              
-            #sheet2
-            ws1 = wb.create_sheet(history_sheet_name, 1)
-            # 类型处理 - 设置为字符串
-            for column in ws1.columns:
-                for cell in column:
-                    cell.number_format = '@'
-                    
-            #宽度处理        
-            for column in column_list_first:
-                ws1.column_dimensions[column].width = width_value_first
-            for column in column_list_two:
-                ws1.column_dimensions[column].width = width_value_two
-            ws1.column_dimensions["M"].width = width_value_three     
-                    
-            wb.save(workbook_file_path)
-            print("定时Excel创建成功，文件路径为：{}".format(workbook_file_path))
-            
-        else:
-            wb = load_workbook(workbook_file_path)
-            if not history_sheet_name in wb.sheetnames:
-                wb.create_sheet(history_sheet_name, 1)
-                wb.save(workbook_file_path)
-                print(f"创建sheet: {history_sheet_name}")
-            else:
-                print("timeTask文件已存在, 无需创建")
-                
-
-    # 读取内容,返回元组列表
-    def readExcel(self, file_name=__file_name, sheet_name=__sheet_name):
-        # 文件路径
-        workbook_file_path = self.get_file_path(file_name)
-        
-        # 文件存在
-        if os.path.exists(workbook_file_path):
-            wb = load_workbook(workbook_file_path)
-            ws = wb[sheet_name]
-            data = list(ws.values)
-            #print(data)
-            if data is None or len(data) == 0:
-                print("[timeTask] 数据库timeTask任务列表数据为空")
-                
-            return data
-        else:
-            print("timeTask文件不存在, 读取数据为空")
-            self.create_excel()
-            return []
-        
-    # 将历史任务迁移指历史Sheet
-    def moveTasksToHistoryExcel(self, tasks, file_name=__file_name, sheet_name=__sheet_name, history_sheet_name=__history_sheet_name):
-        # 文件路径
-        workbook_file_path = self.get_file_path(file_name)
-        
-        # 文件存在
-        if os.path.exists(workbook_file_path):
-            wb = load_workbook(workbook_file_path)
-            ws = wb[sheet_name]
-            data = list(ws.values)
-            
-            #需要删除的坐标
-            rows_to_delete = []
-            #遍历任务列表
-            for i, item in enumerate(data):
-                 #任务ID
-                 taskId = item[0]
-                 for _, hisItem in enumerate(tasks):
-                    #历史任务ID
-                    his_taskId = hisItem[0]
-                    if taskId == his_taskId:
-                        rows_to_delete.append(i + 1)
-            
-            #排序坐标
-            sorted_rows_to_delete = sorted(rows_to_delete, reverse=True)
-                        
-            #遍历任务列表
-            for dx in sorted_rows_to_delete:
-                #移除
-                ws.delete_rows(dx)
-                
-            #保存            
-            wb.save(workbook_file_path)
-            
-            hisIds = []
-            #添加历史列表
-            for _, t in enumerate(tasks):
-                his_taskId = t[0]
-                hisIds.append(his_taskId)
-                self.addItemToExcel(t, file_name, history_sheet_name)     
-                
-            print(f"将任务Sheet({sheet_name})中的 过期任务 迁移指 -> 历史Sheet({history_sheet_name}) 完毕~ \n 迁移的任务ID为：{hisIds}")            
-            
-            #返回最新数据
-            return self.readExcel()  
-        else:
-            print("timeTask文件不存在, 数据为空")
-            self.create_excel()
-            return []
-
-    # 写入列表，返回元组列表
-    def addItemToExcel(self, item, file_name=__file_name, sheet_name=__sheet_name):
-        # 文件路径
-        workbook_file_path = self.get_file_path(file_name)
-        
-        # 如果文件存在,就执行
-        if os.path.exists(workbook_file_path):
-            wb = load_workbook(workbook_file_path)
-            ws = wb[sheet_name]
-            ws.append(item)
-            wb.save(workbook_file_path)
-            
-            # 列表
-            data = list(ws.values)
-            #print(data)
-            return data
-        else:
-            print("timeTask文件不存在, 添加数据失败")
-            self.create_excel()
-            return []
-        
-        
-    # 写入数据
-    def write_columnValue_withTaskId_toExcel(self, taskId, column: int, columnValue: str,  file_name=__file_name, sheet_name=__sheet_name):
-        #读取数据
-        data = self.readExcel(file_name, sheet_name)
-        if len(data) > 0:
-            # 表格对象
-            workbook_file_path = self.get_file_path(file_name)
-            wb = load_workbook(workbook_file_path)
-            ws = wb[sheet_name]
-            isExist = False
-            taskContent = None
-            #遍历
-            for index, hisItem in enumerate(data):
-                model = TimeTaskModel(hisItem, None, False)
-                #ID是否相同
-                if model.taskId == taskId:
-                    #置为已消费：即0
-                    ws.cell(index + 1, column).value = columnValue
-                    isExist = True
-                    taskContent = model
-                    
-            if isExist: 
-                #保存
-                wb.save(workbook_file_path)
-            
-            return isExist, taskContent
-        else:
-            print("timeTask文件无数据, 消费数据失败")
-            return False, None
-    
-    
     #获取文件路径      
     def get_file_path(self, file_name=__file_name):
         # 文件路径
@@ -241,148 +41,23 @@ class ExcelTool(object):
             
         return workbook_file_path
         
-    #更新用户ID  
-    def update_userId(self, file_name=__file_name, sheet_name=__sheet_name):
-        #是否重新登录了
-        datas = self.readExcel(file_name, sheet_name)
-        
-        if len(datas) <= 0:
-            return
-            
-        #模型数组
-        tempArray : List[TimeTaskModel] = []
-        #原始数据
-        for item in datas:
-            model = TimeTaskModel(item, None, False)
-            tempArray.append(model)
-            
-        #id字典数组：将相同目标人的ID聚合为一个数组
-        idsDic = {}
-        groupIdsDic = {}
-        for model in tempArray:
-            #目标用户名称
-            target_name = model.other_user_nickname
-            #群聊
-            if model.isGroup:
-                if not target_name in groupIdsDic.keys():
-                    groupIdsDic[target_name] = [model]
-                else:
-                    arr1 = groupIdsDic[target_name]
-                    arr1.append(model)
-                    groupIdsDic[target_name] = list(arr1) 
-            else:
-                #好友
-                if not target_name in idsDic.keys():
-                    idsDic[target_name] = [model]
-                else:
-                    arr2 = idsDic[target_name]
-                    arr2.append(model)
-                    idsDic[target_name] = list(arr2)
-        
-        #待更新的ID数组
-        if len(idsDic) <= 0:
-            return
-        
-        #原始ID ：新ID
-        oldAndNewIDDic = self.getNewId(idsDic, groupIdsDic)
-        if len(oldAndNewIDDic) <= 0:
-            return
-            
-        #更新列表数据
-        workbook_file_path = self.get_file_path(file_name)
-        wb = load_workbook(workbook_file_path)
-        ws = wb[sheet_name]
-        excel_data = list(ws.values)
-        #机器人ID
-        robot_user_id = itchat.instance.storageClass.userName
-        #遍历任务列表 - 更新数据
-        for index, item in enumerate(excel_data):
-            model = TimeTaskModel(item, None, False)
-            #目标用户ID
-            oldId = model.other_user_id
-            newId = oldAndNewIDDic.get(oldId)
-            #找到了
-            if newId is not None and len(newId) > 0:
-                model.other_user_id = newId
-                #更新ID
-                #from
-                ws.cell(index + 1, 7).value = newId
-                #to
-                ws.cell(index + 1, 9).value = robot_user_id
-                #other
-                ws.cell(index + 1, 11).value = newId
-                #替换原始信息中的ID
-                #旧的机器人ID
-                old_robot_userId = model.toUser_id
-                #原始消息体
-                originStr = model.originMsg
-                #替换旧的目标ID
-                newString = originStr.replace(oldId, newId)
-                #替换机器人ID
-                newString = newString.replace(old_robot_userId, robot_user_id)
-                ws.cell(index + 1, 13).value = newString
-                #等待写入
-                time.sleep(0.05)
-                      
-        #保存            
-        wb.save(workbook_file_path)
-        
-            
-            
-    #获取新的用户ID  
+    #获取新的用户ID（按昵称在联系人目录中查找重新登录后的ID）
     def getNewId(self, idsDic, groupIdsDic):
         oldAndNewIDDic = {}
-        #好友  
-        friends = []
-        #群聊
-        chatrooms = []
-        
-        #好友处理
-        if len(idsDic) > 0:   
-            #好友处理
-            try:
-                #获取好友列表
-                friends = itchat.get_friends(update=True)[0:]
-            except ZeroDivisionError:
-                # 捕获并处理 ZeroDivisionError 异常
-                print("好友列表, 错误发生")
-            
-            #获取好友 -（id组装 旧 ： 新）
-            for friend in friends:
-                #id
-                userName = friend["UserName"]
-                NickName = friend["NickName"]
-                modelArray = idsDic.get(NickName)
-                #找到了好友
-                if modelArray is not None and len(modelArray) > 0:
-                    model : TimeTaskModel = modelArray[0]
-                    oldId = model.other_user_id
-                    if oldId != userName:
-                        oldAndNewIDDic[oldId] = userName    
-         
-        #群聊处理  
-        if len(groupIdsDic) > 0:          
-            #群聊处理       
-            try:
-                #群聊 （id组装 旧 ：新）   
-                chatrooms = itchat.get_chatrooms()
-            except ZeroDivisionError:
-                # 捕获并处理 ZeroDivisionError 异常
-                print("群聊列表, 错误发生")
-            
-            #获取群聊 - 旧 ： 新
-            for chatroom in chatrooms:
-                #id
-                userName = chatroom["UserName"]
-                NickName = chatroom["NickName"]
-                modelArray = groupIdsDic.get(NickName)
-                #找到了群聊
-                if modelArray is not None and len(modelArray) > 0:
-                    model : TimeTaskModel = modelArray[0]
-                    oldId = model.other_user_id
-                    if oldId != userName:
-                        oldAndNewIDDic[oldId] = userName
-                       
+        directory = ContactDirectory()
+        #重新登录后ID已变化，清空旧的缓存
+        directory.invalidate("wx")
+        for kind, targetDic in ((KIND_FRIEND, idsDic), (KIND_GROUP, groupIdsDic)):
+            for NickName, modelArray in targetDic.items():
+                #找到了好友/群聊
+                userName = directory.get_id("wx", kind, NickName)
+                if userName is None or modelArray is None or len(modelArray) <= 0:
+                    continue
+                model : TimeTaskModel = modelArray[0]
+                oldId = model.other_user_id
+                if oldId != userName:
+                    oldAndNewIDDic[oldId] = userName
+
         return oldAndNewIDDic         
         
 
@@ -626,48 +301,30 @@ class TimeTaskModel:
         if self.isCron_time():
             return True 
         
-        #当前时间
-        current_time = arrow.now()
+        return self.is_circleDay(arrow.now())
+
+    #指定日期是否满足轮询信息
+    def is_circleDay(self, day):
         #轮询信息
         item_circle = self.circleTimeStr
         if self.is_valid_date(item_circle):
             #日期相等
-            if item_circle == current_time.format('YYYY-MM-DD'):
-                #今天要出发的任务
-                #print(f"[定时任务]类型: 录入日期, 日期信息：{item_circle}")
-                return True
-            else:
-                #其他时间待出发
-                #print(f"[定时任务]类型: 录入日期, 非今天任务, 日期信息：{item_circle}")
-                return False
+            return item_circle == day.format('YYYY-MM-DD')
             
         elif "每天" in item_circle:
-            #今天要出发的任务
-            #print(f"[定时任务]类型：每天")
             return True
         
         elif "每周" in item_circle or "每星期" in item_circle:
-            if self.is_today_weekday(item_circle):
-                #print(f"[定时任务]类型: 每周, 日期信息：{item_circle}")
-                return True
-            else:
-                #print(f"[定时任务]类型: 每周, 非今天任务, 日期信息为：{item_circle}")
-                return False    
+            return self.is_today_weekday(item_circle, day)
             
         elif "工作日" in item_circle:
-                # 判断星期几
-                weekday = arrow.now().weekday()
-                # 判断是否是工作日
-                is_weekday = weekday < 5
-                if is_weekday:
-                    #print(f"[定时任务]类型: 工作日")
-                    return True
-                else:
-                    #print(f"[定时任务]类型: 工作日, 非今天任务，日期信息为：{item_circle}")
-                    return False    
+            # 判断是否是工作日
+            return day.weekday() < 5
+
+        return False
                     
-    #是否今天的星期数       
-    def is_today_weekday(self, weekday_str):
+    #是否今天(或指定日期)的星期数
+    def is_today_weekday(self, weekday_str, day=None):
         # 将中文数字转换为阿拉伯数字
         weekday_dict = {'一': 1, '二': 2, '三': 3, '四': 4, '五': 5, '六': 6, '日': 7}
         weekday_num = weekday_dict.get(weekday_str[-1])
@@ -675,9 +332,44 @@ class TimeTaskModel:
             return False
         
         # 判断今天是否是指定的星期几
-        today = arrow.now()
+        today = day or arrow.now()
         tempValue = today.weekday() == weekday_num - 1   
         return tempValue   
+
+    #下次触发的时间戳(精确到分钟)，已停用或不会再触发时返回None
+    def get_next_fireTime(self, now=None):
+        if not self.enable:
+            return None
+        current_time = (now or arrow.now()).replace(second=0, microsecond=0)
+
+        #cron
+        if self.isCron_time():
+            if not self.isValid_Cron_time():
+                return None
+            cron = croniter(self.cron_expression, current_time.shift(minutes=-1).datetime)
+            return int(cron.get_next(float))
+
+        tempTimeStr = self.timeStr
+        #如果分钟，补充00秒钟格式
+        if tempTimeStr.count(":") == 1:
+            tempTimeStr = tempTimeStr + ":00"
+        try:
+            task_time = arrow.get(tempTimeStr, "HH:mm:ss")
+        except Exception:
+            return None
+
+        #轮询周期最长为一周，向后查找8天即可
+        for dayOffset in range(8):
+            day = current_time.shift(days=dayOffset)
+            if not self.is_circleDay(day):
+                continue
+            if dayOffset == 0 and self.is_today_consumed:
+                continue
+            fire_time = day.replace(hour=task_time.hour, minute=task_time.minute, second=task_time.second)
+            if fire_time.replace(second=0) < current_time:
+                continue
+            return int(fire_time.timestamp())
+        return None
         
     #日期是否格式正确
     def is_valid_date(self, date_string):
@@ -856,74 +548,20 @@ class TimeTaskModel:
         substring_groupTitle = substring_groupTitle.replace("]", "").strip()
         return substring_event, substring_groupTitle
     
-    #通过 群Title 获取群ID
+    #通过 群Title 获取群ID（查询共享的联系人目录，不再每次遍历群列表）
     def get_gropID_withGroupTitle(self, groupTitle, channel_name):
         if len(groupTitle) <= 0:
               return ""
-        #itchat
-        if channel_name == "wx":
-            tempRoomId = ""
-            #群聊处理       
-            try:
-                #群聊  
-                chatrooms = itchat.get_chatrooms()
-                #获取群聊
-                for chatroom in chatrooms:
-                    #id
-                    userName = chatroom["UserName"]
-                    NickName = chatroom["NickName"]
-                    if NickName == groupTitle:
-                        tempRoomId = userName
-                        break
-                    
-                return tempRoomId
-            except Exception as e:
-                print(f"[{channel_name}通道] 通过 群Title 获取群ID发生错误，错误信息为：{e}")
-                return tempRoomId
-            
-            
-        elif channel_name == "ntchat":
-            tempRoomId = ""
-            try:
-                #数据结构为字典数组
-                rooms = wechatnt.get_rooms()
-                if len(rooms) > 0:
-                    #遍历
-                    for item in rooms:
-                        roomId = item.get("wxid")
-                        nickname = item.get("nickname")
-                        if nickname == groupTitle:
-                            tempRoomId = roomId
-                            break
-                        
-                return tempRoomId
-                        
-            except Exception as e:
-                print(f"[{channel_name}通道] 通过 群Title 获取群ID发生错误，错误信息为：{e}")
-                return tempRoomId
-
-        elif channel_name == "wework":
-            tempRoomId = ""
-            try:
-                # 数据结构为字典数组
-                rooms = wework.get_rooms().get("room_list")
-                if len(rooms) > 0:
-                    # 遍历
-                    for item in rooms:
-                        roomId = item.get("conversation_id")
-                        nickname = item.get("nickname")
-                        if nickname == groupTitle:
-                            tempRoomId = roomId
-                            break
-
-                return tempRoomId
-
-            except Exception as e:
-                print(f"[{channel_name}通道] 通过 群Title 获取群ID发生错误，错误信息为：{e}")
-                return tempRoomId
-        else:
-            print(f"[{channel_name}通道] 通过 群Title 获取群ID 不支持的channel，channel为：{channel_name}")
+        directory = ContactDirectory()
+        try:
+            groupId = directory.get_id(channel_name, KIND_GROUP, groupTitle)
+        except Exception as e:
+            print(f"[{channel_name}通道] 通过 群Title 获取群ID发生错误，错误信息为：{e}")
             return ""
+        #没有群列表的通道，只能找到收到过消息的群
+        if groupId is None and not directory.has_loader(channel_name, KIND_GROUP):
+            print(f"[{channel_name}通道] 通过 群Title 获取群ID 不支持的channel，channel为：{channel_name}")
+        return groupId or ""
                     
                 
             
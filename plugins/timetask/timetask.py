@@ -12,7 +12,7 @@ from lib import itchat
 from lib.itchat.content import *
 import re
 import arrow
-from plugins.timetask.Tool import ExcelTool
+from plugins.timetask.TaskDB import TaskDB
 from bridge.bridge import Bridge
 import config as RobotConfig
 import requests
@@ -134,7 +134,7 @@ class timetask(Plugin):
         wordsArray = content.split(" ")
         #任务编号
         taskId = wordsArray[1]
-        isExist, taskModel = ExcelTool().write_columnValue_withTaskId_toExcel(taskId, 2, "0")
+        isExist, taskModel = TaskDB().write_columnValue_withTaskId(taskId, 2, "0")
         taskContent = "未知"
         if taskModel:
             taskContent = f"{taskModel.circleTimeStr} {taskModel.timeStr} {taskModel.eventStr}"
@@ -164,7 +164,7 @@ class timetask(Plugin):
     def get_timeTaskList(self, content, e_context: EventContext):
         
         #任务列表
-        taskArray = ExcelTool().readExcel()
+        taskArray = TaskDB().readTasks()
         tempArray = []
         for item in taskArray:
             model = TimeTaskModel(item, None, False)
@@ -338,6 +338,8 @@ class timetask(Plugin):
             reply.content = reply_text
             channel_name = RobotConfig.conf().get("channel_type", "wx")
             channel = channel_factory.create_channel(channel_name)
+            #按通道限速，避免同一时刻大量任务集中发送
+            self.taskManager.runner.acquire_send(channel_name)
             channel.send(reply, context)
             
             #释放
@@ -17,6 +17,7 @@ from plugins import *
     version="0.5",
     author="goldfishh",
     desire_priority=0,
+    triggers={"prefix": ["{trigger_prefix}tool"]},
 )
 class Tool(Plugin):
     def __init__(self):
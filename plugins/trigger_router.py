@@ -0,0 +1,79 @@
+# encoding:utf-8
+
+import re
+
+from common.log import logger
+
+TRIGGER_PREFIX_PLACEHOLDER = "{trigger_prefix}"
+
+
+class TriggerRouter:
+    """
+    把各插件注册时声明的触发条件编译成一个组合匹配器，一次匹配得到消息会触发哪些插件
+
+    触发条件格式: {"exact": [完整匹配的关键词], "prefix": [前缀], "contains": [包含的关键词], "regex": [正则表达式]}
+    其中的{trigger_prefix}会替换为配置的插件指令前缀，替换后为空的前缀匹配所有消息
+    - exact: 字典查找
+    - prefix: 前缀树，沿消息开头走一遍
+    - contains/regex: 所有插件的正则合并成一个总的正则，大部分消息不会命中总的正则，直接跳过；命中时再逐个检查各插件的正则
+    """
+
+    def __init__(self, triggers: dict, trigger_prefix="$"):
+        """
+        :param triggers: 插件名 -> 触发条件
+        """
+        self.trigger_prefix = trigger_prefix
+        self.exact = {}  # 关键词 -> 插件名集合
+        self.prefix_trie = {}  # 字符 -> 子节点，子节点中None键保存以此结尾的前缀所属的插件名集合
+        self.patterns = {}  # 插件名 -> 编译后的正则列表
+        self.combined = None
+        for name, trigger in triggers.items():
+            self._add(name, trigger, trigger_prefix)
+        if self.patterns:
+            try:
+                self.combined = re.compile("|".join("(?:{})".format(p.pattern) for patterns in self.patterns.values() for p in patterns))
+            except re.error as e:
+                # 各插件的正则单独可用但合并后不合法(如重复的命名分组、全局标记不在开头)，退化为逐个匹配
+                logger.warning("[TriggerRouter] combine trigger patterns failed, match one by one: {}".format(e))
+
+    def _add(self, name, trigger, trigger_prefix):
+        def expand(items):
+            return [item.replace(TRIGGER_PREFIX_PLACEHOLDER, trigger_prefix) for item in items or []]
+
+        for keyword in expand(trigger.get("exact")):
+            self.exact.setdefault(keyword, set()).add(name)
+        for prefix in expand(trigger.get("prefix")):
+            node = self.prefix_trie
+            for ch in prefix:
+                node = node.setdefault(ch, {})
+            node.setdefault(None, set()).add(name)
+        patterns = []
+        keywords = expand(trigger.get("contains"))
+        if keywords:
+            patterns.append(re.compile("|".join(re.escape(keyword) for keyword in keywords)))
+        for pattern in expand(trigger.get("regex")):
+            try:
+                patterns.append(re.compile(pattern))
+            except re.error as e:
+                logger.error("[TriggerRouter] invalid trigger regex of plugin {}: {}, {}".format(name, pattern, e))
+        if patterns:
+            self.patterns[name] = patterns
+
+    def match(self, content: str) -> set:
+        """返回被消息触发的插件名集合"""
+        matched = set(self.exact.get(content.strip(), ()))
+        node = self.prefix_trie
+        if None in node:
+            # 空前缀(如插件指令前缀配置为空时的"{trigger_prefix}")匹配所有消息，与startswith("")一致
+            matched |= node[None]
+        for ch in content:
+            node = node.get(ch)
+            if node is None:
+                break
+            if None in node:
+                matched |= node[None]
+        if self.patterns and (self.combined is None or self.combined.search(content)):
+            for name, patterns in self.patterns.items():
+                if name not in matched and any(pattern.search(content) for pattern in patterns):
+                    matched.add(name)
+        return matched
@@ -0,0 +1,144 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from plugins.plugin_manager import PluginManager
+
+PluginManager().current_plugin_path = "plugins/banwords"
+
+import plugins.banwords  # noqa: E402,F401
+from plugins.banwords.lib.CompiledWordsSearch import CompiledWordsSearch  # noqa: E402
+
+
+class RemoteWords:
+    """本地HTTP服务，模拟支持ETag的远程词表"""
+
+    def __init__(self):
+        self.body = ""
+        self.etag = None
+        self.requests = []  # 每次请求的(If-None-Match, 返回状态码)
+        remote = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if_none_match = self.headers.get("If-None-Match")
+                status = 304 if if_none_match and if_none_match == remote.etag else 200
+                remote.requests.append((if_none_match, status))
+                self.send_response(status)
+                if status == 200:
+                    data = remote.body.encode("utf-8")
+                    self.send_header("ETag", remote.etag)
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                else:
+                    self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:{}/banwords.txt".format(self.server.server_address[1])
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def publish(self, body, etag):
+        self.body = body
+        self.etag = etag
+
+
+@pytest.fixture
+def remote(monkeypatch):
+    monkeypatch.setenv("NO_PROXY", "127.0.0.1")
+    remote = RemoteWords()
+    yield remote
+    remote.server.shutdown()
+    remote.server.server_close()
+
+
+def make_plugin(tmp_path, remote_url=None):
+    """不执行__init__(会读取插件目录下的配置和词表)，把词表、缓存都指向临时目录"""
+    plugin = PluginManager().plugins["BANWORDS"].__new__(PluginManager().plugins["BANWORDS"])
+    plugin.banwords_path = str(tmp_path / "banwords.txt")
+    plugin.cache_path = str(tmp_path / "banwords.cache")
+    plugin.group_banwords = {}
+    plugin.remote_url = remote_url
+    plugin.remote_interval = 600
+    plugin.remote_path = str(tmp_path / "banwords_remote.txt")
+    plugin.remote_etag = None
+    plugin.next_remote_fetch = 0
+    write_words(plugin.banwords_path, "local")
+    plugin.file_stamps = plugin._file_stamps()
+    plugin.reload_pending = False
+    plugin.searchr = plugin._build_searcher()
+    return plugin
+
+
+def write_words(path, *words):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(words))
+    # 保证修改时间变化
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def test_local_file_hot_reload(tmp_path):
+    plugin = make_plugin(tmp_path)
+    assert plugin.searchr.ContainsAny("local word")
+    assert not plugin.check_update()
+
+    write_words(plugin.banwords_path, "changed")
+    assert plugin.check_update()
+    assert plugin.searchr.ContainsAny("changed word")
+    assert not plugin.searchr.ContainsAny("local word")
+
+
+def test_failed_build_is_retried(tmp_path, monkeypatch):
+    plugin = make_plugin(tmp_path)
+    write_words(plugin.banwords_path, "changed")
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("build failed")
+
+    monkeypatch.setattr(CompiledWordsSearch, "SetKeywords", broken)
+    with pytest.raises(RuntimeError):
+        plugin.check_update()
+    assert not plugin.searchr.ContainsAny("changed")
+
+    monkeypatch.undo()
+    assert plugin.check_update()
+    assert plugin.searchr.ContainsAny("changed")
+
+
+def test_remote_etag(tmp_path, remote):
+    remote.publish("remote1", '"v1"')
+    plugin = make_plugin(tmp_path, remote.url)
+
+    # 200: 保存远程词表，与本地词表合并
+    assert plugin.check_update(watch_files=False)
+    assert plugin.remote_etag == '"v1"'
+    assert plugin.searchr.ContainsAny("remote1") and plugin.searchr.ContainsAny("local")
+
+    # 304: 没有变化，不重新构建
+    plugin.next_remote_fetch = 0
+    assert not plugin.check_update(watch_files=False)
+
+    # 远程词表更新，ETag变化
+    remote.publish("remote2", '"v2"')
+    plugin.next_remote_fetch = 0
+    assert plugin.check_update(watch_files=False)
+    assert plugin.remote_etag == '"v2"'
+    assert plugin.searchr.ContainsAny("remote2")
+    assert not plugin.searchr.ContainsAny("remote1")
+
+    assert remote.requests == [(None, 200), ('"v1"', 304), ('"v1"', 200)]
+
+
+def test_remote_interval(tmp_path, remote):
+    remote.publish("remote1", '"v1"')
+    plugin = make_plugin(tmp_path, remote.url)
+    assert plugin.check_update(watch_files=False)
+    # 拉取间隔内不再请求
+    assert not plugin.check_update(watch_files=False)
+    assert len(remote.requests) == 1
@@ -0,0 +1,95 @@
+import random
+
+import pytest
+
+from plugins.plugin_manager import PluginManager
+
+PluginManager().current_plugin_path = "plugins/banwords"
+
+from plugins.banwords.lib.CompiledWordsSearch import CompiledWordsSearch, keywords_digest  # noqa: E402
+from plugins.banwords.lib.WordsSearch import WordsSearch  # noqa: E402
+
+# 互相重叠、互为前后缀的关键词
+OVERLAPPING_WORDS = ["he", "she", "his", "hers", "abc", "bc", "c", "abcd", "bcd", "敏感", "敏感词", "感词", "词"]
+OVERLAPPING_TEXTS = ["", "ushers", "hishershe", "abcdabc", "xbcdx", "这是敏感词吗", "敏感敏感词词", "abcabcbc", "no match here"]
+
+
+def build(words, tags=None):
+    old = WordsSearch()
+    old.SetKeywords(words)
+    new = CompiledWordsSearch()
+    new.SetKeywords(words, tags)
+    return old, new
+
+
+def assert_same(old, new, text, tags=None, indexs=None):
+    expected = old.FindAll(text)
+    if indexs is not None:
+        # 按标签过滤后的旧词表，Index换算回完整词表的下标
+        for item in expected:
+            item["Index"] = indexs[item["Index"]]
+    assert new.FindAll(text, tags) == expected
+    assert new.FindFirst(text, tags) == (expected[0] if expected else None)
+    assert new.ContainsAny(text, tags) == old.ContainsAny(text)
+    assert new.Replace(text, tags=tags) == old.Replace(text)
+    assert new.Replace(text, "#", tags=tags) == old.Replace(text, "#")
+
+
+@pytest.mark.parametrize("text", OVERLAPPING_TEXTS)
+def test_overlapping_words(text):
+    old, new = build(OVERLAPPING_WORDS)
+    assert_same(old, new, text)
+
+
+def test_random_words():
+    rnd = random.Random(0)
+    alphabet = "abcde敏感词"
+    words = list(dict.fromkeys("".join(rnd.choice(alphabet) for _ in range(rnd.randint(1, 5))) for _ in range(300)))
+    old, new = build(words)
+    for _ in range(200):
+        assert_same(old, new, "".join(rnd.choice(alphabet + "xyz") for _ in range(rnd.randint(0, 40))))
+
+
+@pytest.mark.parametrize("query_tags", [{"g1"}, {"g2"}, {"g1", "g2"}, {"other"}, set()])
+def test_tags(query_tags):
+    rnd = random.Random(1)
+    tag_choices = [{"g1"}, {"g2"}, {"g1", "g2"}]
+    words = OVERLAPPING_WORDS
+    tags = [rnd.choice(tag_choices) for _ in words]
+    _, new = build(words, tags)
+    # 旧实现不支持标签，用只含匹配标签关键词的词表作为对照
+    indexs = [i for i, t in enumerate(tags) if t & query_tags]
+    old = WordsSearch()
+    old.SetKeywords([words[i] for i in indexs])
+    for text in OVERLAPPING_TEXTS:
+        assert_same(old, new, text, query_tags, indexs)
+
+
+def test_tags_none_matches_all_words():
+    old, new = build(OVERLAPPING_WORDS, [{"g1"} for _ in OVERLAPPING_WORDS])
+    for text in OVERLAPPING_TEXTS:
+        assert_same(old, new, text)
+
+
+def test_cache(tmp_path):
+    cache_path = str(tmp_path / "banwords.cache")
+    tags = [{"g1"} if i % 2 else {"g2"} for i in range(len(OVERLAPPING_WORDS))]
+    old, new = build(OVERLAPPING_WORDS)
+    built = CompiledWordsSearch()
+    built.SetKeywords(OVERLAPPING_WORDS, tags)
+    built.save(cache_path)
+
+    loaded = CompiledWordsSearch()
+    assert loaded.load(cache_path, keywords_digest(OVERLAPPING_WORDS, tags))
+    for text in OVERLAPPING_TEXTS:
+        assert_same(old, loaded, text)
+        for query_tags in ({"g1"}, {"g2"}):
+            assert loaded.FindAll(text, query_tags) == built.FindAll(text, query_tags)
+
+    # 词库或标签变化后缓存失效
+    assert not CompiledWordsSearch().load(cache_path, keywords_digest(OVERLAPPING_WORDS + ["new"], tags + [{"g1"}]))
+    assert not CompiledWordsSearch().load(cache_path, keywords_digest(OVERLAPPING_WORDS))
+    # 缓存文件不存在或已损坏
+    assert not CompiledWordsSearch().load(str(tmp_path / "missing.cache"))
+    (tmp_path / "broken.cache").write_bytes(b"not a pickle")
+    assert not CompiledWordsSearch().load(str(tmp_path / "broken.cache"))
@@ -0,0 +1,45 @@
+import pickle
+
+from bot.chatgpt.chat_gpt_session import ChatGPTSession
+
+# 按字符数计算token，不依赖tiktoken
+MODEL = "wenxin"
+
+
+def make_session():
+    session = ChatGPTSession("user", system_prompt="sys", model=MODEL)
+    session.add_query("hello")
+    session.add_reply("world!")
+    return session
+
+
+def test_calc_tokens():
+    assert make_session().calc_tokens() == len("sys") + len("hello") + len("world!")
+
+
+def test_outside_changes_are_detected():
+    session = make_session()
+    session.calc_tokens()
+
+    # 替换消息，数量不变
+    session.messages[1] = {"role": "user", "content": "a much longer question"}
+    assert session.calc_tokens() == len("sys") + len("a much longer question") + len("world!")
+
+    # 原地改写内容
+    session.messages[2]["content"] = "ok"
+    assert session.calc_tokens() == len("sys") + len("a much longer question") + len("ok")
+
+    del session.messages[1]
+    assert session.calc_tokens() == len("sys") + len("ok")
+
+
+def test_discard_exceeding():
+    session = make_session()
+    session.add_query("again")
+    assert session.discard_exceeding(len("sys") + len("world!") + len("again")) == len("sys") + len("world!") + len("again")
+    assert [m["content"] for m in session.messages] == ["sys", "world!", "again"]
+
+
+def test_pickled_session():
+    session = pickle.loads(pickle.dumps(make_session()))
+    assert session.calc_tokens() == len("sys") + len("hello") + len("world!")
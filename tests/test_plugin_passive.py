@@ -0,0 +1,102 @@
+import threading
+
+import pytest
+
+from bridge.context import Context, ContextType
+from bridge.reply import Reply, ReplyType
+from common.sorted_dict import SortedDict
+from plugins import Event, EventAction, EventContext, Plugin, PluginManager
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    pm = PluginManager()
+    monkeypatch.setattr(pm, "plugins", SortedDict(lambda k, v: v.priority, reverse=True))
+    monkeypatch.setattr(pm, "listening_plugins", {})
+    monkeypatch.setattr(pm, "instances", {})
+    monkeypatch.setattr(pm, "current_plugin_path", "tests")
+    monkeypatch.setattr(pm, "trigger_router", None)
+    return pm
+
+
+def add_plugin(pm, name, priority, handler, **kwargs):
+    @pm.register(name=name, desire_priority=priority, **kwargs)
+    class TestPlugin(Plugin):
+        def __init__(self):
+            super().__init__()
+            self.handlers[Event.ON_RECEIVE_MESSAGE] = handler
+
+    # register不返回插件类，和activate_plugins一样从plugins中取出
+    pm.instances[name.upper()] = pm.plugins[name.upper()]()
+    names = pm.listening_plugins.setdefault(Event.ON_RECEIVE_MESSAGE, [])
+    names.append(name.upper())
+    names.sort(key=lambda n: pm.plugins[n].priority, reverse=True)
+
+
+def test_passive_handler_runs_off_thread_on_snapshot(manager):
+    release = threading.Event()
+    done = threading.Event()
+    seen = {}
+
+    def passive_handler(e_context):
+        release.wait(5)
+        seen["thread"] = threading.current_thread()
+        seen["content"] = e_context["context"].content
+        seen["kwargs"] = dict(e_context["context"].kwargs)
+        # 只读处理函数的修改和中断都不应影响主流程
+        e_context["context"].content = "changed by passive"
+        e_context["context"]["isgroup"] = True
+        e_context["reply"] = Reply(ReplyType.TEXT, "passive reply")
+        e_context.action = EventAction.BREAK_PASS
+        done.set()
+
+    def active_handler(e_context):
+        seen["active_content"] = e_context["context"].content
+
+    add_plugin(manager, "passive_recorder", 100, passive_handler, passive=[Event.ON_RECEIVE_MESSAGE])
+    add_plugin(manager, "active_plugin", 10, active_handler)
+
+    context = Context(ContextType.TEXT, "hello", kwargs={"isgroup": False})
+    e_context = manager.emit_event(EventContext(Event.ON_RECEIVE_MESSAGE, {"context": context}))
+
+    # 处理函数还在等待，emit_event已经返回，后面的插件照常执行
+    assert not done.is_set()
+    assert seen["active_content"] == "hello"
+    assert e_context.action == EventAction.CONTINUE
+
+    # 提交之后主流程对Context的修改不影响后台线程读到的内容
+    context.content = "rewritten later"
+    context["isgroup"] = None
+    release.set()
+    assert done.wait(5)
+
+    assert seen["thread"] is not threading.current_thread()
+    assert seen["content"] == "hello"
+    assert seen["kwargs"] == {"isgroup": False}
+    assert context.content == "rewritten later"
+    assert context["isgroup"] is None
+    assert "reply" not in e_context.econtext
+    assert e_context.action == EventAction.CONTINUE
+
+
+def test_active_handler_can_break_chain(manager):
+    calls = []
+
+    def breaker(e_context):
+        calls.append("breaker")
+        e_context.action = EventAction.BREAK_PASS
+
+    add_plugin(manager, "breaker", 100, breaker)
+    add_plugin(manager, "after", 10, lambda e_context: calls.append("after"))
+
+    e_context = manager.emit_event(EventContext(Event.ON_RECEIVE_MESSAGE, {"context": Context(ContextType.TEXT, "hi")}))
+    assert calls == ["breaker"]
+    assert e_context["breaked_by"] == "BREAKER"
+
+
+def test_summary_recorder_is_passive(monkeypatch):
+    pytest.importorskip("openai")
+    monkeypatch.setattr(PluginManager(), "current_plugin_path", "plugins/summary")
+    from plugins.summary.chat_cal import ChatStatistics
+
+    assert ChatStatistics.passive == [Event.ON_RECEIVE_MESSAGE]
@@ -0,0 +1,66 @@
+import pytest
+
+from bot import session_store
+from bot.session_manager import Session, SessionManager
+from config import conf
+
+
+class ModelSession(Session):
+    def __init__(self, session_id, system_prompt=None, model="gpt-3.5-turbo"):
+        super().__init__(session_id, system_prompt)
+        self.model = model
+
+
+@pytest.fixture
+def sqlite_store(monkeypatch, tmp_path):
+    monkeypatch.setitem(conf(), "session_store", "sqlite")
+    monkeypatch.setitem(conf(), "appdata_dir", str(tmp_path))
+    # 不让后台线程在测试期间写回
+    monkeypatch.setitem(conf(), "session_store_flush_interval", 3600)
+    monkeypatch.setattr(session_store, "_sqlite_stores", {})
+
+
+def test_managers_with_different_models_are_isolated(sqlite_store):
+    gpt = SessionManager(ModelSession, model="gpt-4")
+    claude = SessionManager(ModelSession, model="claude-3")
+    assert gpt.sessions is not claude.sessions
+
+    gpt.build_session("user", system_prompt="gpt prompt")
+    claude_session = claude.build_session("user")
+    assert claude_session.model == "claude-3"
+    assert claude_session.system_prompt != "gpt prompt"
+    assert gpt.build_session("user").model == "gpt-4"
+
+
+def test_rebuilt_manager_reuses_store(sqlite_store):
+    first = SessionManager(ModelSession, model="gpt-4")
+    first.build_session("user", system_prompt="prompt")
+    second = SessionManager(ModelSession, model="gpt-4")
+    assert second.sessions is first.sessions
+    assert second.build_session("user").system_prompt == "prompt"
+
+
+def test_flush_keeps_unpicklable_session_dirty(sqlite_store):
+    store = session_store.create_session_store("flush-test")
+    session = ModelSession("user")
+    session.callback = lambda: None  # 无法pickle
+    store["user"] = session
+    store.flush()
+    assert "user" in store.dirty
+
+    del session.callback
+    store.flush()
+    assert not store.dirty
+    store.hot.clear()
+    assert store["user"].model == "gpt-3.5-turbo"
+
+
+def test_clear_drops_in_flight_sessions(sqlite_store):
+    store = session_store.create_session_store("clear-test")
+    store["user"] = ModelSession("user")
+    # 模拟写回进行中
+    store.flushing = {"other": (b"data", 0)}
+    store.clear()
+    assert not store.flushing
+    assert "user" not in store
+    assert "other" not in store
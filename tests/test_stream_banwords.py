@@ -0,0 +1,64 @@
+import pytest
+
+from bridge.context import Context, ContextType
+from bridge.reply import Reply, ReplyStream, ReplyType
+from channel.chat_channel import ChatChannel
+from config import conf
+from plugins import Event, EventContext, PluginManager
+
+PluginManager().current_plugin_path = "plugins/banwords"
+
+import plugins.banwords  # noqa: E402,F401
+from plugins.banwords.lib.CompiledWordsSearch import CompiledWordsSearch  # noqa: E402
+
+REPLACED_PREFIX = "已替换回复中的敏感词: \n"
+
+
+@pytest.fixture
+def channel(monkeypatch):
+    pm = PluginManager()
+    plugin = pm.plugins["BANWORDS"].__new__(pm.plugins["BANWORDS"])
+    plugin.group_banwords = {}
+    plugin.reply_action = "replace"
+    plugin.handlers = {Event.ON_DECORATE_REPLY: plugin.on_decorate_reply}
+    searcher = CompiledWordsSearch()
+    searcher.SetKeywords(["敏感词"])
+    plugin._set_searcher(searcher)
+    monkeypatch.setattr(pm, "instances", {"BANWORDS": plugin})
+    monkeypatch.setattr(pm, "listening_plugins", {Event.ON_DECORATE_REPLY: ["BANWORDS"]})
+    # 没有句子结尾时每20个字符强制切分一次
+    monkeypatch.setitem(conf(), "stream_reply_min_chars", 2)
+
+    channel = ChatChannel.__new__(ChatChannel)
+    channel.sent = []
+
+    def decorate(context, reply):
+        e_context = pm.emit_event(EventContext(Event.ON_DECORATE_REPLY, {"channel": channel, "context": context, "reply": reply}))
+        return e_context["reply"]
+
+    channel._decorate_reply = decorate
+    channel._send_reply = lambda context, reply: channel.sent.append(reply)
+    return channel
+
+
+def send_stream(channel, text):
+    context = Context(ContextType.TEXT, "question", kwargs={"isgroup": False})
+    channel._send_stream_reply(context, Reply(ReplyType.STREAM, ReplyStream(iter(text))))
+    assert "stream_lookbehind" not in context.kwargs
+    return "".join(reply.content[len(REPLACED_PREFIX) :] if reply.type == ReplyType.INFO else reply.content for reply in channel.sent)
+
+
+def test_holdback_is_longest_keyword():
+    assert PluginManager().get_stream_holdback() == 0
+
+
+def test_keyword_split_across_segments_is_masked(channel):
+    assert PluginManager().get_stream_holdback() == 2
+    # 第20个字符处强制切分，敏感词跨越切分点
+    text = "a" * 19 + "敏感词" + "b" * 30 + "敏感词。"
+    assert send_stream(channel, text) == "a" * 19 + "***" + "b" * 30 + "***。"
+    assert len(channel.sent) > 1
+
+
+def test_keyword_inside_segment_is_masked(channel):
+    assert send_stream(channel, "这里有敏感词。没有问题。") == "这里有***。没有问题。"
@@ -0,0 +1,141 @@
+import math
+import threading
+import types
+from datetime import datetime
+
+import arrow
+import pytest
+
+from plugins.plugin_manager import PluginManager
+
+PluginManager().current_plugin_path = "plugins/timetask"
+
+import plugins.timetask.TimeTaskTool as TimeTaskTool  # noqa: E402
+from plugins.timetask.Tool import TimeTaskModel  # noqa: E402
+
+# 2024-01-01 是星期一
+MONDAY = datetime(2024, 1, 1)
+
+
+def at(day_offset, hour, minute, second=0):
+    return arrow.get(MONDAY, tzinfo="local").shift(days=day_offset).replace(hour=hour, minute=minute, second=second)
+
+
+def make_model(timeStr, circle, enable="1", consumed="0"):
+    item = ["task1", enable, timeStr, circle, "提醒", "u", "uid", "bot", "bid", "nick", "oid", "0", "{}", consumed]
+    return TimeTaskModel(item, None, False)
+
+
+def next_fire(model, now):
+    fireTime = model.get_next_fireTime(now)
+    return None if fireTime is None else arrow.get(fireTime).to("local")
+
+
+@pytest.mark.parametrize(
+    "now, expected",
+    [
+        (at(0, 9, 59, 30), at(0, 10, 0)),
+        # 触发时刻所在的这一分钟内仍返回本次触发时间
+        (at(0, 10, 0, 40), at(0, 10, 0)),
+        (at(0, 10, 1), at(1, 10, 0)),
+    ],
+)
+def test_cron(now, expected):
+    assert next_fire(make_model("cron[0 10 * * *]", "cron[0 10 * * *]"), now) == expected
+
+
+def test_cron_crosses_midnight():
+    model = make_model("cron[0 0 * * *]", "cron[0 0 * * *]")
+    assert next_fire(model, at(0, 23, 59, 59)) == at(1, 0, 0)
+    assert next_fire(model, at(1, 0, 0, 30)) == at(1, 0, 0)
+
+
+def test_invalid_cron():
+    assert next_fire(make_model("cron[61 * * *]", "cron[61 * * *]"), at(0, 9, 0)) is None
+
+
+def test_every_day_crosses_midnight():
+    model = make_model("23:59:00", "每天")
+    assert next_fire(model, at(0, 23, 59, 30)) == at(0, 23, 59)
+    assert next_fire(model, at(1, 0, 0)) == at(1, 23, 59)
+    assert next_fire(make_model("00:00:00", "每天"), at(0, 23, 59, 59)) == at(1, 0, 0)
+
+
+def test_seconds_fire_within_their_minute():
+    model = make_model("10:00:30", "每天")
+    assert next_fire(model, at(0, 10, 0, 45)) == at(0, 10, 0, 30)
+    assert next_fire(model, at(0, 10, 1)) == at(1, 10, 0, 30)
+
+
+@pytest.mark.parametrize(
+    "circle, now, expected",
+    [
+        ("每周三", at(0, 9, 0), at(2, 10, 0)),
+        ("每星期日", at(0, 9, 0), at(6, 10, 0)),
+        # 本周一已过，顺延到下周一
+        ("每周一", at(0, 10, 1), at(7, 10, 0)),
+    ],
+)
+def test_weekday(circle, now, expected):
+    assert next_fire(make_model("10:00:00", circle), now) == expected
+
+
+def test_workday_skips_weekend():
+    model = make_model("10:00:00", "工作日")
+    # 星期五10点之后，下次是下星期一
+    assert next_fire(model, at(4, 10, 1)) == at(7, 10, 0)
+    assert next_fire(model, at(5, 9, 0)) == at(7, 10, 0)
+    assert next_fire(model, at(1, 9, 0)) == at(1, 10, 0)
+
+
+def test_one_off_date():
+    model = make_model("10:00:00", "2024-01-02")
+    assert next_fire(model, at(0, 9, 0)) == at(1, 10, 0)
+    assert next_fire(model, at(1, 10, 0, 59)) == at(1, 10, 0)
+    assert next_fire(model, at(1, 10, 1)) is None
+
+
+def test_today_consumed():
+    model = make_model("10:00:00", "每天")
+    model.is_today_consumed = True
+    assert next_fire(model, at(0, 9, 0)) == at(1, 10, 0)
+
+    model = make_model("10:00:00", "2024-01-01")
+    model.is_today_consumed = True
+    assert next_fire(model, at(0, 9, 0)) is None
+
+
+def test_disabled():
+    assert next_fire(make_model("10:00:00", "每天", enable="0"), at(0, 9, 0)) is None
+
+
+@pytest.mark.parametrize("timeStr, circle", [("10:00:00", "每天"), ("cron[0 10 * * *]", "cron[0 10 * * *]")])
+def test_refresh_in_same_minute_does_not_fire_twice(monkeypatch, timeStr, circle):
+    now = at(0, 10, 0, 5)
+    monkeypatch.setattr(arrow, "now", lambda *args, **kwargs: now)
+    monkeypatch.setattr(TimeTaskTool.time, "time", lambda: now.timestamp())
+    monkeypatch.setattr(TimeTaskTool, "TaskDB", lambda: types.SimpleNamespace(set_meta=lambda key, value: None))
+
+    fired = []
+    manager = TimeTaskTool.TaskManager.__new__(TimeTaskTool.TaskManager)
+    manager.taskHeap = []
+    manager.heapSeq = 0
+    manager.generation = 0
+    manager.lastFireTimes = {}
+    manager.condition = threading.Condition()
+    manager.isRelogin = False
+    manager.debug = False
+    manager.refreshTime = manager.moveHistoryTime = math.inf
+    manager.check_isRelogin = lambda: None
+    manager.runTaskArray = lambda array: fired.extend(array)
+
+    item = make_model(timeStr, circle).get_formatItem()
+    manager.convetDataToModelArray([item])
+    manager.timeCheck()
+    assert [fireTime for _, fireTime in fired] == [int(at(0, 10, 0).timestamp())]
+
+    # 同一分钟内任务列表被刷新(如修改了Excel)，新的任务模型不应再次触发
+    manager.convetDataToModelArray([item])
+    manager.timeCheck()
+    assert len(fired) == 1
+    assert manager.taskHeap[0][0] == int(at(1, 10, 0).timestamp())
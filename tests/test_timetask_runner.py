@@ -0,0 +1,141 @@
+import threading
+import time
+import types
+from datetime import datetime
+
+import arrow
+import pytest
+
+from plugins.plugin_manager import PluginManager
+
+PluginManager().current_plugin_path = "plugins/timetask"
+
+import plugins.timetask.TimeTaskTool as TimeTaskTool  # noqa: E402
+from plugins.timetask.TaskRunner import SendRateLimiter, TaskRunner  # noqa: E402
+from plugins.timetask.Tool import TimeTaskModel  # noqa: E402
+
+
+def job(receiver, taskId):
+    return types.SimpleNamespace(taskId=taskId, other_user_id=receiver, isPerson_makeGrop=lambda: False)
+
+
+def test_same_receiver_runs_in_order_while_others_run_concurrently():
+    release = threading.Event()
+    done = threading.Event()
+    order = []
+    lock = threading.Lock()
+
+    def run(model, dueTime):
+        if model.taskId == "a1":
+            # a1阻塞期间，其他接收者的任务照常执行
+            assert release.wait(5)
+        with lock:
+            order.append(model.taskId)
+            if len(order) == 4:
+                done.set()
+
+    runner = TaskRunner(run, workers=4, send_rate=0)
+    for receiver, taskId in (("a", "a1"), ("a", "a2"), ("b", "b1"), ("a", "a3")):
+        runner.submit(job(receiver, taskId), None)
+
+    deadline = time.monotonic() + 5
+    while "b1" not in order and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert order == ["b1"]
+
+    release.set()
+    assert done.wait(5)
+    assert [taskId for taskId in order if taskId.startswith("a")] == ["a1", "a2", "a3"]
+
+
+def test_worker_count_is_bounded():
+    release = threading.Event()
+    lock = threading.Lock()
+    running = []
+    max_running = [0]
+    finished = threading.Semaphore(0)
+
+    def run(model, dueTime):
+        with lock:
+            running.append(model.taskId)
+            max_running[0] = max(max_running[0], len(running))
+        release.wait(5)
+        with lock:
+            running.remove(model.taskId)
+        finished.release()
+
+    runner = TaskRunner(run, workers=2, send_rate=0)
+    for i in range(5):
+        runner.submit(job("receiver{}".format(i), "t{}".format(i)), None)
+
+    time.sleep(0.2)
+    assert len(running) == 2
+    release.set()
+    for _ in range(5):
+        assert finished.acquire(timeout=5)
+    assert max_running[0] == 2
+
+
+def test_rate_limiter_spaces_sends():
+    rate = 20
+    limiter = SendRateLimiter(rate, burst=1)
+    times = []
+    for _ in range(5):
+        limiter.acquire()
+        times.append(time.monotonic())
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    assert min(gaps) >= 1 / rate * 0.9
+
+
+def test_rate_limiter_disabled():
+    limiter = SendRateLimiter(0)
+    start = time.monotonic()
+    for _ in range(100):
+        limiter.acquire()
+    assert time.monotonic() - start < 0.1
+
+
+NOW = arrow.get(datetime(2024, 1, 1, 11, 0, 0), tzinfo="local")
+DUE = NOW.replace(hour=10)
+
+
+def catch_up(monkeypatch, policy, grace):
+    monkeypatch.setattr(arrow, "now", lambda *args, **kwargs: NOW)
+    monkeypatch.setattr(TimeTaskTool.time, "time", lambda: NOW.timestamp())
+    # 10点的任务触发前停机，11点重启
+    lastAlive = str(NOW.replace(hour=9).timestamp())
+    monkeypatch.setattr(TimeTaskTool, "TaskDB", lambda: types.SimpleNamespace(get_meta=lambda key: lastAlive))
+
+    submitted = []
+    missed = []
+    manager = TimeTaskTool.TaskManager.__new__(TimeTaskTool.TaskManager)
+    manager.conf = {"missed_task_policy": policy, "missed_task_grace": grace}
+    manager.runner = types.SimpleNamespace(submit=lambda model, dueTime: submitted.append((model.taskId, dueTime)), record_missed=missed.append)
+    manager.condition = threading.Condition()
+    manager.taskHeap = []
+    manager.heapSeq = 0
+    manager.generation = 0
+    manager.lastFireTimes = {}
+    manager.expendTaskItem = lambda model: None
+
+    model = TimeTaskModel(["task1", "1", "10:00:00", "每天", "提醒", "u", "uid", "bot", "bid", "nick", "oid", "0", "{}", "0"], None, False)
+    model.generation = 0
+    manager.timeTasks = [model]
+    manager.catchUp_missedTasks()
+    return manager, submitted, missed
+
+
+def test_catch_up_within_grace_submits_once(monkeypatch):
+    manager, submitted, missed = catch_up(monkeypatch, "run_once", 7200)
+    assert submitted == [("task1", int(DUE.timestamp()))]
+    assert missed == [True]
+    # 补发后从下一次触发时间开始调度，不会再次触发
+    assert manager.taskHeap[0][0] == int(DUE.shift(days=1).timestamp())
+
+
+@pytest.mark.parametrize("policy, grace", [("run_once", 1800), ("skip", 7200)])
+def test_catch_up_skips(monkeypatch, policy, grace):
+    manager, submitted, missed = catch_up(monkeypatch, policy, grace)
+    assert submitted == []
+    assert missed == [False]
+    assert manager.taskHeap == []
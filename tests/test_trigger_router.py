@@ -0,0 +1,35 @@
+import types
+
+from config import conf
+from plugins import PluginManager
+from plugins.trigger_router import TriggerRouter
+
+FINISH_TRIGGERS = {"FINISH": {"prefix": ["{trigger_prefix}"]}, "TOOL": {"prefix": ["{trigger_prefix}tool"]}}
+
+
+def test_prefix():
+    router = TriggerRouter(FINISH_TRIGGERS, "$")
+    assert router.match("$tool search") == {"FINISH", "TOOL"}
+    assert router.match("$unknown") == {"FINISH"}
+    assert router.match("hello") == set()
+
+
+def test_empty_prefix_matches_all():
+    router = TriggerRouter(FINISH_TRIGGERS, "")
+    assert router.match("hello") == {"FINISH"}
+    assert router.match("") == {"FINISH"}
+    assert router.match("tool search") == {"FINISH", "TOOL"}
+
+
+def test_router_rebuilt_when_prefix_changes(monkeypatch):
+    pm = PluginManager()
+    monkeypatch.setattr(pm, "plugins", {name: types.SimpleNamespace(triggers=trigger) for name, trigger in FINISH_TRIGGERS.items()})
+    monkeypatch.setattr(pm, "trigger_router", None)
+    monkeypatch.setitem(conf(), "plugin_trigger_prefix", "$")
+    assert pm._get_trigger_router().match("#tool") == set()
+
+    # 重新加载配置后使用新的前缀
+    monkeypatch.setitem(conf(), "plugin_trigger_prefix", "#")
+    assert pm._get_trigger_router().match("#tool") == {"FINISH", "TOOL"}
+    monkeypatch.setitem(conf(), "plugin_trigger_prefix", "")
+    assert pm._get_trigger_router().match("hello") == {"FINISH"}
@@ -88,6 +88,13 @@ def any_to_sil(any_path, sil_path):
     return audio.duration_seconds * 1000
 
 
+def mp3_to_silk(mp3_path, silk_path):
+    """
+    把mp3文件转成silk文件，返回语音时长(毫秒)
+    """
+    return int(any_to_sil(mp3_path, silk_path))
+
+
 def any_to_amr(any_path, amr_path):
     """
     把任意格式转成amr文件
@@ -0,0 +1,166 @@
+"""
+语音合成结果的磁盘缓存
+
+相同的文本(群欢迎语、定时提醒、关键词回复等)不再重复调用语音合成接口:
+- 合成结果按(语音引擎, 音色等参数, 文本)的哈希保存，命中时把缓存文件复制到当前请求的临时目录直接返回
+- 转换后的silk/amr等格式按(源文件内容哈希, 目标格式)保存，命中时跳过格式转换
+- 总大小超过tts_cache_max_size时淘汰最久未使用的文件
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+
+from bridge.reply import Reply, ReplyType
+from common import metrics_server
+from common.log import logger
+from common.singleton import singleton
+from common.tmp_dir import TmpDir
+from config import conf, get_appdata_dir
+
+# 影响合成结果的全局配置
+VOICE_CONF_KEYS = ["text_to_voice_model", "tts_voice_id", "xi_voice_id"]
+INDEX_FILE = "index.json"
+
+
+def _voice_params(voice) -> dict:
+    """语音引擎实例上可序列化的属性(音色、配置等)，作为缓存key的一部分"""
+    params = {}
+    for name, value in vars(voice).items():
+        try:
+            json.dumps(value, sort_keys=True)
+        except (TypeError, ValueError):
+            continue
+        params[name] = value
+    return params
+
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+@singleton
+class VoiceCache:
+    def __init__(self):
+        self.enabled = conf().get("tts_cache", True)
+        self.cache_variants = conf().get("tts_cache_variants", True)
+        self.max_size = conf().get("tts_cache_max_size", 200) * 1024 * 1024
+        self.dir = os.path.join(get_appdata_dir(), "tts_cache")
+        os.makedirs(self.dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> {"file": 文件名, "size": 大小, "result": 转换函数的返回值}，按最近使用排序
+        self.total = 0
+        self.hits = self.misses = 0
+        self._load_index()
+        metrics_server.register("tts_cache", self.stats)
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.dir, INDEX_FILE), "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"[VoiceCache] load index failed, cache will be rebuilt: {e}")
+            return
+        for key, entry in entries:
+            if os.path.isfile(os.path.join(self.dir, entry["file"])):
+                self.entries[key] = entry
+                self.total += entry["size"]
+
+    def _save_index(self):
+        tmp_path = os.path.join(self.dir, INDEX_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(list(self.entries.items()), f)
+        os.replace(tmp_path, os.path.join(self.dir, INDEX_FILE))
+
+    def _get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                path = os.path.join(self.dir, entry["file"])
+                if os.path.isfile(path):
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return path, entry
+                self.entries.pop(key)
+                self.total -= entry["size"]
+            self.misses += 1
+            return None, None
+
+    def _put(self, key, src_path, result=None):
+        ext = os.path.splitext(src_path)[1]
+        file_name = hashlib.sha256(key.encode("utf-8")).hexdigest() + ext
+        dst_path = os.path.join(self.dir, file_name)
+        tmp_path = dst_path + "." + uuid.uuid4().hex
+        shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, dst_path)
+        size = os.path.getsize(dst_path)
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total -= old["size"]
+            self.entries[key] = {"file": file_name, "size": size, "result": result}
+            self.total += size
+            while self.total > self.max_size and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.total -= evicted["size"]
+                try:
+                    os.remove(os.path.join(self.dir, evicted["file"]))
+                except OSError:
+                    pass
+            self._save_index()
+
+    def _handoff(self, path):
+        """把缓存文件复制到临时目录交给调用方，调用方删除或改写时不影响缓存
+        不用硬链接：与缓存共用inode时，调用方或转换函数原地改写文件会破坏缓存"""
+        handoff_path = TmpDir().path() + "reply-" + uuid.uuid4().hex[:16] + os.path.splitext(path)[1]
+        shutil.copyfile(path, handoff_path)
+        return handoff_path
+
+    def text_to_voice(self, engine, voice, text) -> Reply:
+        if not self.enabled:
+            return voice.textToVoice(text)
+        params = {"engine": engine, "voice": _voice_params(voice), "conf": {k: conf().get(k) for k in VOICE_CONF_KEYS}, "text": text}
+        key = "tts:" + hashlib.sha256(json.dumps(params, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+        path, _ = self._get(key)
+        if path:
+            logger.debug(f"[VoiceCache] text_to_voice hit, text={text}")
+            return Reply(ReplyType.VOICE, self._handoff(path))
+        reply = voice.textToVoice(text)
+        if reply and reply.type == ReplyType.VOICE and isinstance(reply.content, str) and os.path.isfile(reply.content):
+            try:
+                self._put(key, reply.content)
+            except Exception as e:
+                logger.warning(f"[VoiceCache] save voice failed: {e}")
+        return reply
+
+    def convert(self, src_path, dst_path, converter):
+        """
+        带缓存的格式转换，相同内容的文件转换为相同格式时直接复制缓存的结果
+        :param converter: 转换函数converter(src_path, dst_path)，返回值(如语音时长)一起缓存
+        """
+        if not self.enabled or not self.cache_variants:
+            return converter(src_path, dst_path)
+        key = "conv:" + _file_digest(src_path) + ":" + os.path.splitext(dst_path)[1]
+        path, entry = self._get(key)
+        if path:
+            shutil.copyfile(path, dst_path)
+            return entry["result"]
+        result = converter(src_path, dst_path)
+        try:
+            self._put(key, dst_path, result)
+        except Exception as e:
+            logger.warning(f"[VoiceCache] save converted voice failed: {e}")
+        return result
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.total, "hits": self.hits, "misses": self.misses}